@@ -30,6 +30,16 @@ MIGRATIONS = [
     ('migrate_phone_warning', 'migrate_database'),
     ('migrate_export_presets', 'migrate'),
     ('migrate_export_presets_status', 'migrate'),
+    ('migrate_import_indexes', 'migrate'),
+    ('migrate_import_jobs', 'migrate'),
+    ('migrate_import_staging', 'migrate'),
+    ('migrate_parse_cache', 'migrate'),
+    ('migrate_mailbox_sync', 'migrate'),
+    ('migrate_listener_status', 'migrate'),
+    ('migrate_message_spool', 'migrate'),
+    ('migrate_fetch_previews', 'migrate'),
+    ('migrate_ingested_messages', 'migrate'),
+    ('migrate_form_review', 'migrate'),
 ]
 
 def run_migrations(db_path):
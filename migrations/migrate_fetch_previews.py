@@ -0,0 +1,32 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the fetch_previews table mapping preview tokens to the previewed email UIDs.
+    """
+    print(f"Running migration: create fetch_previews table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fetch_previews (
+                token TEXT PRIMARY KEY,
+                mailbox TEXT NOT NULL,
+                uids TEXT NOT NULL,
+                created_at TIMESTAMP
+            )
+        ''')
+        print("Table fetch_previews created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
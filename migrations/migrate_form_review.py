@@ -0,0 +1,30 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Adds the form_version and needs_review columns to applicants (emails whose form needs a manual check).
+    """
+    print(f"Running migration: add form_version and needs_review to applicants on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute("PRAGMA table_info(applicants)")
+        columns = [column[1] for column in cursor.fetchall()]
+        if 'form_version' not in columns:
+            cursor.execute('ALTER TABLE applicants ADD COLUMN form_version TEXT')
+        if 'needs_review' not in columns:
+            cursor.execute('ALTER TABLE applicants ADD COLUMN needs_review INTEGER DEFAULT 0')
+        print("Columns form_version and needs_review added successfully.")
+    except Exception as e:
+        print(f"Error adding columns: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
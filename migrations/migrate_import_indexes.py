@@ -0,0 +1,27 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates indexes used by duplicate lookups during import.
+    """
+    print(f"Running migration: create import indexes on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_applicants_email ON applicants (email)')
+        print("Index idx_applicants_email created successfully.")
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_applicants_membership_id ON applicants (membership_id)')
+        print("Index idx_applicants_membership_id created successfully.")
+    except Exception as e:
+        print(f"Error creating index: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
@@ -0,0 +1,42 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the import_jobs table holding chunked CSV import checkpoints.
+    """
+    print(f"Running migration: create import_jobs table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_hash TEXT NOT NULL,
+                user TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'running',
+                total_rows INTEGER,
+                last_row INTEGER NOT NULL DEFAULT -1,
+                imported_count INTEGER NOT NULL DEFAULT 0,
+                error_count INTEGER NOT NULL DEFAULT 0,
+                report_path TEXT,
+                run_started_at REAL,
+                run_start_row INTEGER NOT NULL DEFAULT -1,
+                updated_at REAL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_file_hash ON import_jobs (file_hash)')
+        print("Table import_jobs created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
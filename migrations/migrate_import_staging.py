@@ -0,0 +1,55 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the import_staged_rows table used by the CSV import preview.
+    """
+    print(f"Running migration: create import_staged_rows table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS import_staged_rows (
+                job_id INTEGER NOT NULL,
+                row_no INTEGER NOT NULL,
+                first_name TEXT,
+                last_name TEXT,
+                email TEXT,
+                phone TEXT,
+                dob TEXT,
+                membership_id TEXT,
+                city TEXT,
+                school TEXT,
+                interests TEXT,
+                character TEXT,
+                frequency TEXT,
+                source TEXT,
+                source_detail TEXT,
+                message TEXT,
+                color TEXT,
+                newsletter INTEGER,
+                guessed_gender TEXT,
+                full_body TEXT,
+                is_first INTEGER,
+                match_id INTEGER,
+                action TEXT,
+                error TEXT,
+                PRIMARY KEY (job_id, row_no),
+                FOREIGN KEY (job_id) REFERENCES import_jobs (id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_staged_rows_email ON import_staged_rows (job_id, email)')
+        print("Table import_staged_rows created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
@@ -0,0 +1,38 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the ingested_messages table recording which emails were imported as which applicant.
+    """
+    print(f"Running migration: create ingested_messages table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ingested_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT,
+                body_hash TEXT NOT NULL,
+                applicant_id INTEGER,
+                ingested_at TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_ingested_messages_message_id
+            ON ingested_messages (message_id) WHERE message_id IS NOT NULL
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingested_messages_body_hash ON ingested_messages (body_hash)')
+        print("Table ingested_messages created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
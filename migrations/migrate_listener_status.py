@@ -0,0 +1,35 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the listener_status table holding the IMAP IDLE listener heartbeat.
+    """
+    print(f"Running migration: create listener_status table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS listener_status (
+                name TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                detail TEXT,
+                heartbeat_at TIMESTAMP,
+                last_ingest_at TIMESTAMP,
+                ingested_total INTEGER DEFAULT 0,
+                failures INTEGER DEFAULT 0
+            )
+        ''')
+        print("Table listener_status created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
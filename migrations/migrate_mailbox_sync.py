@@ -0,0 +1,32 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the mailbox_sync table holding the IMAP UID checkpoint per mailbox.
+    """
+    print(f"Running migration: create mailbox_sync table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS mailbox_sync (
+                mailbox TEXT PRIMARY KEY,
+                uid_validity INTEGER NOT NULL,
+                last_uid INTEGER NOT NULL,
+                updated_at TIMESTAMP
+            )
+        ''')
+        print("Table mailbox_sync created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
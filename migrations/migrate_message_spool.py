@@ -0,0 +1,43 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the spool_blobs and message_spool tables holding fetched emails between preview and confirm.
+    """
+    print(f"Running migration: create message spool tables on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS spool_blobs (
+                body_hash TEXT PRIMARY KEY,
+                body BLOB NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS message_spool (
+                mailbox TEXT NOT NULL,
+                uid TEXT NOT NULL,
+                uid_validity INTEGER,
+                message_id TEXT,
+                date TEXT,
+                body_hash TEXT NOT NULL,
+                spooled_at TIMESTAMP,
+                PRIMARY KEY (mailbox, uid)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_spool_body_hash ON message_spool (body_hash)')
+        print("Tables spool_blobs and message_spool created successfully.")
+    except Exception as e:
+        print(f"Error creating tables: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
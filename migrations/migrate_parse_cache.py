@@ -0,0 +1,34 @@
+import sqlite3
+import os
+
+def migrate(db_path):
+    """
+    Creates the parse_cache table used to skip re-parsing known email bodies.
+    """
+    print(f"Running migration: create parse_cache table on {db_path}")
+    conn = sqlite3.connect(db_path)
+    cursor = conn.cursor()
+    
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS parse_cache (
+                body_hash TEXT NOT NULL,
+                parser_version TEXT NOT NULL,
+                result TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (body_hash, parser_version)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache (last_used)')
+        print("Table parse_cache created successfully.")
+    except Exception as e:
+        print(f"Error creating table: {e}")
+        
+    conn.commit()
+    conn.close()
+
+if __name__ == "__main__":
+    # Default to test DB if run directly
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, 'applications_test.db')
+    migrate(db_path)
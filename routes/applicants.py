@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, send_file, make_response
+from flask import Blueprint, render_template, request, session, redirect, url_for, jsonify, send_file, make_response, current_app, Response, stream_with_context
 from src.database import get_db_connection, log_action, get_db_path
 from src.validator import is_valid_email, is_valid_phone, is_suspect_parent_email, check_duplicate_contact
 from src.parser import normalize_phone, normalize_school, calculate_age
@@ -40,6 +40,7 @@ def get_filtered_applicants(request_args):
     filter_alerts = request_args.get('alerts', '')
     filter_character = request_args.get('character', '')
     filter_guessed_gender = request_args.get('guessed_gender', '')
+    filter_needs_review = request_args.get('needs_review', '')
     sort_by = request_args.get('sort', 'id')
     sort_order = request_args.get('order', 'desc')
     
@@ -79,6 +80,10 @@ def get_filtered_applicants(request_args):
         query += " AND interests LIKE ?"
         params.append(f"%{filter_interest}%")
 
+    if filter_needs_review == 'true':
+        # Applicants created from an email with an unknown form or missing required questions
+        query += " AND needs_review = 1"
+
     cursor = conn.execute(query, params)
     all_applicants = [dict(row) for row in cursor.fetchall()]
     conn.close()
@@ -129,6 +134,7 @@ def get_filtered_applicants(request_args):
                      has_alert = True
             
             # Check validity
+            if app.get('needs_review'): has_alert = True
             if not is_valid_email(app.get('email', '')): has_alert = True
             if not is_valid_phone(app.get('phone', '')) and not app.get('phone_warning_dismissed'): has_alert = True
             
@@ -950,151 +956,252 @@ def export_excel():
     )
 
 # Fetch Logic
+def _existing_membership_ids(conn):
+    """Membership IDs of active applicants (ignoring deleted and empty ones)"""
+    return {str(row['membership_id']) for row in conn.execute("SELECT membership_id FROM applicants WHERE deleted = 0 AND membership_id IS NOT NULL AND membership_id != ''").fetchall()}
+
+def _annotate_preview(parsed, email_uid, date, existing_ids, counts):
+    """Add preview fields to a parsed email and update the running counts"""
+    counts['total'] += 1
+    parsed['email_uid'] = email_uid
+    parsed['date'] = date
+    
+    # Check duplicate by Membership ID
+    mem_id = parsed.get('membership_id')
+    if mem_id and str(mem_id) in existing_ids:
+        counts['duplicates'] += 1
+        parsed['is_duplicate'] = True
+    else:
+        counts['new'] += 1
+        parsed['is_duplicate'] = False
+    
+    # Unknown form layout: fields may be missing, ask for a manual check
+    if parsed.get('needs_review'):
+        counts['needs_review'] += 1
+    return parsed
+
 @applicants_bp.route('/fetch/preview', methods=['POST'])
 @login_required
 def fetch_preview():
-    """Fetch unread emails preview"""
-    import os
-    username = os.getenv('EMAIL_USER')
-    password = os.getenv('EMAIL_PASS')
-    server = os.getenv('IMAP_SERVER', 'imap.gmail.com')
+    """Fetch unread emails preview from all mailbox sources"""
+    from src.fetcher import session_pool
+    from src.parse_cache import parse_email_bodies_cached
+    from src.mailbox_sync import load_checkpoint
+    from src.mailbox_sources import load_sources, sources_key, fetch_sources, merge_fetched, describe_error
+    from src.spool import spool_emails, create_preview
     
-    if not username or not password:
+    sources = load_sources()
+    if not sources:
          return jsonify({'error': 'Email credentials not configured'}), 500
-         
-    from src.fetcher import get_unread_emails
-    from src.parser import parse_email_body
     
     try:
-        raw_emails = get_unread_emails(username, password, server, mark_as_read=False)
-        previews = []
-        
-        session['fetched_emails'] = []
+        conn = get_db_connection()
+        checkpoints = {source.key: load_checkpoint(conn, source.key) for source in sources}
+        conn.close()
         
-        total_count = 0
-        new_count = 0
-        duplicates_count = 0
+        # Every source is fetched in its own worker; a failed one is reported next to the others' emails
+        fetched, failed = fetch_sources(sources, checkpoints,
+                                        connections=current_app.config.get('EMAIL_FETCH_CONNECTIONS', 1),
+                                        pool=session_pool,
+                                        timeout=current_app.config.get('EMAIL_SOURCE_TIMEOUT', 120))
+        errors = [describe_error(source, failed[source.key], sources) for source in sources if source.key in failed]
+        if len(failed) == len(sources):
+            return jsonify({'error': '; '.join(errors)}), 500
+        raw_emails = merge_fetched(fetched)
+        counts = {'total': 0, 'new': 0, 'duplicates': 0, 'needs_review': 0}
         
         conn = get_db_connection()
-        # Fetch existing membership IDs (ignoring deleted and empty ones)
-        existing_ids = {str(row['membership_id']) for row in conn.execute("SELECT membership_id FROM applicants WHERE deleted = 0 AND membership_id IS NOT NULL AND membership_id != ''").fetchall()}
+        # Confirm imports from the local spool; the session only keeps the preview token
+        spooled = {key: spool_emails(conn, key, emails) for key, emails in fetched.items()}
+        session['fetch_preview'] = create_preview(conn, sources_key(sources), spooled)
+        # Parse results are cached by body hash, so confirm does not parse the same emails again
+        parsed_emails = parse_email_bodies_cached(conn, [raw[1] for raw in raw_emails],
+                                                  workers=current_app.config.get('EMAIL_PARSE_WORKERS', 1))
+        existing_ids = _existing_membership_ids(conn)
         conn.close()
         
-        for email_uid, body, date in raw_emails:
-            total_count += 1
-            parsed = parse_email_body(body)
-            parsed['email_uid'] = email_uid
-            parsed['date'] = date
-            
-            # Check duplicate by Membership ID
-            mem_id = parsed.get('membership_id')
-            if mem_id and str(mem_id) in existing_ids:
-                duplicates_count += 1
-                parsed['is_duplicate'] = True
-            else:
-                new_count += 1
-                parsed['is_duplicate'] = False
-                
-            previews.append(parsed)
-            # Store simple dict in session
-            session['fetched_emails'].append({'uid': email_uid, 'body': body, 'date': date})
-            
-        return jsonify({
-            'emails': previews,
-            'total': total_count,
-            'new': new_count,
-            'duplicates': duplicates_count
-        })
+        previews = [_annotate_preview(parsed, email_uid, date, existing_ids, counts)
+                    for (email_uid, _, date, *_), parsed in zip(raw_emails, parsed_emails)]
+        
+        result = {'emails': previews, **counts}
+        if errors:
+            result['errors'] = errors
+        return jsonify(result)
     except Exception as e:
         logger.error(f"Fetch error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@applicants_bp.route('/fetch/stream')
+@login_required
+def fetch_stream():
+    """
+    Fetch preview as server-sent events.
+    
+    Emits an 'email' event per parsed email (with the running counts) as
+    the body batches of the mailbox sources arrive, then 'done' with the
+    final counts, the preview token and the errors of failed sources, or
+    'error' when no source could be fetched. Emails are spooled batch by
+    batch; since the session cookie cannot change once streaming started,
+    the page sends the token back to /fetch/confirm.
+    """
+    from src.fetcher import session_pool, STREAM_FIRST_BATCH_SIZE
+    from src.parse_cache import parse_email_bodies_cached
+    from src.mailbox_sync import load_checkpoint
+    from src.mailbox_sources import load_sources, sources_key, iter_source_batches, message_key, describe_error
+    from src.spool import spool_emails, create_preview
+    
+    sources = load_sources()
+    if not sources:
+         return jsonify({'error': 'Email credentials not configured'}), 500
+    
+    workers = current_app.config.get('EMAIL_PARSE_WORKERS', 1)
+    connections = current_app.config.get('EMAIL_FETCH_CONNECTIONS', 1)
+    timeout = current_app.config.get('EMAIL_SOURCE_TIMEOUT', 120)
+    
+    def event(name, data):
+        return f"event: {name}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+    
+    def events():
+        conn = get_db_connection()
+        batches = None
+        try:
+            counts = {'total': 0, 'new': 0, 'duplicates': 0, 'needs_review': 0}
+            previewed = {}
+            shown = set()
+            errors = []
+            existing_ids = _existing_membership_ids(conn)
+            checkpoints = {source.key: load_checkpoint(conn, source.key) for source in sources}
+            batches = iter_source_batches(sources, checkpoints, first_batch_size=STREAM_FIRST_BATCH_SIZE,
+                                          connections=connections, pool=session_pool, timeout=timeout)
+            for source, batch, error in batches:
+                if error:
+                    errors.append(describe_error(source, error, sources))
+                    continue
+                previewed.setdefault(source.key, []).extend(spool_emails(conn, source.key, batch))
+                # An application that reached several mailboxes is shown once
+                batch = [fetched for fetched in batch if message_key(fetched) not in shown]
+                shown.update(message_key(fetched) for fetched in batch)
+                parsed_batch = parse_email_bodies_cached(conn, [raw[1] for raw in batch], workers=workers)
+                for fetched, parsed in zip(batch, parsed_batch):
+                    parsed = _annotate_preview(parsed, fetched.uid, fetched.date, existing_ids, counts)
+                    yield event('email', {'email': parsed, **counts})
+            if len(errors) == len(sources):
+                yield event('error', {'error': '; '.join(errors)})
+                return
+            done = {**counts, 'token': create_preview(conn, sources_key(sources), previewed)}
+            if errors:
+                done['errors'] = errors
+            yield event('done', done)
+        except Exception as e:
+            logger.error(f"Fetch stream error: {e}")
+            yield event('error', {'error': str(e)})
+        finally:
+            # Also runs when the client disconnects: stops the mailbox fetch threads
+            if batches is not None:
+                batches.close()
+            conn.close()
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @applicants_bp.route('/fetch/confirm', methods=['POST'])
 @login_required
 def fetch_confirm():
     """Confirm and save fetched emails"""
-    import os
-    username = os.getenv('EMAIL_USER')
-    password = os.getenv('EMAIL_PASS')
-    server = os.getenv('IMAP_SERVER', 'imap.gmail.com')
+    from src.fetcher import mark_seen, session_pool
+    from src.mailbox_sync import load_checkpoint
+    from src.mailbox_sources import load_sources, fetch_sources, ingest_sources, run_per_source, describe_error
+    from src.spool import load_spooled, release, load_preview, drop_preview
     
-    from src.fetcher import get_unread_emails
-    from src.parser import parse_email_body
+    sources = load_sources()
     
     try:
         # Determine mode
         mode = session.get('mode', 'test')
         should_mark_read = (mode == 'production')
+        timeout = current_app.config.get('EMAIL_SOURCE_TIMEOUT', 120)
         
-        # We process from session cache or re-fetch (marking read this time)
-        # Using cache allows us to process exactly what was previewed, but we must mark them read on server eventually.
-        # Ideally, we call get_unread_emails(..., mark_as_read=True) to commit.
-        
-        raw_emails = get_unread_emails(username, password, server, mark_as_read=should_mark_read)
-        count = 0
-        errors = []
+        # We process exactly what was previewed from the local spool and only flag it read on the server.
+        # Without a preview (or once the spool expired) we re-fetch. Either way \Seen is set after the
+        # import, so a source that times out mid-fetch never flags emails that were not imported.
         conn = get_db_connection()
-        
-        for email_uid, body, date in raw_emails:
-            parsed = parse_email_body(body)
-            email_addr = parsed.get('email', 'Unknown')
-            
-            # Check for existing Membership ID (ignore deleted)
-            mem_id = parsed.get('membership_id')
-            
-            if not mem_id:
-                errors.append(f"Email {email_addr}: Chybí členské číslo. Nelze vytvořit přihlášku.")
-                continue
-            
-            if mem_id:
-                # Check including deleted
-                existing = conn.execute('SELECT id, deleted FROM applicants WHERE membership_id = ?', (mem_id,)).fetchone()
-                
-                if not existing:
-                     # Check by email/name unique constraint to avoid crash
-                     existing = conn.execute('SELECT id, deleted FROM applicants WHERE email = ? AND first_name = ? AND last_name = ?', 
-                                           (email_addr, parsed.get('first_name'), parsed.get('last_name'))).fetchone()
-                
-                if existing:
-                    if existing['deleted']:
-                        # Restore
-                        conn.execute('UPDATE applicants SET deleted = 0 WHERE id = ?', (existing['id'],))
-                        log_action(existing['id'], "Obnoveno z emailu", session.get('user', {}).get('email'), connection=conn)
-                        count += 1
-                    else:
-                        # Log duplicate skip
-                        # We log this so it appears in the audit trail that an attempt was made
-                        log_action(existing['id'], "Pokus o import z emailu (duplicita)", session.get('user', {}).get('email'), connection=conn)
-                    continue
-                
-            parsed['status'] = 'Nová'
-            parsed['application_received'] = datetime.now()
-            
-            keys = [k for k in parsed.keys() if k != 'full_body' and k in [
-                'first_name', 'last_name', 'email', 'phone', 'dob', 'city', 'school', 
-                'interests', 'character', 'status', 'newsletter', 'source', 
-                'source_detail', 'message', 'color', 'guessed_gender', 'membership_id',
-                'application_received'
-            ]]
-            
-            placeholders = ', '.join(['?' for _ in keys])
-            cols = ', '.join(keys)
-            vals = [parsed[k] for k in keys]
-            
-            cursor = conn.execute(f'INSERT INTO applicants ({cols}) VALUES ({placeholders})', vals)
-            new_id = cursor.lastrowid
-            
-            log_action(new_id, "Vytvořeno z emailu", session.get('user', {}).get('email'), connection=conn)
-            count += 1
-            
+        # The streaming preview sends its token in the request body, the JSON preview keeps it in the session
+        payload = request.get_json(silent=True) or {}
+        token = payload.get('token') or session.get('fetch_preview')
+        spooled = load_preview(conn, token) if isinstance(token, str) else None
+        fetched = {}
+        for key, uids in (spooled or {}).items():
+            fetched[key] = load_spooled(conn, key, uids)
+            if fetched[key] is None:
+                spooled = None
+                break
+        errors = []
+        if not spooled:
+            spooled = None
+            if not sources:
+                conn.close()
+                return jsonify({'error': 'Email credentials not configured'}), 500
+            checkpoints = {source.key: load_checkpoint(conn, source.key) for source in sources}
+            fetched, failed = fetch_sources(sources, checkpoints,
+                                            connections=current_app.config.get('EMAIL_FETCH_CONNECTIONS', 1),
+                                            pool=session_pool, timeout=timeout)
+            errors = [describe_error(source, failed[source.key], sources) for source in sources if source.key in failed]
+            if len(failed) == len(sources):
+                conn.close()
+                return jsonify({'error': '; '.join(errors)}), 500
+        count, ingest_errors = ingest_sources(conn, fetched, session.get('user', {}).get('email'),
+                                              workers=current_app.config.get('EMAIL_PARSE_WORKERS', 1))
+        errors += ingest_errors
+        for key, uids in (spooled or {}).items():
+            release(conn, key, uids)
+        if isinstance(token, str):
+            drop_preview(conn, token)
         conn.commit()
         conn.close()
         
-        session.pop('fetched_emails', None)
+        if should_mark_read:
+            # One UID STORE per mailbox for the imported emails instead of flagging them while downloading
+            def mark(source):
+                emails = fetched.get(source.key)
+                if not emails:
+                    return True
+                uids = [int(fetched_email[0]) for fetched_email in emails if str(fetched_email[0]).isdigit()]
+                return mark_seen(source.username, source.password, source.server, uids,
+                                 getattr(emails[0], 'uid_validity', None), pool=session_pool)
+            marked, failed = run_per_source(sources, mark, timeout)
+            # Spooled emails of a mailbox that is no longer configured cannot be flagged
+            unmarked = set(fetched) - {source.key for source in sources}
+            if failed or unmarked or not all(marked.values()):
+                errors.append("Emaily se nepodařilo označit jako přečtené.")
+        
+        session.pop('fetch_preview', None)
         return jsonify({'success': True, 'count': count, 'errors': errors})
         
     except Exception as e:
         logger.error(f"Fetch confirm error: {e}")
         return jsonify({'error': str(e)}), 500
 
+@applicants_bp.route('/fetch/sources')
+@login_required
+def fetch_sources_status():
+    """Configured mailbox sources with their fetch throughput and error counters"""
+    from src.mailbox_sources import load_sources, source_metrics
+    
+    metrics = {entry['mailbox']: entry for entry in source_metrics.snapshot()}
+    return jsonify({'sources': [metrics.get(source.key, {'name': source.name, 'mailbox': source.key,
+                                                          'fetches': 0, 'messages': 0, 'errors': 0})
+                                for source in load_sources()]})
 
+@applicants_bp.route('/fetch/listener')
+@login_required
+def fetch_listener_status():
+    """Health of the IMAP IDLE listener writing into the current mode's database"""
+    from src.idle_listener import read_status
+    
+    conn = get_db_connection()
+    status = read_status(conn, current_app.config.get('IMAP_IDLE_TIMEOUT', 9 * 60))
+    conn.close()
+    
+    if status is None:
+        return jsonify({'state': 'off'})
+    return jsonify(status)
@@ -1,13 +1,12 @@
-from flask import Blueprint, render_template, request, session, redirect, url_for, current_app, jsonify
-from src.database import get_db_connection, log_action, get_db_path, init_db
+from flask import Blueprint, render_template, request, session, redirect, url_for, current_app, jsonify, send_file
+from src.database import get_db_connection, get_db_path, init_db
 from src.ecomail import EcomailClient
 from src.email_sender import load_welcome_email_template
-from src.parser import datetime_cz, parse_csv_row
+from src.parser import datetime_cz
+from src.importer import (save_upload, stage_import, get_staged_counts, get_staged_page, find_unfinished_job,
+                          run_import_job, get_job_progress, ImportTooLargeError, DEFAULT_CHUNK_SIZE)
 from src.changelog import get_changelog
-from datetime import datetime
 import logging
-import csv
-import io
 import os
 
 settings_bp = Blueprint('settings', __name__)
@@ -198,7 +197,7 @@ def clear_database():
 @settings_bp.route('/import/preview', methods=['POST'])
 @login_required
 def import_preview():
-    """Preview CSV import"""
+    """Preview CSV or XLSX import"""
     if 'csv_file' not in request.files:
         return jsonify({'error': 'No file'}), 400
         
@@ -206,108 +205,128 @@ def import_preview():
     if not file:
         return jsonify({'error': 'Empty file'}), 400
     
+    # CSV and XLSX uploads share the pipeline; the format is detected from the file content
+    extension = '.xlsx' if (file.filename or '').lower().endswith('.xlsx') else '.csv'
+    path = f"/tmp/import_{session['user'].get('email')}{extension}"
+    try:
+        # Copy upload to disk in chunks; it is parsed once into the staging table
+        save_upload(file.stream, path, current_app.config.get('MAX_IMPORT_SIZE'))
+    except ImportTooLargeError as e:
+        return jsonify({'error': str(e)}), 413
+    
+    user_email = session.get('user', {}).get('email') or 'unknown_import'
     try:
-        stream = io.StringIO(file.stream.read().decode("utf-8-sig"), newline=None)
-        csv_input = csv.DictReader(stream)
-        
-        # Count rows and check duplicates
-        total = 0
-        new_count = 0
-        duplicates_count = 0
-        
         conn = get_db_connection()
-        existing_emails = set(row['email'] for row in conn.execute('SELECT email FROM applicants').fetchall())
-        conn.close()
+        try:
+            job = stage_import(conn, path, user_email, workers=current_app.config.get('IMPORT_WORKERS', 1),
+                               aliases=current_app.config.get('IMPORT_HEADER_ALIASES'))
+            stats = get_staged_counts(conn, job['id'])
+        finally:
+            conn.close()
         
-        for row in csv_input:
-            total += 1
-            email = row.get('email', '').strip()
-            if email in existing_emails:
-                duplicates_count += 1
-            else:
-                new_count += 1
-                
-        # Save file to temp for confirmation step
-        session['import_file_path'] = f"/tmp/import_{session['user'].get('email')}.csv"
-        
-        # Reset stream
-        file.stream.seek(0)
-        file.save(session['import_file_path'])
-            
-        return jsonify({
-            'total': total,
-            'new': new_count,
-            'duplicates': duplicates_count
-        })
+        # The upload is kept until confirm: if the staged job is gone by then (discarded as stale),
+        # confirm stages the file again or resumes an interrupted job for it by file hash
+        session['import_job_id'] = job['id']
+        session['import_file_path'] = path
+        return jsonify(stats)
         
     except Exception as e:
+        if os.path.exists(path):
+            os.remove(path)
+        session.pop('import_file_path', None)
         return jsonify({'error': str(e)}), 500
 
+@settings_bp.route('/import/preview/rows')
+@login_required
+def import_preview_rows():
+    """Paginated rows of the staged CSV import"""
+    job_id = session.get('import_job_id')
+    if not job_id:
+        return jsonify({'error': 'No staged import'}), 404
+    
+    page = request.args.get('page', 1, type=int)
+    conn = get_db_connection()
+    result = get_staged_page(conn, job_id, page)
+    conn.close()
+    return jsonify(result)
+
 @settings_bp.route('/import/confirm', methods=['POST'])
 @login_required
 def import_confirm():
-    """Execute CSV import"""
+    """Execute CSV or XLSX import"""
+    job_id = session.get('import_job_id')
     path = session.get('import_file_path')
-    
-    if not path or not os.path.exists(path):
-        return jsonify({'error': 'File expired'}), 400
-        
-    count = 0
+    user_email = session.get('user', {}).get('email') or 'unknown_import'
+    chunk_size = current_app.config.get('IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
     conn = get_db_connection()
     
     try:
-        with open(path, 'r', encoding='utf-8-sig') as f:
-            csv_input = csv.DictReader(f)
-            for row in csv_input:
-                # Check duplicate again
-                email = row.get('email', '').strip()
-                
-                curr = conn.execute('SELECT id, deleted FROM applicants WHERE email = ?', (email,)).fetchone()
-                
-                if curr:
-                    if curr['deleted']:
-                        # Restore
-                        conn.execute('UPDATE applicants SET deleted = 0 WHERE id = ?', (curr['id'],))
-                        user_email = session.get('user', {}).get('email', 'unknown_import')
-                        log_action(curr['id'], "Obnoveno importem", user_email, connection=conn)
-                        count += 1
-                    else:
-                        # Log duplicate attempt even if active (per user feedback "missing log")
-                        # This ensures the user sees that the import touched this record.
-                        user_email = session.get('user', {}).get('email', 'unknown_import')
-                        log_action(curr['id'], "Pokus o import (duplicita)", user_email, connection=conn)
-                    continue
-                    
-                # Parse and Insert
-                data = parse_csv_row(row)
-                data['status'] = 'Nová'
-                data['application_received'] = datetime.now()
-                
-                # Insert logic...
-                keys = list(data.keys())
-                placeholders = ', '.join(['?' for _ in keys])
-                cols = ', '.join(keys)
-                vals = [data[k] for k in keys]
-                
-                cursor = conn.execute(f'INSERT INTO applicants ({cols}) VALUES ({placeholders})', vals)
-                new_id = cursor.lastrowid
-                
-                user_email = session.get('user', {}).get('email', 'unknown_import')
-                log_action(new_id, "Vytvořeno importem", user_email, connection=conn)
-                count += 1
-                
-        conn.commit()
+        job = None
+        if job_id:
+            job = conn.execute(
+                "SELECT * FROM import_jobs WHERE id = ? AND user = ? AND status IN ('staged', 'running')",
+                (job_id, user_email)
+            ).fetchone()
+        if not job:
+            # No staged preview: stage the saved file now (or resume an interrupted job for it)
+            if not path or not os.path.exists(path):
+                return jsonify({'error': 'File expired'}), 400
+            job = find_unfinished_job(conn, path, user_email) or stage_import(
+                conn, path, user_email, workers=current_app.config.get('IMPORT_WORKERS', 1),
+                aliases=current_app.config.get('IMPORT_HEADER_ALIASES'))
+        
+        # Chunks are committed with a checkpoint; a failed run resumes on the next confirm
+        job = run_import_job(conn, job['id'], user_email, chunk_size=chunk_size)
     except Exception as e:
         conn.rollback()
+        logger.error(f"CSV import failed: {e}")
         return jsonify({'error': str(e)}), 500
     finally:
         conn.close()
-        # os.remove(path) # Keep file for potential debug? No, standard logic.
-        if os.path.exists(path):
-            os.remove(path)
-        session.pop('import_file_path', None)
+    
+    if path and os.path.exists(path):
+        os.remove(path)
+    session.pop('import_file_path', None)
+    session.pop('import_job_id', None)
         
-    return jsonify({'success': True, 'count': count})
+    return jsonify({
+        'success': True,
+        'count': job['imported_count'],
+        'job_id': job['id'],
+        'error_count': job['error_count'],
+        'report_url': url_for('settings.import_report', job_id=job['id']) if job['error_count'] else None
+    })
+
+@settings_bp.route('/import/progress')
+@login_required
+def import_progress():
+    """Progress of the current user's latest CSV import"""
+    user_email = session.get('user', {}).get('email') or 'unknown_import'
+    conn = get_db_connection()
+    job = conn.execute(
+        'SELECT * FROM import_jobs WHERE user = ? ORDER BY id DESC LIMIT 1', (user_email,)
+    ).fetchone()
+    conn.close()
+    
+    if not job:
+        return jsonify({'error': 'No import job'}), 404
+    return jsonify(get_job_progress(job))
+
+@settings_bp.route('/import/report/<int:job_id>')
+@login_required
+def import_report(job_id):
+    """Download the per-row error report of one of the current user's import jobs"""
+    user_email = session.get('user', {}).get('email') or 'unknown_import'
+    conn = get_db_connection()
+    job = conn.execute(
+        'SELECT report_path FROM import_jobs WHERE id = ? AND user = ?', (job_id, user_email)
+    ).fetchone()
+    conn.close()
+    
+    if not job or not job['report_path'] or not os.path.exists(job['report_path']):
+        return jsonify({'error': 'Report not found'}), 404
+    return send_file(job['report_path'], mimetype='text/csv', as_attachment=True,
+                     download_name=f'import_{job_id}_chyby.csv')
 
 @settings_bp.route('/ecomail/create_list', methods=['POST'])
 @login_required
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Import application emails from mbox exports, Maildir folders or .eml files.
+
+For migrations and recovery: reads the archives with the mailbox module,
+extracts the bodies like the IMAP fetch and imports them through the
+same duplicate checks. Messages already imported (by Message-ID, or by
+body when there is none) are skipped, so the command can be re-run or
+resumed after an interruption.
+
+Usage:
+    python3 scripts/backfill_emails.py ARCHIVE [ARCHIVE ...] [--mode test|production]
+                                       [--workers 4] [--batch-size 5000]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import init_db, DB_PATH_PROD, DB_PATH_TEST
+from src.backfill import backfill, BACKFILL_BATCH_SIZE
+
+
+def print_progress(stats):
+    rate = stats['messages'] / stats['seconds'] if stats['seconds'] else 0
+    print(f"{stats['messages']:>9} messages read  {stats['applications']:>9} applications  "
+          f"{stats['skipped']:>9} imported before  {stats['imported']:>9} imported  {rate:>7.0f} msg/s",
+          file=sys.stderr, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('archives', nargs='+', help='mbox file, Maildir folder, .eml file or folder of .eml files')
+    parser.add_argument('--mode', choices=['test', 'production'], default='test', help='database to import into')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parse worker processes')
+    parser.add_argument('--batch-size', type=int, default=BACKFILL_BATCH_SIZE, help='messages committed together')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    missing = [path for path in args.archives if not os.path.exists(path)]
+    if missing:
+        sys.exit(f"Not found: {', '.join(missing)}")
+
+    db_path = DB_PATH_PROD if args.mode == 'production' else DB_PATH_TEST
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        stats = backfill(conn, args.archives, workers=args.workers, batch_size=args.batch_size,
+                         progress=print_progress)
+    except KeyboardInterrupt:
+        sys.exit("Interrupted; the batches imported so far are kept, re-run to continue")
+    finally:
+        conn.close()
+
+    for error in stats['errors']:
+        print(error)
+    print(f"{stats['messages']} messages, {stats['applications']} applications "
+          f"({stats['skipped']} imported before), {stats['imported']} imported into {os.path.basename(db_path)} "
+          f"in {stats['seconds']:.1f} s ({len(stats['errors'])} messages to check)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark the compiled CSV header extractor against parse_csv_row.
+
+Both variants parse the same in-memory CSV: parse_csv_row on DictReader
+dictionaries, compile_csv_header on csv.reader lists.
+
+Usage:
+    python3 scripts/benchmark_csv_header.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.parser import parse_csv_row, compile_csv_header
+from scripts.benchmark_import import write_csv
+
+
+def bench_dict_reader(text):
+    start = time.perf_counter()
+    rows = [parse_csv_row(row) for row in csv.DictReader(io.StringIO(text, newline=''), restval='')]
+    return rows, time.perf_counter() - start
+
+
+def bench_compiled(text):
+    start = time.perf_counter()
+    reader = csv.reader(io.StringIO(text, newline=''))
+    extract = compile_csv_header(next(reader))
+    rows = [extract(values) for values in reader if values]
+    return rows, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.gettempdir(), 'benchmark_csv_header.csv')
+    write_csv(path, args.rows)
+    with open(path, encoding='utf-8', newline='') as f:
+        text = f.read()
+    os.remove(path)
+
+    legacy_rows, _ = bench_dict_reader(text)
+    compiled_rows, _ = bench_compiled(text)
+    assert legacy_rows == compiled_rows, "extractor output differs from parse_csv_row"
+
+    legacy = min(bench_dict_reader(text)[1] for _ in range(args.repeat))
+    compiled = min(bench_compiled(text)[1] for _ in range(args.repeat))
+    print(f"{args.rows} rows (best of {args.repeat})")
+    print(f"{'DictReader + parse_csv_row':<30} {args.rows / legacy:>12,.0f} rows/s")
+    print(f"{'csv.reader + compiled header':<30} {args.rows / compiled:>12,.0f} rows/s")
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark parse_email_body against the previous per-field regex parser.
+
+Builds a corpus of synthetic application emails (wording variant, field
+order, casing, line endings and missing answers vary), checks that both
+parsers return identical fields and reports bodies/s for each, plus parse_email_bodies
+with a process pool for each --workers value.
+
+Usage:
+    python3 scripts/benchmark_email_parser.py [--bodies 100000] [--repeat 3] [--workers 2 4]
+"""
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.gender_utils import guess_gender
+from src.parser import parse_email_body, parse_email_bodies
+
+QUESTIONS = [
+    ('Jak se jmenuješ?', ['Barbora', 'Jan', 'Tereza', 'Honza', '']),
+    ('Jaké je tvé příjmení?', ['Smékalová', 'Novák', 'Dvořáková']),
+    ('Kam ti můžeme poslat e-mail? (lepší osobní než studentský)', ['barus@outlook.cz', 'jan@example.com']),
+    ('Na jaké číslo ti můžeme zavolat?', ['+420777603960', '']),
+    (('Kdy ses narodil?', 'Kdy ses narodil/a?'), ['14/05/2000', '01.01.2001']),
+    ('Odkud pocházíš?', ['Ostrava', 'Praha']),
+    ('Kam chodíš do školy? ', ['OSU', 'VŠB-TUO']),
+    ('Co tě nejvíc zajímá? ', ['Divadlo, Hudba', 'Film']),
+    ('Jsi ...', ['Něco mezi', 'Introvert']),
+    ('Jak často během roku chceš navštěvovat doprovodný program Mladého diváka?', ['3', '5']),
+    (('Odkud ses o nás dozvěděl?', 'Odkud ses o nás dozvěděl/a?'), ['Ve škole', 'Instagram']),
+    (('Odkud?', 'Jinde?'), ['', 'Z plakátu']),
+    ('Chceš nám něco říct?', ['', 'Ahoj: těším se', 'Jak se jmenuješ?: to je otázka']),
+    ('Zelená nebo růžová?', ['Zelená', 'Růžová']),
+    ('Nesouhlas se zasíláním novinek', ['', 'Nesouhlasím se zasíláním novinek.']),
+]
+REQUIRED_QUESTIONS = {question for question, _ in QUESTIONS[:3]}
+
+
+def legacy_parse_email_body(body):
+    """parse_email_body as it was before the single-pass parser"""
+    data = {}
+    lines = body.strip().splitlines()
+    membership_id = None
+    for line in reversed(lines):
+        if line.strip().isdigit():
+            membership_id = line.strip()
+            break
+    data['membership_id'] = membership_id
+
+    patterns = {
+        'first_name': r'Jak se jmenuješ\?\s*:[ \t]*([^\n]*)',
+        'last_name': r'Jaké je tvé příjmení\?\s*:[ \t]*([^\n]*)',
+        'email': r'Kam ti můžeme poslat e-mail\?[^\n]*:[ \t]*([^\n]*)',
+        'phone': r'Na jaké číslo ti můžeme zavolat\?\s*:[ \t]*([^\n]*)',
+        'dob': r'Kdy ses narodil(?:/a)?\?\s*:[ \t]*([^\n]*)',
+        'city': r'Odkud pocházíš\?\s*:[ \t]*([^\n]*)',
+        'school': r'Kam chodíš do školy\?\s*:[ \t]*([^\n]*)',
+        'interests': r'Co tě nejvíc zajímá\?\s*:[ \t]*([^\n]*)',
+        'character': r'Jsi\s*\.\.\.\s*:[ \t]*([^\n]*)',
+        'frequency': r'Jak často během roku chceš navštěvovat doprovodný program Mladého diváka\?\s*:[ \t]*([^\n]*)',
+        'source': r'Odkud ses o nás dozvěděl(?:/a)?\?\s*:[ \t]*([^\n]*)',
+        'source_detail': r'(?:Odkud\?|Jinde\?)\s*:[ \t]*([^\n]*)',
+        'message': r'Chceš nám něco říct\?\s*:[ \t]*([^\n]*)',
+        'color': r'Zelená nebo růžová\?\s*:[ \t]*([^\n]*)',
+        'newsletter': r'Nesouhlas se zasíláním novinek\s*:[ \t]*([^\n]*)',
+    }
+    for key, pattern in patterns.items():
+        match = re.search(pattern, body, re.IGNORECASE)
+        data[key] = match.group(1).strip() if match else ""
+
+    data['newsletter'] = 1 if not data.get('newsletter', '').strip() else 0
+    data['guessed_gender'] = guess_gender(data.get('first_name', ''), data.get('last_name', ''))
+    data['full_body'] = body
+    logger = logging.getLogger(__name__)
+    logger.info(f"Parsed email: Name='{data.get('first_name')}' '{data.get('last_name')}', Gender='{data.get('guessed_gender')}'")
+    return data
+
+
+def make_corpus(count, seed=1):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(count):
+        lines = []
+        version = rng.randrange(2)  # wording variants of the form
+        for question, answers in QUESTIONS:
+            if rng.random() < 0.05 and question not in REQUIRED_QUESTIONS:
+                continue  # unanswered question left out of the email
+            if isinstance(question, tuple):
+                question = question[version]
+            label = question.upper() if rng.random() < 0.05 else question
+            separator = rng.choice([': ', ':', ' : ', ':\t'])
+            lines.append(f"{label}{separator}{rng.choice(answers)}")
+        if rng.random() < 0.1:
+            rng.shuffle(lines)
+        lines += ['', str(1000 + i)]
+        newline = '\r\n' if rng.random() < 0.2 else '\n'
+        corpus.append('\n' + newline.join(lines) + '\n    ')
+    return corpus
+
+
+def bench(parse, corpus):
+    start = time.perf_counter()
+    for body in corpus:
+        parse(body)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bodies', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--workers', type=int, nargs='*', default=[])
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.bodies)
+    for body in corpus:
+        data = parse_email_body(body)
+        assert not data.pop('needs_review'), body
+        del data['form_version'], data['missing_fields']
+        assert data == legacy_parse_email_body(body), body
+
+    legacy = min(bench(legacy_parse_email_body, corpus) for _ in range(args.repeat))
+    compiled = min(bench(parse_email_body, corpus) for _ in range(args.repeat))
+    print(f"{args.bodies} bodies (best of {args.repeat}), fields identical")
+    print(f"{'per-field re.search':<22} {args.bodies / legacy:>12,.0f} bodies/s")
+    print(f"{'single-pass parser':<22} {args.bodies / compiled:>12,.0f} bodies/s")
+    print(f"speedup: {legacy / compiled:.2f}x")
+
+    for workers in args.workers:
+        start = time.perf_counter()
+        count = sum(1 for _ in parse_email_bodies(corpus, workers=workers))
+        elapsed = time.perf_counter() - start
+        print(f"{f'pool, {workers} workers':<22} {count / elapsed:>12,.0f} bodies/s")
+
+
+if __name__ == '__main__':
+    main()
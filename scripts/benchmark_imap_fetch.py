@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark mailbox fetch throughput (messages/s) over 1, 2 and 4 IMAP connections.
+
+Runs get_unread_emails against the local IMAP stand-in (tests/imap_standin.py)
+with a simulated round-trip latency and per-message server time, so the
+numbers show how the fetch scales with connections rather than network noise.
+
+Usage:
+    python3 scripts/benchmark_imap_fetch.py [--messages 1000] [--connections 1 2 4]
+                                            [--latency 0.03] [--message-delay 0.002]
+"""
+import argparse
+import os
+import sys
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.fetcher import get_unread_emails, SUBJECT_FILTER
+from tests.imap_standin import FakeIMAP, IMAPStandinServer, make_message
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+Jaké je tvé číslo průkazu?: {0}
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=1000)
+    parser.add_argument('--connections', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--latency', type=float, default=0.03, help='seconds per IMAP command')
+    parser.add_argument('--message-delay', type=float, default=0.002, help='seconds per fetched message')
+    args = parser.parse_args()
+
+    backend = FakeIMAP([make_message(f"{SUBJECT_FILTER} - Mladý divák", BODY.format(100000 + i), f"<{i}@bench>")
+                        for i in range(args.messages)])
+    print(f"{args.messages} messages, {args.latency * 1000:.0f} ms per command, "
+          f"{args.message_delay * 1000:.1f} ms per message")
+
+    baseline = None
+    with IMAPStandinServer(backend, latency=args.latency, message_delay=args.message_delay) as server:
+        with patch('src.fetcher.imaplib.IMAP4_SSL', server.client):
+            for connections in args.connections:
+                start = time.perf_counter()
+                emails = get_unread_emails('bench', 'bench', 'imap.test', connections=connections)
+                elapsed = time.perf_counter() - start
+
+                if len(emails) != args.messages:
+                    sys.exit(f"connections={connections}: fetched {len(emails)} of {args.messages} messages")
+                if baseline is None:
+                    baseline = (emails, elapsed)
+                elif emails != baseline[0]:
+                    sys.exit(f"connections={connections}: result differs from the first run")
+                print(f"connections={connections}: {elapsed:6.2f} s  {len(emails) / elapsed:8.0f} msg/s  "
+                      f"x{baseline[1] / elapsed:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark CSV import throughput (rows/s) for 1, 2, 4 and 8 parse workers.
+
+Usage:
+    python3 scripts/benchmark_import.py [--rows 200000] [--workers 1 2 4 8]
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.database import init_db
+from src import importer
+from src.importer import iter_parsed_rows, stage_import, run_import_job
+
+HEADERS = [
+    'jmeno', 'prijmeni', 'email', 'telefon', 'datum_narozeni', 'id', 'bydliste',
+    'skola', 'oblast_kultury', 'povaha', 'intenzita_vyuzivani', 'zdroje', 'kde',
+    'volne_sdeleni', 'barvy', 'marketingovy_nesouhlas'
+]
+FIRST_NAMES = ['Barbora', 'Jan', 'Tereza', 'Petr', 'Eliška', 'Tomáš']
+LAST_NAMES = ['Smékalová', 'Novák', 'Dvořáková', 'Svoboda', 'Černá', 'Procházka']
+
+
+def write_csv(path, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADERS)
+        for i in range(rows):
+            writer.writerow([
+                f' {FIRST_NAMES[i % 6]} ', LAST_NAMES[i % 6], f'user{i}@example.com',
+                '+420777000000', '14/05/2000', str(100000 + i), 'Ostrava', 'OSU',
+                'Divadlo, Hudba', 'Něco mezi', '3', 'Ve škole', '',
+                'Ahoj,\n"víceřádková" zpráva' if i % 10 == 0 else '', 'Zelená', ''
+            ])
+
+
+def bench_parse(path, rows, workers):
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_parsed_rows(path, workers=workers))
+    elapsed = time.perf_counter() - start
+    assert count == rows, f"expected {rows} rows, parsed {count}"
+    return rows / elapsed
+
+
+def bench_import(path, rows, workers, tmp_dir):
+    db_path = os.path.join(tmp_dir, f'bench_{workers}.db')
+    init_db(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    start = time.perf_counter()
+    job = stage_import(conn, path, 'benchmark', workers=workers)
+    job = run_import_job(conn, job['id'], 'benchmark', chunk_size=5000)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    assert job['imported_count'] == rows
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    # Always use the pool path when more than one worker is requested
+    importer.PARALLEL_MIN_SIZE = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'benchmark.csv')
+        write_csv(path, args.rows)
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        print(f"{args.rows} rows, {size_mb:.1f} MB, {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'parse rows/s':>14} {'import rows/s':>14}")
+        for workers in args.workers:
+            parse_rate = bench_parse(path, args.rows, workers)
+            import_rate = bench_import(path, args.rows, workers, tmp_dir)
+            print(f"{workers:>8} {parse_rate:>14,.0f} {import_rate:>14,.0f}")
+
+
+if __name__ == '__main__':
+    main()
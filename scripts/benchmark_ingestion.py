@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of email ingestion against the local IMAP stand-in.
+
+For each mailbox size, seeds the stand-in server (tests/imap_standin.py)
+with synthetic "Nová Přihláška" emails and times get_unread_emails, then
+POST /fetch/preview and POST /fetch/confirm (test mode) through the Flask
+app on a fresh temporary database. Every run is appended to the results
+file, and each timing is compared with the previous run recorded with
+the same settings; --max-regression makes a slowdown fail the run.
+
+Usage:
+    python3 scripts/benchmark_ingestion.py [--sizes 100 1000 10000] [--tls]
+                                           [--latency 0] [--message-delay 0]
+                                           [--results benchmarks/ingestion.jsonl] [--no-record]
+                                           [--max-regression 0.25]
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from src.database import init_db
+from src.fetcher import get_unread_emails, session_pool
+from tests.imap_standin import FakeIMAP, IMAPStandinServer, application_messages, self_signed_context
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_size(app, size, args, ssl_context):
+    """Time the three stages for one mailbox size; returns {stage: seconds}"""
+    fd, db_path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    init_db(db_path)
+
+    def connect():
+        conn = sqlite3.connect(db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    timings = {}
+    backend = FakeIMAP(application_messages(size))
+    backend.warm()
+    try:
+        with IMAPStandinServer(backend, latency=args.latency, message_delay=args.message_delay,
+                               ssl_context=ssl_context) as server, \
+             patch('src.fetcher.imaplib.IMAP4_SSL', server.client), \
+             patch('routes.applicants.get_db_connection', side_effect=connect), \
+             patch.dict(os.environ, {'EMAIL_USER': 'bench', 'EMAIL_PASS': 'bench', 'IMAP_SERVER': 'imap.test'}):
+            start = time.perf_counter()
+            emails = get_unread_emails('bench', 'bench', 'imap.test',
+                                       connections=app.config['EMAIL_FETCH_CONNECTIONS'])
+            timings['get_unread_emails'] = time.perf_counter() - start
+            if len(emails) != size:
+                sys.exit(f"get_unread_emails returned {len(emails)} of {size} emails")
+
+            client = app.test_client()
+            with client.session_transaction() as sess:
+                sess['user'] = {'email': 'bench@example.com'}
+                sess['mode'] = 'test'
+
+            start = time.perf_counter()
+            preview = client.post('/fetch/preview').get_json()
+            timings['fetch_preview'] = time.perf_counter() - start
+            if preview.get('total') != size:
+                sys.exit(f"fetch_preview: {preview}")
+
+            start = time.perf_counter()
+            result = client.post('/fetch/confirm').get_json()
+            timings['fetch_confirm'] = time.perf_counter() - start
+            if result.get('count') != size:
+                sys.exit(f"fetch_confirm imported {result.get('count')} of {size}: {result.get('error')}")
+    finally:
+        session_pool.close_all()
+        os.remove(db_path)
+    return timings
+
+
+def load_previous(path, settings):
+    """Timings of the last recorded run with the same settings: {(size, stage): seconds}"""
+    previous = {}
+    if not os.path.exists(path):
+        return previous
+    with open(path, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()]
+    for run in reversed(runs):
+        if run['settings'] == settings:
+            for entry in run['results']:
+                previous[(entry['size'], entry['stage'])] = entry['seconds']
+            break
+    return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--tls', action='store_true', help='serve IMAP over TLS (needs the openssl CLI)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per IMAP command')
+    parser.add_argument('--message-delay', type=float, default=0.0, help='seconds per fetched message')
+    parser.add_argument('--results', default=os.path.join(ROOT, 'benchmarks', 'ingestion.jsonl'))
+    parser.add_argument('--no-record', action='store_true', help='do not append this run to the results')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='exit with an error when a stage is this much slower than the last run (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from web_app import app
+    app.config['TESTING'] = True
+
+    settings = {'tls': args.tls, 'latency': args.latency, 'message_delay': args.message_delay,
+                'fetch_connections': app.config['EMAIL_FETCH_CONNECTIONS'],
+                'parse_workers': app.config['EMAIL_PARSE_WORKERS']}
+    previous = load_previous(args.results, settings)
+    ssl_context = self_signed_context() if args.tls else None
+
+    results = []
+    regressions = []
+    print(f"{'size':>7} {'stage':<18} {'seconds':>9} {'emails/s':>10} {'vs last':>8}")
+    for size in args.sizes:
+        for stage, seconds in run_size(app, size, args, ssl_context).items():
+            results.append({'size': size, 'stage': stage, 'seconds': round(seconds, 4)})
+            change = ''
+            if (size, stage) in previous:
+                ratio = seconds / previous[(size, stage)] - 1
+                change = f"{ratio:+.0%}"
+                if args.max_regression is not None and ratio > args.max_regression:
+                    regressions.append(f"{stage} at {size}: {change}")
+            print(f"{size:>7} {stage:<18} {seconds:>9.3f} {size / seconds:>10.0f} {change:>8}")
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.results), exist_ok=True)
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'date': datetime.now().isoformat(timespec='seconds'), 'revision': git_revision(),
+                                'python': sys.version.split()[0], 'settings': settings,
+                                'results': results}, ensure_ascii=False) + '\n')
+        print(f"Recorded in {os.path.relpath(args.results, ROOT)}")
+
+    if regressions:
+        sys.exit("Slower than the last recorded run: " + ', '.join(regressions))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Run the IMAP IDLE listener in the foreground.
+
+Intended for a PythonAnywhere always-on task (web workers there cannot
+run background threads). Reads EMAIL_USER, EMAIL_PASS, IMAP_SERVER,
+IMAP_IDLE_MODE and IMAP_IDLE_TIMEOUT from the environment / .env.
+
+Usage:
+    python3 scripts/imap_idle_listener.py [--mode test|production]
+"""
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+
+from src.database import init_db, DB_PATH_PROD, DB_PATH_TEST
+from src.idle_listener import IdleListener, IDLE_TIMEOUT
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--mode', choices=['test', 'production'], default=os.environ.get('IMAP_IDLE_MODE', 'test'))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    username = os.environ.get('EMAIL_USER')
+    password = os.environ.get('EMAIL_PASS')
+    if not username or not password:
+        sys.exit("EMAIL_USER and EMAIL_PASS must be set")
+
+    init_db(DB_PATH_PROD if args.mode == 'production' else DB_PATH_TEST)
+    listener = IdleListener(username, password, os.environ.get('IMAP_SERVER', 'imap.gmail.com'), mode=args.mode,
+                            idle_timeout=int(os.environ.get('IMAP_IDLE_TIMEOUT', IDLE_TIMEOUT)))
+    try:
+        listener.run()  # in the foreground; the task runner restarts the process if it exits
+    except KeyboardInterrupt:
+        listener.stop()
+
+
+if __name__ == '__main__':
+    main()
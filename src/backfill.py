@@ -0,0 +1,161 @@
+"""
+Backfill of application emails from mailbox archives
+
+Imports "Nová Přihláška" messages from mbox exports, Maildir folders and
+directories of .eml files, e.g. when migrating or after restoring an old
+database. Archives are streamed with the mailbox module; the raw
+messages are filtered by subject on their headers and sent in chunks to
+a process pool, where each one is parsed and reduced to its text body
+with fetcher.extract_body, the same logic as the IMAP fetch. The bodies
+are imported with ingest_emails in batches of BACKFILL_BATCH_SIZE, one
+commit per batch, so an interrupted run keeps what it imported and a
+re-run skips messages already recorded in ingested_messages.
+"""
+import email
+import email.parser
+import logging
+import mailbox
+import os
+import time
+from itertools import islice
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from src.fetcher import FetchedEmail, SUBJECT_FILTER, decode_subject, extract_body
+from src.ingest import ingest_emails, find_ingested
+from src.parallel import ordered_pool_map
+
+logger = logging.getLogger(__name__)
+
+# User recorded in the audit log of backfilled applicants
+BACKFILL_USER = 'archive-backfill'
+
+# Messages imported (and committed) together
+BACKFILL_BATCH_SIZE = 5000
+
+# Raw messages sent to a worker per task
+BACKFILL_CHUNK_SIZE = 500
+
+_header_parser = email.parser.BytesHeaderParser()
+
+
+def iter_archive(paths: Iterable[str]) -> Iterator[bytes]:
+    """
+    Raw messages of mbox files, Maildir folders, .eml files and directories
+    of .eml files (searched recursively), in archive order.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            if all(os.path.isdir(os.path.join(path, sub)) for sub in ('cur', 'new', 'tmp')):
+                box = mailbox.Maildir(path, factory=None, create=False)
+                for key in sorted(box.iterkeys()):
+                    yield box.get_bytes(key)
+                continue
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if name.lower().endswith('.eml'):
+                        with open(os.path.join(root, name), 'rb') as f:
+                            yield f.read()
+        elif path.lower().endswith('.eml'):
+            with open(path, 'rb') as f:
+                yield f.read()
+        else:
+            box = mailbox.mbox(path, create=False)
+            try:
+                for key in box.iterkeys():
+                    yield box.get_bytes(key)
+            finally:
+                box.close()
+
+
+def read_headers(raw: bytes) -> Optional[tuple]:
+    """(message_id, date) of an application email from its headers, None for other or unreadable messages"""
+    try:
+        headers = _header_parser.parsebytes(raw)
+        if SUBJECT_FILTER not in decode_subject(headers['Subject']):
+            return None
+        return (headers['Message-ID'] or '').strip() or None, headers['Date']
+    except Exception:
+        return None
+
+
+def extract_text(raw: bytes) -> Optional[str]:
+    """Text body of a raw message (see fetcher.extract_body), None when it cannot be parsed"""
+    try:
+        return extract_body(email.message_from_bytes(raw))
+    except Exception:
+        return None
+
+
+def _extract_chunk(raws: List[bytes]) -> List[Optional[str]]:
+    """Worker: extract_text over a chunk of raw messages"""
+    return [extract_text(raw) for raw in raws]
+
+
+def extract_bodies(raws: Iterable[bytes], workers: int = 1,
+                   chunk_size: int = BACKFILL_CHUNK_SIZE) -> Iterator[Optional[str]]:
+    """extract_text results in input order, in a process pool when workers > 1"""
+    raws = iter(raws)
+    chunks = iter(lambda: list(islice(raws, chunk_size)), [])
+    if workers <= 1:
+        for chunk in chunks:
+            yield from _extract_chunk(chunk)
+        return
+    for results in ordered_pool_map(_extract_chunk, chunks, workers):
+        yield from results
+
+
+def backfill(conn, paths: Iterable[str], workers: int = 1, batch_size: int = BACKFILL_BATCH_SIZE,
+             progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Import the application emails of mailbox archives.
+
+    Per batch, the headers are read first: other messages and Message-IDs
+    already in ingested_messages are skipped before the (much slower) full
+    parse, so a re-run only reads the archive.
+
+    Args:
+        conn: Database connection (sqlite3.Row factory); committed after every batch
+        paths: mbox files, Maildir folders, .eml files or directories of .eml files
+        workers: Process pool size for extracting and parsing the bodies
+        batch_size: Messages read, imported and committed together
+        progress: Called with the running stats after every batch
+
+    Returns:
+        Stats: messages read, applications found, applications skipped as
+        imported before, applicants imported (created or restored), seconds,
+        and the operator messages of ingest_emails
+    """
+    stats = {'messages': 0, 'applications': 0, 'skipped': 0, 'imported': 0, 'seconds': 0.0, 'errors': []}
+    start = time.perf_counter()
+    raws = iter_archive(paths)
+
+    for chunk in iter(lambda: list(islice(raws, batch_size)), []):
+        applications = []
+        for position, raw in enumerate(chunk, stats['messages'] + 1):
+            headers = read_headers(raw)
+            if headers:
+                applications.append((position, raw, *headers))
+        stats['messages'] += len(chunk)
+        stats['applications'] += len(applications)
+
+        known = find_ingested(conn, [message_id for _, _, message_id, _ in applications if message_id], [])
+        pending = [application for application in applications if application[2] not in known]
+        stats['skipped'] += len(applications) - len(pending)
+
+        bodies = extract_bodies([raw for _, raw, _, _ in pending], workers)
+        # Archive messages have no IMAP UID or UIDVALIDITY; the position identifies them in logs
+        batch = [FetchedEmail(str(position), body, date, message_id, None)
+                 for (position, _, message_id, date), body in zip(pending, bodies) if body is not None]
+        count, errors = ingest_emails(conn, batch, BACKFILL_USER, workers=workers)
+        conn.commit()
+
+        stats['imported'] += count
+        stats['errors'] += errors
+        stats['seconds'] = time.perf_counter() - start
+        if progress:
+            progress(stats)
+
+    logger.info(f"Backfill: {stats['messages']} messages, {stats['applications']} applications, "
+                f"{stats['skipped']} imported before, {stats['imported']} imported in {stats['seconds']:.1f} s")
+    return stats
@@ -75,6 +75,8 @@ def init_db(db_path):
             duplicate_warning_dismissed INTEGER DEFAULT 0,
             note TEXT,
             guessed_gender TEXT,
+            form_version TEXT,
+            needs_review INTEGER DEFAULT 0,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
             UNIQUE(first_name, last_name, email)
         );
@@ -94,6 +96,142 @@ def init_db(db_path):
         );
     ''')
     
+    # Create import_jobs table (chunked CSV import checkpoints)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_hash TEXT NOT NULL,
+            user TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            total_rows INTEGER,
+            last_row INTEGER NOT NULL DEFAULT -1,
+            imported_count INTEGER NOT NULL DEFAULT 0,
+            error_count INTEGER NOT NULL DEFAULT 0,
+            report_path TEXT,
+            run_started_at REAL,
+            run_start_row INTEGER NOT NULL DEFAULT -1,
+            updated_at REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_jobs_file_hash ON import_jobs (file_hash)')
+    
+    # Create import_staged_rows table (parsed and classified CSV rows awaiting confirmation)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS import_staged_rows (
+            job_id INTEGER NOT NULL,
+            row_no INTEGER NOT NULL,
+            first_name TEXT,
+            last_name TEXT,
+            email TEXT,
+            phone TEXT,
+            dob TEXT,
+            membership_id TEXT,
+            city TEXT,
+            school TEXT,
+            interests TEXT,
+            character TEXT,
+            frequency TEXT,
+            source TEXT,
+            source_detail TEXT,
+            message TEXT,
+            color TEXT,
+            newsletter INTEGER,
+            guessed_gender TEXT,
+            full_body TEXT,
+            is_first INTEGER,
+            match_id INTEGER,
+            action TEXT,
+            error TEXT,
+            PRIMARY KEY (job_id, row_no),
+            FOREIGN KEY (job_id) REFERENCES import_jobs (id)
+        );
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_import_staged_rows_email ON import_staged_rows (job_id, email)')
+    
+    # Index for duplicate lookups during import
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_applicants_email ON applicants (email)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_applicants_membership_id ON applicants (membership_id)')
+    
+    # Create parse_cache table (parsed email bodies keyed by content hash and parser version)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS parse_cache (
+            body_hash TEXT NOT NULL,
+            parser_version TEXT NOT NULL,
+            result TEXT NOT NULL,
+            last_used REAL NOT NULL,
+            PRIMARY KEY (body_hash, parser_version)
+        );
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_parse_cache_last_used ON parse_cache (last_used)')
+    
+    # Create mailbox_sync table (UIDVALIDITY and last imported UID per mailbox)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS mailbox_sync (
+            mailbox TEXT PRIMARY KEY,
+            uid_validity INTEGER NOT NULL,
+            last_uid INTEGER NOT NULL,
+            updated_at TIMESTAMP
+        );
+    ''')
+    
+    # Create spool tables (fetched emails kept between preview and confirm, bodies content-addressed)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS spool_blobs (
+            body_hash TEXT PRIMARY KEY,
+            body BLOB NOT NULL
+        );
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS message_spool (
+            mailbox TEXT NOT NULL,
+            uid TEXT NOT NULL,
+            uid_validity INTEGER,
+            message_id TEXT,
+            date TEXT,
+            body_hash TEXT NOT NULL,
+            spooled_at TIMESTAMP,
+            PRIMARY KEY (mailbox, uid)
+        );
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_message_spool_body_hash ON message_spool (body_hash)')
+    
+    # Create ingested_messages table (emails already imported, skipped before parsing)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingested_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id TEXT,
+            body_hash TEXT NOT NULL,
+            applicant_id INTEGER,
+            ingested_at TIMESTAMP
+        );
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_ingested_messages_message_id ON ingested_messages (message_id) WHERE message_id IS NOT NULL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_ingested_messages_body_hash ON ingested_messages (body_hash)')
+    
+    # Create fetch_previews table (UIDs of an email preview, referenced by the token in the session)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS fetch_previews (
+            token TEXT PRIMARY KEY,
+            mailbox TEXT NOT NULL,
+            uids TEXT NOT NULL,
+            created_at TIMESTAMP
+        );
+    ''')
+    
+    # Create listener_status table (heartbeat of the IMAP IDLE listener)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS listener_status (
+            name TEXT PRIMARY KEY,
+            state TEXT NOT NULL,
+            detail TEXT,
+            heartbeat_at TIMESTAMP,
+            last_ingest_at TIMESTAMP,
+            ingested_total INTEGER DEFAULT 0,
+            failures INTEGER DEFAULT 0
+        );
+    ''')
+    
     conn.commit()
     conn.close()
     logger.info(f"Database initialized: {db_path}")
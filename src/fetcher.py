@@ -1,100 +1,705 @@
+import binascii
 import imaplib
 import email
-from email.header import decode_header
-from typing import List, Tuple
+import email.message
+import logging
+import quopri
+import re
+import threading
+import time
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.header import decode_header, make_header
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-def get_unread_emails(username: str, password: str, imap_server: str = "imap.gmail.com", mark_as_read: bool = False) -> List[Tuple[str, str]]:
+# Only emails whose subject contains this text are application forms
+SUBJECT_FILTER = "Nová Přihláška"
+
+# Number of message bodies requested per UID FETCH command
+FETCH_BATCH_SIZE = 50
+
+# Upper bound for parallel connections of one fetch (Gmail allows 15 per account, shared with mail clients)
+FETCH_CONNECTIONS_MAX = 4
+
+# Body batches per connection fetched ahead of the consumer in a parallel fetch
+FETCH_PREFETCH_BATCHES = 2
+
+# Pooled IMAP sessions idle this long are logged out (servers drop idle
+# connections after about 30 minutes)
+SESSION_IDLE_TIMEOUT = 5 * 60
+
+# Pooled sessions get a NOOP this often so the server keeps them open
+SESSION_KEEPALIVE_INTERVAL = 60
+
+# First batch of a streamed fetch (doubles up to FETCH_BATCH_SIZE), keeps time to first result short
+STREAM_FIRST_BATCH_SIZE = 5
+
+# Headers needed to pick and describe the matching messages
+HEADER_FIELDS = "(SUBJECT DATE MESSAGE-ID)"
+
+# Fetched together with the headers: the MIME tree tells which part holds the text
+HEADER_ITEMS = f"(BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS {HEADER_FIELDS}])"
+
+# One fetched application email; unpacks as (uid, body, date, message_id, uid_validity)
+FetchedEmail = namedtuple('FetchedEmail', ['uid', 'body', 'date', 'message_id', 'uid_validity'])
+
+# The MIME part extract_body would pick, located in a BODYSTRUCTURE: section
+# number for BODY[<section>], Content-Transfer-Encoding and charset
+TextPart = namedtuple('TextPart', ['section', 'encoding', 'charset'])
+
+# Header fields of a message (email.message.Message) and its TextPart, None
+# when the text has to be extracted from the full message
+MessageInfo = namedtuple('MessageInfo', ['headers', 'text_part'])
+
+# Sync position in a mailbox: UIDs up to last_uid are processed, valid
+# only while the mailbox keeps the same UIDVALIDITY
+Checkpoint = namedtuple('Checkpoint', ['uid_validity', 'last_uid'])
+
+logger = logging.getLogger(__name__)
+
+# Tokens of IMAP response data: parentheses, quoted strings, literal markers
+# (the literal itself is a separate item in imaplib's response list) and
+# atoms, which include section specs such as BODY[HEADER.FIELDS (DATE)]
+_TOKEN_RE = re.compile(rb'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|\{\d+\}$|([^\s()"\[]+(?:\[[^\]]*\][^\s()]*)?))')
+
+
+def uid_set(uids: Iterable[int]) -> str:
+    """Compress UIDs into an IMAP sequence set, e.g. [1, 2, 3, 7] -> '1:3,7'"""
+    ranges = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+    return ','.join(str(start) if start == end else f'{start}:{end}' for start, end in ranges)
+
+
+def decode_subject(value: Optional[str]) -> str:
+    """Decode an RFC 2047 encoded header value"""
+    if not value:
+        return ""
+    try:
+        return str(make_header(decode_header(value)))
+    except (UnicodeDecodeError, LookupError):
+        return value
+
+
+def _decode_part(part: email.message.Message) -> str:
+    """Decode a (transfer-encoded) text part using its declared charset"""
+    payload = part.get_payload(decode=True) or b""
+    return payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+
+
+def extract_body(msg: email.message.Message) -> str:
+    """
+    Return the text body of a message.
+
+    The first non-attachment text/plain part wins; text/html is used
+    only when there is no plain text part.
+    """
+    if not msg.is_multipart():
+        return _decode_part(msg)
+
+    body = ""
+    for part in msg.walk():
+        content_type = part.get_content_type()
+        content_disposition = str(part.get("Content-Disposition"))
+
+        if "attachment" not in content_disposition:
+            if content_type == "text/plain":
+                return _decode_part(part)  # Prefer plain text
+            elif content_type == "text/html" and not body:
+                # Fallback to HTML if no plain text found yet
+                body = _decode_part(part)
+    return body
+
+
+def parse_response(data) -> list:
+    """
+    Parse imaplib response data into nested lists.
+
+    Atoms and quoted strings become bytes, NIL becomes None and literals
+    (the second item of imaplib's tuples) are kept as they are, so
+    b'1 (UID 7 BODY[1] {5}', b'hello'), b')' parses to
+    [b'1', [b'UID', b'7', b'BODY[1]', b'hello']].
+    """
+    stack = [[]]
+    for item in data or []:
+        if isinstance(item, tuple):
+            text, literal = item
+        else:
+            text, literal = item, None
+        for match in _TOKEN_RE.finditer(text or b''):
+            opening, closing, quoted, atom = match.groups()
+            if opening:
+                stack.append([])
+            elif closing and len(stack) > 1:
+                value = stack.pop()
+                stack[-1].append(value)
+            elif quoted is not None:
+                stack[-1].append(re.sub(rb'\\(.)', rb'\1', quoted))
+            elif atom is not None:
+                stack[-1].append(None if atom.upper() == b'NIL' else atom)
+        if literal is not None:
+            stack[-1].append(literal)
+    while len(stack) > 1:  # unbalanced (truncated) response
+        value = stack.pop()
+        stack[-1].append(value)
+    return stack[0]
+
+
+def _fetch_items(data) -> Iterator[Tuple[int, dict]]:
+    """Yield (uid, {item name: value}) for each message in a UID FETCH response"""
+    for attributes in parse_response(data):
+        if not isinstance(attributes, list):
+            continue  # message sequence number
+        items = {}
+        for i in range(0, len(attributes) - 1, 2):
+            name = attributes[i]
+            if isinstance(name, bytes):
+                items[name.decode('ascii', errors='replace').upper().replace('.PEEK', '')] = attributes[i + 1]
+        if isinstance(items.get('UID'), bytes) and items['UID'].isdigit():
+            yield int(items['UID']), items
+
+
+def _text(value) -> str:
+    return value.decode('utf-8', errors='replace') if isinstance(value, bytes) else ''
+
+
+def find_text_part(structure) -> Optional[TextPart]:
+    """
+    Locate the part extract_body would return in a parsed BODYSTRUCTURE.
+
+    The first non-attachment text/plain part wins, else the first
+    text/html one. Returns None when the structure holds no text part
+    or is not understood (e.g. an encapsulated message/rfc822 comes
+    first), so the caller downloads the whole message instead.
+    """
+    html = None
+
+    def walk(node, section):
+        nonlocal html
+        if not isinstance(node, list) or not node:
+            return None
+        if isinstance(node[0], list):  # multipart: child parts, then the subtype
+            children = []
+            for child in node:
+                if not isinstance(child, list):
+                    break
+                children.append(child)
+            for number, child in enumerate(children, start=1):
+                found = walk(child, f'{section}.{number}' if section else str(number))
+                if found is not None:
+                    return found
+            return None
+        if len(node) < 7:
+            raise ValueError('truncated body structure')
+
+        content_type = f'{_text(node[0])}/{_text(node[1])}'.lower()
+        if content_type == 'message/rfc822':
+            raise ValueError('encapsulated message')
+        disposition = node[9] if content_type.startswith('text/') and len(node) > 9 else None
+        if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == 'attachment':
+            return None
+
+        params = node[2] if isinstance(node[2], list) else []
+        charset = None
+        for i in range(0, len(params) - 1, 2):
+            if _text(params[i]).lower() == 'charset':
+                charset = _text(params[i + 1]) or None
+        part = TextPart(section or '1', _text(node[5]).lower() or '7bit', charset)
+        if content_type == 'text/plain':
+            return part
+        if content_type == 'text/html' and html is None:
+            html = part
+        return None
+
+    try:
+        return walk(structure, '') or html
+    except ValueError:
+        return None
+
+
+def decode_text_part(part: TextPart, payload: bytes) -> str:
+    """Undo the transfer encoding of a part fetched with BODY[<section>] and decode its charset"""
+    if part.encoding == 'base64':
+        try:
+            payload = binascii.a2b_base64(payload)
+        except binascii.Error:
+            pass
+    elif part.encoding == 'quoted-printable':
+        payload = quopri.decodestring(payload)
+    try:
+        return payload.decode(part.charset or 'utf-8', errors='replace')
+    except LookupError:
+        return payload.decode('utf-8', errors='replace')
+
+
+def selected_uid_validity(mail: imaplib.IMAP4) -> Optional[int]:
+    """Return the UIDVALIDITY reported when the mailbox was selected"""
+    _, data = mail.response('UIDVALIDITY')
+    if not data or data[0] is None:
+        return None
+    return int(data[0])
+
+
+def search_unread_applications(mail: imaplib.IMAP4, after_uid: Optional[int] = None) -> Tuple[List[int], bool]:
+    """
+    Return UIDs of messages whose subject matches SUBJECT_FILTER.
+
+    Without after_uid only unread messages are returned (bootstrap and
+    resync); with it, every message with a higher UID, read or not.
+
+    The filter runs on the server: X-GM-RAW on Gmail, otherwise
+    SEARCH CHARSET UTF-8 SUBJECT with the subject sent as a literal.
+    Servers rejecting the UTF-8 search fall back to the UID or UNSEEN
+    criterion alone; the second value is then False and the caller has
+    to check the subjects itself.
+
+    Returns:
+        (uids, filtered_on_server)
+    """
+    scope = ('UID', f'{after_uid + 1}:*') if after_uid is not None else ('UNSEEN',)
+    if 'X-GM-EXT-1' in mail.capabilities:
+        mail.literal = f'subject:"{SUBJECT_FILTER}"'.encode('utf-8')
+        criteria = ('CHARSET', 'UTF-8', *scope, 'X-GM-RAW')
+    else:
+        mail.literal = SUBJECT_FILTER.encode('utf-8')
+        criteria = ('CHARSET', 'UTF-8', *scope, 'SUBJECT')
+
+    filtered = True
+    try:
+        status, messages = mail.uid('SEARCH', *criteria)
+    except imaplib.IMAP4.error:
+        status = 'NO'
+    if status != 'OK':
+        filtered = False
+        mail.literal = None
+        status, messages = mail.uid('SEARCH', None, *scope)
+        if status != 'OK':
+            return [], filtered
+    uids = [int(uid) for uid in messages[0].split()]
+    if after_uid is not None:
+        # "n:*" always matches the highest UID, even when it is below n
+        uids = [uid for uid in uids if uid > after_uid]
+    return uids, filtered
+
+
+def fetch_headers(mail: imaplib.IMAP4, uids: List[int]) -> dict:
+    """
+    Fetch subject, date, Message-ID and BODYSTRUCTURE of all UIDs in one command.
+
+    Does not set \\Seen. Returns {uid: MessageInfo}.
+    """
+    if not uids:
+        return {}
+    status, data = mail.uid('FETCH', uid_set(uids), HEADER_ITEMS)
+    if status != 'OK':
+        return {}
+    infos = {}
+    for uid, items in _fetch_items(data):
+        header = next((value for name, value in items.items() if name.startswith('BODY[HEADER')), None)
+        if isinstance(header, bytes):
+            infos[uid] = MessageInfo(email.message_from_bytes(header), find_text_part(items.get('BODYSTRUCTURE')))
+    return infos
+
+
+def _split_batches(uids: List[int], batch_size: int = FETCH_BATCH_SIZE,
+                   first_batch_size: Optional[int] = None) -> Iterator[List[int]]:
+    """Split UIDs into batches starting at first_batch_size and doubling up to batch_size"""
+    size = min(first_batch_size or batch_size, batch_size)
+    i = 0
+    while i < len(uids):
+        yield uids[i:i + size]
+        i += size
+        size = min(size * 2, batch_size)
+
+
+def _fetch_batch(mail: imaplib.IMAP4, uids: List[int], text_parts: dict,
+                 mark_as_read: bool) -> List[Tuple[int, str]]:
+    """
+    Download the text bodies of a batch, one UID FETCH per distinct section.
+
+    Messages with a known TextPart get only BODY[<section>]; the others
+    are downloaded whole and go through extract_body. BODY[...] sets
+    \\Seen, BODY.PEEK[...] does not.
     """
-    Connects to IMAP and retrieves unread emails.
-    
+    peek = '' if mark_as_read else '.PEEK'
+    sections = defaultdict(list)
+    for uid in uids:
+        part = text_parts.get(uid)
+        sections[part.section if part else ''].append(uid)
+
+    bodies = []
+    for section, group in sections.items():
+        status, data = mail.uid('FETCH', uid_set(group), f'(BODY{peek}[{section}])')
+        if status != 'OK':
+            continue
+        for uid, items in _fetch_items(data):
+            payload = items.get(f'BODY[{section}]')
+            part = text_parts.get(uid)
+            if not isinstance(payload, bytes):
+                continue
+            if not section:
+                bodies.append((uid, extract_body(email.message_from_bytes(payload))))
+            elif part and part.section == section:
+                bodies.append((uid, decode_text_part(part, payload)))
+    return sorted(bodies)
+
+
+def iter_body_batches(mail: imaplib.IMAP4, uids: List[int], text_parts: Optional[dict] = None,
+                      mark_as_read: bool = False, batch_size: int = FETCH_BATCH_SIZE,
+                      first_batch_size: Optional[int] = None) -> Iterator[List[Tuple[int, str]]]:
+    """
+    Fetch message bodies, yielding the (uid, text) pairs of each batch.
+
+    Batches start at first_batch_size UIDs and double up to batch_size,
+    so the first messages arrive after a short round trip. text_parts
+    maps UIDs to the TextPart to download (see fetch_headers); other
+    messages are downloaded whole.
+
+    BODY[] marks the messages as read (production mode), BODY.PEEK[]
+    keeps them unread (test mode).
+    """
+    for batch in _split_batches(uids, batch_size, first_batch_size):
+        yield _fetch_batch(mail, batch, text_parts or {}, mark_as_read)
+
+
+def _connect(username: str, password: str, imap_server: str) -> imaplib.IMAP4:
+    mail = imaplib.IMAP4_SSL(imap_server)
+    try:
+        mail.login(username, password)
+        mail.select("inbox")
+    except:
+        _logout(mail)
+        raise
+    return mail
+
+
+def _logout(mail: imaplib.IMAP4):
+    try:
+        mail.close()
+        mail.logout()
+    except:
+        pass
+
+
+class IMAPSessionPool:
+    """
+    Logged-in IMAP sessions with the inbox selected, kept open between fetches.
+
+    Checking out a session re-SELECTs the inbox: that verifies the
+    connection (dead ones are dropped and replaced) and refreshes
+    UIDVALIDITY and the message count, at the cost of one round trip
+    instead of the TCP + TLS handshake, LOGIN and SELECT of a new
+    connection. A daemon thread sends NOOP to sessions idle for
+    keepalive_interval and logs out those idle for idle_timeout; it
+    exits when the pool is empty. idle_timeout 0 disables pooling.
+    """
+
+    def __init__(self, max_idle: int = FETCH_CONNECTIONS_MAX, idle_timeout: float = SESSION_IDLE_TIMEOUT,
+                 keepalive_interval: float = SESSION_KEEPALIVE_INTERVAL):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.keepalive_interval = keepalive_interval
+        # (server, username, password) -> [[session, last used, last checked]], most recent last
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._keepalive_thread = None
+
+    def checkout(self, username: str, password: str, imap_server: str) -> imaplib.IMAP4:
+        """Return a pooled session for the account, or a new one"""
+        key = (imap_server, username, password)
+        while True:
+            with self._lock:
+                sessions = self._idle.get(key)
+                if not sessions:
+                    break
+                mail = sessions.pop()[0]
+            try:
+                status, _ = mail.select("inbox")
+                if status == 'OK':
+                    return mail
+            except (imaplib.IMAP4.error, OSError):
+                pass
+            logger.info(f"Dropping dead IMAP session of {username}")
+            _logout(mail)
+        return _connect(username, password, imap_server)
+
+    def checkin(self, mail: imaplib.IMAP4, username: str, password: str, imap_server: str):
+        """Return a session that is not in the middle of a command"""
+        if self.idle_timeout <= 0:
+            _logout(mail)
+            return
+        now = time.monotonic()
+        with self._lock:
+            sessions = self._idle.setdefault((imap_server, username, password), [])
+            if len(sessions) < self.max_idle:
+                sessions.append([mail, now, now])
+                mail = None
+                if self._keepalive_thread is None:
+                    self._keepalive_thread = threading.Thread(target=self._run_keepalive,
+                                                              name='imap-keepalive', daemon=True)
+                    self._keepalive_thread.start()
+        if mail is not None:
+            _logout(mail)
+
+    @contextmanager
+    def session(self, username: str, password: str, imap_server: str):
+        """Check out a session; it goes back to the pool unless the block raised"""
+        mail = self.checkout(username, password, imap_server)
+        try:
+            yield mail
+        except GeneratorExit:
+            # A closed fetch generator: no command was left half-way
+            self.checkin(mail, username, password, imap_server)
+            raise
+        except BaseException:
+            _logout(mail)
+            raise
+        self.checkin(mail, username, password, imap_server)
+
+    def keepalive(self):
+        """NOOP sessions idle for keepalive_interval, log out those idle for idle_timeout"""
+        now = time.monotonic()
+        expired, due = [], []
+        with self._lock:
+            for key, sessions in self._idle.items():
+                for entry in list(sessions):
+                    if now - entry[1] >= self.idle_timeout:
+                        expired.append(entry[0])
+                        sessions.remove(entry)
+                    elif now - entry[2] >= self.keepalive_interval:
+                        due.append((key, entry))
+                        sessions.remove(entry)  # out of reach of checkout while the NOOP runs
+        for mail in expired:
+            _logout(mail)
+        for key, entry in due:
+            try:
+                status, _ = entry[0].noop()
+            except (imaplib.IMAP4.error, OSError):
+                status = 'NO'
+            if status != 'OK':
+                _logout(entry[0])
+                continue
+            entry[2] = time.monotonic()
+            with self._lock:
+                self._idle.setdefault(key, []).insert(0, entry)
+
+    def _run_keepalive(self):
+        while True:
+            time.sleep(min(self.keepalive_interval, self.idle_timeout))
+            self.keepalive()
+            with self._lock:
+                if not any(self._idle.values()):
+                    self._keepalive_thread = None
+                    return
+
+    def close_all(self):
+        """Log out every idle session"""
+        with self._lock:
+            sessions = [entry[0] for entries in self._idle.values() for entry in entries]
+            self._idle.clear()
+        for mail in sessions:
+            _logout(mail)
+
+
+# Shared by the web fetch routes (see IMAP_SESSION_IDLE_TIMEOUT)
+session_pool = IMAPSessionPool()
+
+
+@contextmanager
+def _session(pool: Optional[IMAPSessionPool], username: str, password: str, imap_server: str):
+    """Session with the inbox selected: from the pool, or a new connection logged out afterwards"""
+    if pool is not None:
+        with pool.session(username, password, imap_server) as mail:
+            yield mail
+        return
+    mail = _connect(username, password, imap_server)
+    try:
+        yield mail
+    finally:
+        _logout(mail)
+
+
+def iter_body_batches_parallel(username: str, password: str, imap_server: str, uids: List[int],
+                               uid_validity: Optional[int], connections: int, text_parts: Optional[dict] = None,
+                               mark_as_read: bool = False, first_batch_size: Optional[int] = None,
+                               pool: Optional[IMAPSessionPool] = None, main=None,
+                               prefetch: int = FETCH_PREFETCH_BATCHES) -> Iterator[List[Tuple[int, str]]]:
+    """
+    Like iter_body_batches, spread over up to `connections` IMAP connections.
+
+    Each pool thread opens its own connection (or checks one out of the
+    session pool) and fetches whole batches; batches are yielded in UID
+    order as soon as they and all earlier ones are complete. At most
+    `prefetch` batches per connection are in flight or waiting for the
+    consumer. The connection count, including `main` (the caller's open
+    session with the inbox selected, fetched over by one of the threads),
+    is capped at FETCH_CONNECTIONS_MAX.
+    """
+    batches = list(_split_batches(uids, first_batch_size=first_batch_size))
+    connections = max(1, min(connections, FETCH_CONNECTIONS_MAX, len(batches)))
+    local = threading.local()
+    spare = [main] if main is not None else []
+    opened = []
+    lock = threading.Lock()
+
+    def fetch(batch):
+        mail = getattr(local, 'mail', None)
+        if mail is None:
+            with lock:
+                mail = spare.pop() if spare else None
+            if mail is None:
+                if pool is not None:
+                    mail = pool.checkout(username, password, imap_server)
+                else:
+                    mail = _connect(username, password, imap_server)
+                with lock:
+                    opened.append(mail)
+                if selected_uid_validity(mail) != uid_validity:
+                    raise imaplib.IMAP4.error("UIDVALIDITY changed during the fetch")
+            local.mail = mail
+        return _fetch_batch(mail, batch, text_parts or {}, mark_as_read)
+
+    executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix='imap-fetch')
+    window = connections * max(prefetch, 1)
+    pending = deque()
+    reusable = False
+    try:
+        for batch in batches:
+            pending.append(executor.submit(fetch, batch))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+        reusable = True
+    except GeneratorExit:
+        reusable = True
+        raise
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for mail in opened:
+            if pool is not None and reusable:
+                pool.checkin(mail, username, password, imap_server)
+            else:
+                _logout(mail)
+
+
+def iter_new_email_batches(username: str, password: str, imap_server: str = "imap.gmail.com",
+                           mark_as_read: bool = False, checkpoint: Optional[Checkpoint] = None,
+                           first_batch_size: Optional[int] = None, connections: int = 1,
+                           pool: Optional[IMAPSessionPool] = None) -> Iterator[List[FetchedEmail]]:
+    """
+    Connect to IMAP and yield new application emails batch by batch as they arrive.
+
+    Only one body batch is held at a time (a few more with connections > 1);
+    the connections are closed (or returned to the pool) when the generator
+    finishes or is closed. Errors propagate to the caller. See
+    get_unread_emails for the arguments.
+    """
+    with _session(pool, username, password, imap_server) as mail:
+        uid_validity = selected_uid_validity(mail)
+        after_uid = None
+        if checkpoint is not None:
+            if checkpoint.uid_validity == uid_validity:
+                after_uid = checkpoint.last_uid
+            else:
+                logger.warning(f"UIDVALIDITY of {username} inbox changed ({checkpoint.uid_validity} -> "
+                               f"{uid_validity}), resyncing from unread emails")
+
+        uids, filtered = search_unread_applications(mail, after_uid)
+        # One command for the headers and MIME structure of every match; the
+        # unfiltered fallback search also picks the applications by subject here
+        infos = fetch_headers(mail, uids)
+        uids = [uid for uid in sorted(infos)
+                if filtered or SUBJECT_FILTER in decode_subject(infos[uid].headers["Subject"])]
+        text_parts = {uid: infos[uid].text_part for uid in uids}
+
+        if connections > 1 and len(uids) > FETCH_BATCH_SIZE:
+            batches = iter_body_batches_parallel(username, password, imap_server, uids, uid_validity,
+                                                 connections, text_parts, mark_as_read=mark_as_read,
+                                                 first_batch_size=first_batch_size, pool=pool, main=mail)
+        else:
+            batches = iter_body_batches(mail, uids, text_parts, mark_as_read=mark_as_read,
+                                        first_batch_size=first_batch_size)
+        for batch in batches:
+            yield [
+                FetchedEmail(str(uid), body, infos[uid].headers.get("Date"),
+                             (infos[uid].headers.get("Message-ID") or "").strip() or None, uid_validity)
+                for uid, body in batch
+            ]
+
+
+def get_unread_emails(username: str, password: str, imap_server: str = "imap.gmail.com",
+                      mark_as_read: bool = False, checkpoint: Optional[Checkpoint] = None,
+                      connections: int = 1, pool: Optional[IMAPSessionPool] = None,
+                      raise_errors: bool = False) -> List[FetchedEmail]:
+    """
+    Connects to IMAP and retrieves new application emails.
+
+    With a checkpoint whose UIDVALIDITY still matches the mailbox, only
+    messages with a UID above checkpoint.last_uid are fetched, whether
+    read or not. Without one (or after UIDVALIDITY changed) the unread
+    applications are fetched instead.
+
+    Round trips do not grow with the mailbox: one search filtered on the
+    server, one header and BODYSTRUCTURE fetch, and one body fetch per
+    FETCH_BATCH_SIZE messages. Only the text part of each message is
+    downloaded, not HTML alternatives or attachments.
+
     Args:
         username: Email username
         password: Email password
         imap_server: IMAP server address
         mark_as_read: If True, mark emails as read after fetching (production mode)
-    
+        checkpoint: Last processed position in the inbox (see src.mailbox_sync)
+        connections: Download bodies over this many parallel connections (large fetches,
+            capped at FETCH_CONNECTIONS_MAX)
+        pool: Reuse logged-in sessions from this IMAPSessionPool instead of connecting
+        raise_errors: Raise connection and protocol errors instead of returning an empty list
+
     Returns:
-        List of tuples (email_uid, email_body_text, email_date)
+        List of FetchedEmail tuples (uid, body, date, message_id, uid_validity) in UID order
     """
-    mail = imaplib.IMAP4_SSL(imap_server)
     try:
-        mail.login(username, password)
-        mail.select("inbox")
-        
-        # Search for all unread emails
-        status, messages = mail.search(None, "UNSEEN")
-        if status != "OK":
-            return []
-            
-        email_ids = messages[0].split()
-        results = []
-        
-        for e_id in email_ids:
-            # Fetch the email header first to check subject
-            # Use BODY.PEEK[HEADER] to avoid marking as read if we don't process it
-            res, header_data = mail.fetch(e_id, '(BODY.PEEK[HEADER])')
-            
-            subject_matched = False
-            for response_part in header_data:
-                if isinstance(response_part, tuple):
-                    msg = email.message_from_bytes(response_part[1])
-                    subject, encoding = decode_header(msg["Subject"])[0]
-                    if isinstance(subject, bytes):
-                        subject = subject.decode(encoding if encoding else "utf-8")
-                    
-                    if "Nová Přihláška" in subject:
-                        subject_matched = True
-                        break
-            
-            if subject_matched:
-                # Fetch the full body
-                if mark_as_read:
-                    # Use BODY[] to mark as read (production mode)
-                    res, msg_data = mail.fetch(e_id, "(BODY[])")
-                else:
-                    # Use BODY.PEEK[] to keep unread (test mode)
-                    res, msg_data = mail.fetch(e_id, "(BODY.PEEK[])")
-                    
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        
-                        # Extract body
-                        body = ""
-                        if msg.is_multipart():
-                            for part in msg.walk():
-                                content_type = part.get_content_type()
-                                content_disposition = str(part.get("Content-Disposition"))
-                                
-                                if "attachment" not in content_disposition:
-                                    if content_type == "text/plain":
-                                        body = part.get_payload(decode=True).decode()
-                                        break # Prefer plain text
-                                    elif content_type == "text/html":
-                                        # Fallback to HTML if no plain text found yet
-                                        if not body:
-                                            body = part.get_payload(decode=True).decode()
-                        else:
-                            body = msg.get_payload(decode=True).decode()
-                        
-                        # Extract email date
-                        email_date = msg.get("Date")
-                        
-                        results.append((e_id.decode(), body, email_date))
-        
-        return results
-                    
-        return results
-        
+        return [fetched for batch in iter_new_email_batches(username, password, imap_server,
+                                                            mark_as_read=mark_as_read, checkpoint=checkpoint,
+                                                            connections=connections, pool=pool)
+                for fetched in batch]
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Error fetching emails: {e}")
         return []
-    finally:
-        try:
-            mail.close()
-            mail.logout()
-        except:
-            pass
+
+def mark_seen(username: str, password: str, imap_server: str, uids: List[int],
+              uid_validity: Optional[int] = None, pool: Optional[IMAPSessionPool] = None) -> bool:
+    """
+    Set \\Seen on the given UIDs with a single UID STORE command.
+
+    Used by fetch confirm after importing the emails (spooled or
+    re-fetched), so only imported messages are flagged and spooled ones
+    are not downloaded again. Nothing is stored if the inbox UIDVALIDITY
+    no longer matches uid_validity (the UIDs would point at other messages).
+
+    Returns:
+        True if the flags were set (or there was nothing to do)
+    """
+    if not uids:
+        return True
+    try:
+        with _session(pool, username, password, imap_server) as mail:
+            if uid_validity is not None and selected_uid_validity(mail) != uid_validity:
+                logger.warning(f"UIDVALIDITY of {username} inbox changed, emails not marked as read")
+                return False
+            # .SILENT: no untagged FETCH response per message
+            status, _ = mail.uid('STORE', uid_set(uids), '+FLAGS.SILENT', '(\\Seen)')
+            return status == 'OK'
+    except Exception as e:
+        logger.error(f"Error marking emails as read: {e}")
+        return False
 
 if __name__ == "__main__":
     # Test with dummy credentials (will fail but checks syntax)
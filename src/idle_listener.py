@@ -0,0 +1,254 @@
+"""
+IMAP IDLE listener for automatic application ingestion
+
+Keeps one IMAP connection in IDLE on the inbox. When the server reports
+new mail (or the IDLE period ends) the listener runs the same fetch →
+parse → dedupe → insert path as fetch confirm (src.ingest), starting
+from the mailbox checkpoint so only new UIDs are downloaded.
+
+Connection failures are retried with exponential backoff. The current
+state is written to the listener_status table as a heartbeat, which the
+UI shows next to the fetch button.
+
+The listener is opt-in (IMAP_IDLE). On PythonAnywhere web workers must
+not run background threads, so there it runs as an always-on task:
+
+    python3 scripts/imap_idle_listener.py
+
+Run a single listener per database.
+"""
+import imaplib
+import logging
+import re
+import select
+import sqlite3
+import ssl
+import threading
+import time
+from datetime import datetime, timedelta
+
+from src.database import DB_PATH_PROD, DB_PATH_TEST, remove_diacritics
+from src.fetcher import get_unread_emails, mark_seen
+from src.ingest import ingest_emails
+from src.mailbox_sync import mailbox_key, load_checkpoint
+
+logger = logging.getLogger(__name__)
+
+# Re-issue IDLE well before servers or NAT gateways drop the idle connection (RFC 2177: < 29 minutes)
+IDLE_TIMEOUT = 9 * 60
+
+# Reconnect delays after failures: doubles from BACKOFF_INITIAL up to BACKOFF_MAX seconds
+BACKOFF_INITIAL = 5
+BACKOFF_MAX = 15 * 60
+
+# User recorded in the audit log for automatically imported applicants
+LISTENER_USER = 'imap-idle'
+
+# Name of the status row written by the listener
+LISTENER_NAME = 'imap_idle'
+
+_EXISTS_RE = re.compile(rb'^\* \d+ (EXISTS|RECENT)', re.IGNORECASE)
+
+
+def _buffered(mail):
+    """
+    Return True if response data already sits in the TLS or imaplib read buffers.
+
+    select() only sees the socket, so a line that arrived together with
+    the IDLE continuation would otherwise wait for the next notification.
+    """
+    if getattr(mail.sock, 'pending', lambda: 0)():
+        return True
+    timeout = mail.sock.gettimeout()
+    mail.sock.settimeout(0)
+    try:
+        return bool(mail.file.peek(1))
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return False
+    finally:
+        mail.sock.settimeout(timeout)
+
+
+def idle_wait(mail, timeout):
+    """
+    Wait in IDLE until the server reports new mail or timeout seconds pass.
+
+    imaplib has no IDLE support before Python 3.14, so the command is sent
+    on the raw connection and ended with DONE. Returns True when new mail
+    was reported.
+    """
+    tag = mail._new_tag()
+    mail.send(tag + b' IDLE\r\n')
+    line = mail.readline()
+    if not line.startswith(b'+'):
+        raise imaplib.IMAP4.error(f"IDLE rejected: {line.strip()!r}")
+
+    woke = False
+    deadline = time.monotonic() + timeout
+    while not woke:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not (_buffered(mail) or select.select([mail.sock], [], [], remaining)[0]):
+            break
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        woke = bool(_EXISTS_RE.match(line))
+
+    mail.send(b'DONE\r\n')
+    while True:
+        line = mail.readline()
+        if not line:
+            raise imaplib.IMAP4.abort("connection closed while ending IDLE")
+        if line.startswith(tag):
+            if not line[len(tag):].strip().upper().startswith(b'OK'):
+                raise imaplib.IMAP4.error(f"IDLE failed: {line.strip()!r}")
+            return woke
+
+
+def write_status(db_path, state, detail=None, ingested=0, failures=0):
+    """Store the listener heartbeat (state, last error, totals) in listener_status"""
+    conn = sqlite3.connect(db_path)
+    try:
+        now = datetime.now()
+        conn.execute('''
+            INSERT INTO listener_status (name, state, detail, heartbeat_at, last_ingest_at, ingested_total, failures)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET
+                state = excluded.state,
+                detail = excluded.detail,
+                heartbeat_at = excluded.heartbeat_at,
+                last_ingest_at = COALESCE(excluded.last_ingest_at, listener_status.last_ingest_at),
+                ingested_total = listener_status.ingested_total + excluded.ingested_total,
+                failures = excluded.failures
+        ''', (LISTENER_NAME, state, detail, now, now if ingested else None, ingested, failures))
+        conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Failed to write listener status: {e}")
+    finally:
+        conn.close()
+
+
+def read_status(conn, idle_timeout=IDLE_TIMEOUT):
+    """
+    Return the listener status for the UI, or None if no listener ever ran.
+
+    A heartbeat older than two IDLE periods plus the longest backoff
+    means the listener is gone (process killed, task stopped) and is
+    reported as state 'stale'.
+    """
+    try:
+        row = conn.execute('SELECT * FROM listener_status WHERE name = ?', (LISTENER_NAME,)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    if not row:
+        return None
+    status = dict(row)
+    heartbeat = datetime.fromisoformat(str(status['heartbeat_at']))
+    if status['state'] != 'stopped' and datetime.now() - heartbeat > timedelta(seconds=2 * idle_timeout + BACKOFF_MAX):
+        status['state'] = 'stale'
+    return status
+
+
+class IdleListener(threading.Thread):
+    """Background thread ingesting new applications as the server announces them"""
+
+    def __init__(self, username, password, server='imap.gmail.com', mode='test',
+                 idle_timeout=IDLE_TIMEOUT, backoff_initial=BACKOFF_INITIAL, backoff_max=BACKOFF_MAX):
+        super().__init__(name='imap-idle-listener', daemon=True)
+        self.username = username
+        self.password = password
+        self.server = server
+        # Same semantics as the UI modes: production marks emails read and uses the production DB
+        self.mark_as_read = mode == 'production'
+        self.db_path = DB_PATH_PROD if self.mark_as_read else DB_PATH_TEST
+        self.idle_timeout = idle_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.sync_key = mailbox_key(username, server)
+        self.failures = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _connect(self):
+        mail = imaplib.IMAP4_SSL(self.server)
+        mail.login(self.username, self.password)
+        mail.select('inbox')
+        if 'IDLE' not in mail.capabilities:
+            mail.logout()
+            raise imaplib.IMAP4.error(f"{self.server} does not support IDLE")
+        return mail
+
+    def ingest(self):
+        """
+        Fetch everything past the checkpoint and import it; returns the number of applicants.
+
+        Fetch errors are raised (and end the session with a backoff). In
+        production \\Seen is set only once the import and the checkpoint are
+        committed, so a crash in between never flags emails not imported.
+        """
+        conn = sqlite3.connect(self.db_path)
+        conn.create_function("remove_diacritics", 1, remove_diacritics)
+        conn.row_factory = sqlite3.Row
+        try:
+            raw_emails = get_unread_emails(self.username, self.password, self.server,
+                                           mark_as_read=False, checkpoint=load_checkpoint(conn, self.sync_key),
+                                           raise_errors=True)
+            count, errors = ingest_emails(conn, raw_emails, LISTENER_USER, sync_key=self.sync_key)
+            conn.commit()
+        finally:
+            conn.close()
+        if self.mark_as_read and raw_emails:
+            uids = [int(fetched[0]) for fetched in raw_emails if str(fetched[0]).isdigit()]
+            if not mark_seen(self.username, self.password, self.server, uids,
+                             getattr(raw_emails[0], 'uid_validity', None)):
+                logger.warning("IDLE ingest: imported emails could not be marked as read")
+        for error in errors:
+            logger.warning(f"IDLE ingest: {error}")
+        if count:
+            logger.info(f"IDLE ingest: {count} applicants imported")
+        return count
+
+    def run_session(self):
+        """One connection: catch up, then IDLE and ingest until an error or stop()"""
+        write_status(self.db_path, 'connecting', failures=self.failures)
+        mail = self._connect()
+        try:
+            ingested = self.ingest()
+            self.failures = 0
+            write_status(self.db_path, 'idle', ingested=ingested)
+            while not self._stop_event.is_set():
+                # The periodic catch-up after a timeout also covers missed notifications
+                woke = idle_wait(mail, self.idle_timeout)
+                write_status(self.db_path, 'idle', 'new mail' if woke else None, ingested=self.ingest())
+        finally:
+            try:
+                mail.logout()
+            except Exception:
+                pass
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_session()
+            except Exception as e:
+                self.failures += 1
+                delay = min(self.backoff_initial * 2 ** (self.failures - 1), self.backoff_max)
+                logger.error(f"IDLE listener error (retry in {delay}s): {e}")
+                write_status(self.db_path, 'backoff', str(e), failures=self.failures)
+                self._stop_event.wait(delay)
+        write_status(self.db_path, 'stopped', failures=self.failures)
+
+
+_listener = None
+
+
+def start_listener(username, password, server='imap.gmail.com', mode='test', idle_timeout=IDLE_TIMEOUT):
+    """Start the listener thread once per process and return it"""
+    global _listener
+    if _listener is None or not _listener.is_alive():
+        _listener = IdleListener(username, password, server, mode=mode, idle_timeout=idle_timeout)
+        _listener.start()
+        logger.info(f"IMAP IDLE listener started for {username} ({mode} mode)")
+    return _listener
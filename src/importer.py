@@ -0,0 +1,608 @@
+"""
+CSV and XLSX import helpers
+
+Uploads are copied to disk in chunks and decoded incrementally (XLSX
+through openpyxl's read-only streaming mode), so large files never have
+to fit in memory. The preview parses the file once into
+the import_staged_rows table and classifies every row against applicants
+with set-based SQL; confirming promotes the staged rows with INSERT ...
+SELECT in committed chunks, with a checkpoint in the import_jobs table so
+that an interrupted import resumes where it stopped.
+"""
+import csv
+import hashlib
+import io
+import logging
+import os
+import sqlite3
+import time
+from datetime import date, datetime
+
+import openpyxl
+
+from src.parallel import ordered_pool_map
+from src.parser import compile_csv_header
+
+logger = logging.getLogger(__name__)
+
+# Size of the blocks copied from the upload stream to disk
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+# Number of staged rows shown per preview page
+PREVIEW_PAGE_SIZE = 50
+
+# Staged previews that were never confirmed are discarded after this many hours
+STAGED_MAX_AGE_HOURS = 24
+
+# Default number of rows committed per import chunk
+DEFAULT_CHUNK_SIZE = 1000
+
+# Files smaller than this are parsed serially (pool startup costs more than it saves)
+PARALLEL_MIN_SIZE = 8 * 1024 * 1024
+
+# Target size of the byte ranges parsed by pool workers
+PARALLEL_RANGE_SIZE = 4 * 1024 * 1024
+
+# Applicant columns filled from the CSV row extractor (also staged per row)
+IMPORT_COLUMNS = [
+    'first_name', 'last_name', 'email', 'phone', 'dob', 'membership_id',
+    'city', 'school', 'interests', 'character', 'frequency', 'source',
+    'source_detail', 'message', 'color', 'newsletter', 'guessed_gender',
+    'full_body'
+]
+
+# Audit log actions written by the CSV import
+ACTION_CREATED = "Vytvořeno importem"
+ACTION_RESTORED = "Obnoveno importem"
+ACTION_DUPLICATE = "Pokus o import (duplicita)"
+
+
+class ImportTooLargeError(ValueError):
+    """Raised when an uploaded file exceeds the configured size limit"""
+
+
+def save_upload(stream, path, max_size=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Copy an uploaded file stream to disk in chunks.
+
+    Args:
+        stream: Readable binary stream of the upload
+        path: Destination path on disk
+        max_size: Maximum allowed size in bytes (None = unlimited)
+        chunk_size: Size of the blocks read from the stream
+
+    Returns:
+        Number of bytes written
+
+    Raises:
+        ImportTooLargeError: If the upload exceeds max_size. The partial
+            file is removed.
+    """
+    size = 0
+    try:
+        with open(path, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size and size > max_size:
+                    raise ImportTooLargeError(
+                        f"Soubor je příliš velký (limit {max_size // (1024 * 1024)} MB)"
+                    )
+                out.write(chunk)
+    except ImportTooLargeError:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return size
+
+
+def open_csv(path):
+    """Open a saved CSV file for incremental UTF-8 decoding (BOM tolerant)"""
+    return io.TextIOWrapper(open(path, 'rb'), encoding='utf-8-sig', newline='')
+
+
+def is_xlsx(path):
+    """Return True if a saved upload is an XLSX workbook (a ZIP archive)"""
+    with open(path, 'rb') as f:
+        return f.read(4) == b'PK\x03\x04'
+
+
+def _xlsx_cell_text(value):
+    """Convert an XLSX cell value to the text a CSV export would contain"""
+    if value is None:
+        return ''
+    if isinstance(value, date):  # datetime too
+        return value.strftime('%d.%m.%Y')
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))  # membership ids and phone numbers typed as numbers
+    return str(value)
+
+
+def iter_xlsx_rows(path):
+    """
+    Yield the rows of the first worksheet as lists of strings.
+
+    The workbook is opened in read-only mode, which streams the sheet XML
+    instead of building the whole workbook in memory. Empty rows are
+    yielded as empty lists, like csv.reader does for blank lines.
+    """
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            values = [_xlsx_cell_text(value) for value in row]
+            # Read-only sheets pad rows to the sheet width with empty cells
+            while values and not values[-1]:
+                values.pop()
+            yield values
+    finally:
+        workbook.close()
+
+
+def file_sha256(path, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Return the SHA-256 hex digest of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _parse_row(extract, values):
+    """Parse one CSV row, returning (data, error) instead of raising"""
+    try:
+        return extract(values), None
+    except Exception as e:
+        return None, str(e)
+
+
+def split_csv_ranges(path, parts, block_size=1024 * 1024):
+    """
+    Split a CSV file into byte ranges aligned on record boundaries.
+
+    A boundary is a newline outside of a quoted field, found by tracking
+    the parity of quote characters (escaped quotes are doubled, so they
+    do not change it). The first boundary ends the header line.
+
+    Returns:
+        Tuple (header_end, ranges) where ranges is a list of (start, end)
+        byte offsets covering the data rows
+    """
+    size = os.path.getsize(path)
+    targets = [size * i // parts for i in range(parts)]
+    boundaries = []
+    quotes_before = 0
+    block_start = 0
+
+    with open(path, 'rb') as f:
+        while targets:
+            block = f.read(block_size)
+            if not block:
+                break
+            block_end = block_start + len(block)
+            search_from = 0
+            while targets and targets[0] < block_end:
+                pos = max(targets[0] - block_start, search_from)
+                newline = block.find(b'\n', pos)
+                if newline == -1:
+                    break
+                if (quotes_before + block.count(b'"', 0, newline)) % 2 == 0:
+                    boundary = block_start + newline + 1
+                    if not boundaries or boundary > boundaries[-1]:
+                        boundaries.append(boundary)
+                    targets.pop(0)
+                    # Targets behind the boundary just found collapse into it
+                    while targets and targets[0] < boundary:
+                        targets.pop(0)
+                search_from = newline + 1
+            quotes_before += block.count(b'"')
+            block_start = block_end
+
+    if not boundaries:
+        return size, []
+    header_end = boundaries[0]
+    edges = boundaries + ([size] if boundaries[-1] < size else [])
+    return header_end, list(zip(edges[:-1], edges[1:]))
+
+
+def _parse_csv_range(args):
+    """Worker: parse the rows in one byte range (runs in a pool process)"""
+    path, start, end, fieldnames, aliases = args
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('utf-8')
+
+    extract = compile_csv_header(fieldnames, aliases)
+    return [
+        _parse_row(extract, values)
+        for values in csv.reader(io.StringIO(text, newline=''))
+        if values  # blank lines are skipped
+    ]
+
+
+def _iter_extracted(rows, aliases):
+    """Parse rows (header first) with a compiled header, skipping blank rows"""
+    rows = iter(rows)
+    extract = compile_csv_header(next(rows, []), aliases)
+    row_no = 0
+    for values in rows:
+        if not values:
+            continue
+        yield (row_no, *_parse_row(extract, values))
+        row_no += 1
+
+
+def iter_parsed_rows(path, workers=1, aliases=None):
+    """
+    Yield (row_no, data, error) for each data row of a CSV or XLSX file, in order.
+
+    With workers > 1 the file is split into byte ranges aligned on record
+    boundaries and parsed in a process pool; results are still yielded in
+    file order so a single writer can consume them. Files below
+    PARALLEL_MIN_SIZE are always parsed serially.
+
+    The header is resolved once per file (see compile_csv_header);
+    aliases adds extra header spellings per canonical field. XLSX
+    workbooks are always streamed serially.
+    """
+    if is_xlsx(path):
+        yield from _iter_extracted(iter_xlsx_rows(path), aliases)
+        return
+
+    size = os.path.getsize(path)
+    if workers <= 1 or size < PARALLEL_MIN_SIZE:
+        with open_csv(path) as f:
+            yield from _iter_extracted(csv.reader(f), aliases)
+        return
+
+    parts = max(workers * 4, size // PARALLEL_RANGE_SIZE)
+    header_end, ranges = split_csv_ranges(path, parts)
+    with open(path, 'rb') as f:
+        header = f.read(header_end).decode('utf-8-sig')
+    fieldnames = next(csv.reader(io.StringIO(header, newline='')), [])
+
+    tasks = ((path, start, end, fieldnames, aliases) for start, end in ranges)
+    row_no = 0
+    for results in ordered_pool_map(_parse_csv_range, tasks, workers):
+        for data, error in results:
+            yield row_no, data, error
+            row_no += 1
+
+
+def discard_staged_jobs(conn, user_email, max_age_hours=STAGED_MAX_AGE_HOURS):
+    """
+    Drop staged rows of previews that will not be confirmed.
+
+    Covers earlier unconfirmed previews of the same user and any staged
+    preview older than max_age_hours. Interrupted (running) jobs are kept
+    so they can be resumed.
+    """
+    stale = conn.execute('''
+        SELECT id FROM import_jobs
+        WHERE status = 'staged'
+          AND (user = ? OR created_at < datetime('now', ?))
+    ''', (user_email, f'-{max_age_hours} hours')).fetchall()
+    for job in stale:
+        conn.execute('DELETE FROM import_staged_rows WHERE job_id = ?', (job[0],))
+        conn.execute("UPDATE import_jobs SET status = 'discarded' WHERE id = ?", (job[0],))
+
+
+def stage_import(conn, path, user_email, workers=1, aliases=None):
+    """
+    Parse a saved CSV file once into import_staged_rows and classify it.
+
+    Creates an import job in the 'staged' state. Rows that fail to parse
+    are staged with their error and action 'error'.
+
+    Returns:
+        The import_jobs row (sqlite3.Row)
+    """
+    discard_staged_jobs(conn, user_email)
+
+    cursor = conn.execute(
+        "INSERT INTO import_jobs (file_hash, user, status) VALUES (?, ?, 'staged')",
+        (file_sha256(path), user_email)
+    )
+    job_id = cursor.lastrowid
+    report_path = os.path.join(os.path.dirname(path), f'import_job_{job_id}_errors.csv')
+
+    cols = ', '.join(IMPORT_COLUMNS)
+    placeholders = ', '.join(['?' for _ in IMPORT_COLUMNS])
+    conn.executemany(
+        f'''INSERT INTO import_staged_rows (job_id, row_no, {cols}, action, error)
+            VALUES (?, ?, {placeholders}, ?, ?)''',
+        (
+            (job_id, row_no, *[(data or {}).get(col) for col in IMPORT_COLUMNS],
+             'error' if error else None, error)
+            for row_no, data, error in iter_parsed_rows(path, workers=workers, aliases=aliases)
+        )
+    )
+
+    # Only the first occurrence of an email in the file can create or restore an applicant
+    conn.execute('''
+        UPDATE import_staged_rows SET is_first = row_no IN (
+            SELECT MIN(row_no) FROM import_staged_rows
+            WHERE job_id = ? AND error IS NULL
+            GROUP BY email
+        )
+        WHERE job_id = ? AND error IS NULL
+    ''', (job_id, job_id))
+
+    classify_staged_rows(conn, job_id)
+
+    total = conn.execute('SELECT COUNT(*) FROM import_staged_rows WHERE job_id = ?', (job_id,)).fetchone()[0]
+    conn.execute('UPDATE import_jobs SET total_rows = ?, report_path = ? WHERE id = ?', (total, report_path, job_id))
+    conn.commit()
+
+    return conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def classify_staged_rows(conn, job_id, first_row=0, last_row=None):
+    """
+    Classify staged rows against the applicants table by email.
+
+    - new: email not in the database and first occurrence in the file
+    - restore: first occurrence matching a soft-deleted applicant
+    - duplicate: everything else (existing active applicant or a repeated
+      email within the file)
+
+    Existing applicants are matched with the email index (lowest id wins,
+    as with a per-row lookup).
+    """
+    if last_row is None:
+        last_row = 2 ** 62
+    conn.execute('''
+        UPDATE import_staged_rows SET
+            match_id = (SELECT MIN(a.id) FROM applicants a WHERE a.email = import_staged_rows.email)
+        WHERE job_id = ? AND row_no BETWEEN ? AND ? AND error IS NULL
+    ''', (job_id, first_row, last_row))
+    conn.execute('''
+        UPDATE import_staged_rows SET action = CASE
+            WHEN NOT is_first THEN 'duplicate'
+            WHEN match_id IS NULL THEN 'new'
+            WHEN (SELECT a.deleted FROM applicants a WHERE a.id = import_staged_rows.match_id) THEN 'restore'
+            ELSE 'duplicate'
+        END
+        WHERE job_id = ? AND row_no BETWEEN ? AND ? AND error IS NULL
+    ''', (job_id, first_row, last_row))
+
+
+def get_staged_counts(conn, job_id):
+    """
+    Summarize a staged import for the preview.
+
+    Returns:
+        Dictionary with 'total', 'new' (created or restored), 'duplicates'
+        and 'errors' counts
+    """
+    counts = dict(conn.execute(
+        'SELECT action, COUNT(*) FROM import_staged_rows WHERE job_id = ? GROUP BY action', (job_id,)
+    ).fetchall())
+    return {
+        'total': sum(counts.values()),
+        'new': counts.get('new', 0) + counts.get('restore', 0),
+        'duplicates': counts.get('duplicate', 0),
+        'errors': counts.get('error', 0)
+    }
+
+
+def get_staged_page(conn, job_id, page=1, per_page=PREVIEW_PAGE_SIZE):
+    """
+    Return one page of staged rows for the preview table.
+
+    Returns:
+        Dictionary with 'rows', 'page' and 'pages'
+    """
+    total = conn.execute('SELECT COUNT(*) FROM import_staged_rows WHERE job_id = ?', (job_id,)).fetchone()[0]
+    pages = max((total + per_page - 1) // per_page, 1)
+    page = min(max(page, 1), pages)
+    rows = conn.execute('''
+        SELECT row_no, first_name, last_name, email, membership_id, action, error
+        FROM import_staged_rows
+        WHERE job_id = ?
+        ORDER BY row_no
+        LIMIT ? OFFSET ?
+    ''', (job_id, per_page, (page - 1) * per_page)).fetchall()
+    return {'rows': [dict(row) for row in rows], 'page': page, 'pages': pages}
+
+
+def find_unfinished_job(conn, path, user_email):
+    """
+    Return a staged or interrupted import job of the same user for the same file, if any.
+
+    Other users' jobs are never resumed: promoted rows are audited under
+    the user running the job, who has to be the one who uploaded the file.
+    """
+    return conn.execute('''
+        SELECT * FROM import_jobs
+        WHERE file_hash = ? AND user = ? AND status IN ('staged', 'running')
+        ORDER BY id DESC LIMIT 1
+    ''', (file_sha256(path), user_email)).fetchone()
+
+
+def promote_staged_rows(conn, job_id, first_row, last_row, user_email):
+    """
+    Write one range of staged rows to applicants and audit_logs.
+
+    The range is re-classified first, so changes made since the preview
+    are respected. Restores, inserts and audit entries are each a single
+    statement. The caller is responsible for committing.
+
+    Returns:
+        Number of created or restored applicants
+    """
+    in_range = 'job_id = ? AND row_no BETWEEN ? AND ?'
+    params = (job_id, first_row, last_row)
+
+    classify_staged_rows(conn, job_id, first_row, last_row)
+
+    conn.execute(f'''
+        UPDATE applicants SET deleted = 0
+        WHERE id IN (SELECT match_id FROM import_staged_rows WHERE {in_range} AND action = 'restore')
+    ''', params)
+
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM applicants').fetchone()[0]
+    cols = ', '.join(IMPORT_COLUMNS)
+    conn.execute(f'''
+        INSERT INTO applicants ({cols}, status, application_received)
+        SELECT {cols}, 'Nová', ? FROM import_staged_rows
+        WHERE {in_range} AND action = 'new'
+        ORDER BY row_no
+    ''', (datetime.now(), *params))
+
+    # Point new rows (and their repeats within the file) at the inserted applicants
+    conn.execute(f'''
+        UPDATE import_staged_rows SET
+            match_id = (SELECT MIN(a.id) FROM applicants a WHERE a.email = import_staged_rows.email AND a.id > ?)
+        WHERE {in_range} AND match_id IS NULL AND error IS NULL
+    ''', (max_id, *params))
+
+    conn.execute(f'''
+        INSERT INTO audit_logs (applicant_id, action, user)
+        SELECT match_id,
+               CASE action WHEN 'new' THEN ? WHEN 'restore' THEN ? ELSE ? END,
+               ?
+        FROM import_staged_rows
+        WHERE {in_range} AND error IS NULL
+        ORDER BY row_no
+    ''', (ACTION_CREATED, ACTION_RESTORED, ACTION_DUPLICATE, user_email, *params))
+
+    return conn.execute(
+        f"SELECT COUNT(*) FROM import_staged_rows WHERE {in_range} AND action IN ('new', 'restore')", params
+    ).fetchone()[0]
+
+
+def _import_chunk(conn, job_id, first_row, last_row, user_email, errors):
+    """
+    Promote one chunk of staged rows.
+
+    The chunk is written in bulk; if that fails, the rows are retried one
+    by one so a single bad row is reported instead of aborting the chunk.
+    Rows that failed to parse during staging are reported as well.
+    """
+    errors.extend(conn.execute('''
+        SELECT row_no, error FROM import_staged_rows
+        WHERE job_id = ? AND row_no BETWEEN ? AND ? AND error IS NOT NULL
+        ORDER BY row_no
+    ''', (job_id, first_row, last_row)).fetchall())
+
+    # Savepoints nest in an explicit transaction so the chunk commits together with its checkpoint
+    if not conn.in_transaction:
+        conn.execute('BEGIN')
+    conn.execute('SAVEPOINT import_chunk')
+    try:
+        count = promote_staged_rows(conn, job_id, first_row, last_row, user_email)
+        conn.execute('RELEASE import_chunk')
+        return count
+    except sqlite3.Error as e:
+        logger.warning(f"Bulk import of chunk failed, retrying row by row: {e}")
+        conn.execute('ROLLBACK TO import_chunk')
+        conn.execute('RELEASE import_chunk')
+
+    count = 0
+    row_numbers = [row[0] for row in conn.execute('''
+        SELECT row_no FROM import_staged_rows
+        WHERE job_id = ? AND row_no BETWEEN ? AND ? AND error IS NULL
+        ORDER BY row_no
+    ''', (job_id, first_row, last_row))]
+    for row_no in row_numbers:
+        conn.execute('SAVEPOINT import_row')
+        try:
+            count += promote_staged_rows(conn, job_id, row_no, row_no, user_email)
+            conn.execute('RELEASE import_row')
+        except sqlite3.Error as e:
+            conn.execute('ROLLBACK TO import_row')
+            conn.execute('RELEASE import_row')
+            conn.execute(
+                "UPDATE import_staged_rows SET action = 'error', error = ? WHERE job_id = ? AND row_no = ?",
+                (str(e), job_id, row_no)
+            )
+            errors.append((row_no, str(e)))
+    return count
+
+
+def _write_error_report(report_path, errors):
+    """Append per-row errors to the job's CSV report"""
+    new_file = not os.path.exists(report_path)
+    with open(report_path, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(['radek', 'chyba'])
+        for row_no, message in errors:
+            # Report the line number in the file (header is line 1)
+            writer.writerow([row_no + 2, message])
+
+
+def run_import_job(conn, job_id, user_email, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Promote the staged rows of an import job in committed chunks.
+
+    Each chunk is committed together with the job checkpoint (last
+    imported row), so running the job again after a crash or interruption
+    continues after the last committed chunk. Per-row errors are written
+    to the job's report file. Staged rows are removed once the job is done.
+
+    Returns:
+        The finished import_jobs row (sqlite3.Row)
+    """
+    conn.execute(
+        "UPDATE import_jobs SET status = 'running', run_started_at = ?, run_start_row = last_row WHERE id = ?",
+        (time.time(), job_id)
+    )
+    conn.commit()
+    job = conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+    if job['last_row'] >= 0:
+        logger.info(f"Resuming import job {job_id} after row {job['last_row']}")
+
+    first_row = job['last_row'] + 1
+    while first_row < job['total_rows']:
+        last_row = min(first_row + chunk_size, job['total_rows']) - 1
+        errors = []
+        count = _import_chunk(conn, job_id, first_row, last_row, user_email, errors)
+        if errors:
+            _write_error_report(job['report_path'], errors)
+        conn.execute('''
+            UPDATE import_jobs SET
+                last_row = ?,
+                imported_count = imported_count + ?,
+                error_count = error_count + ?,
+                updated_at = ?
+            WHERE id = ?
+        ''', (last_row, count, len(errors), time.time(), job_id))
+        conn.commit()
+        first_row = last_row + 1
+
+    conn.execute("UPDATE import_jobs SET status = 'done', updated_at = ? WHERE id = ?", (time.time(), job_id))
+    conn.execute('DELETE FROM import_staged_rows WHERE job_id = ?', (job_id,))
+    conn.commit()
+    return conn.execute('SELECT * FROM import_jobs WHERE id = ?', (job_id,)).fetchone()
+
+
+def get_job_progress(job, now=None):
+    """
+    Summarize an import job for the progress endpoint.
+
+    Rows per second are measured over the current run (a resumed job does
+    not count rows committed before the restart).
+    """
+    now = now or time.time()
+    processed = job['last_row'] + 1
+    total = job['total_rows'] or 0
+    elapsed = max(now - (job['run_started_at'] or now), 0)
+    run_rows = processed - (job['run_start_row'] + 1)
+
+    rows_per_second = run_rows / elapsed if elapsed > 0 and run_rows > 0 else 0.0
+    remaining = max(total - processed, 0)
+    eta_seconds = remaining / rows_per_second if rows_per_second else None
+
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'total': total,
+        'processed': processed,
+        'imported': job['imported_count'],
+        'errors': job['error_count'],
+        'rows_per_second': round(rows_per_second, 1),
+        'eta_seconds': round(eta_seconds, 1) if eta_seconds is not None else None
+    }
@@ -0,0 +1,261 @@
+"""
+Email ingestion shared by fetch confirm and the IMAP IDLE listener
+
+Takes fetched emails through parse → dedupe → insert on one connection:
+applicants already present (by membership ID, or by email and name) are
+restored when soft-deleted and otherwise skipped, new ones are inserted
+with an audit log entry. Matching is one join over a temp table of the
+parsed batch and the writes are executemany statements in the caller's
+transaction. The mailbox checkpoint is advanced past the processed
+emails; the caller commits.
+
+Every message that ended up as an applicant is recorded in
+ingested_messages (Message-ID, body hash, applicant ID). Messages found
+there are skipped before parsing, without duplicate checks or audit
+entries, as long as their applicant still exists. Messages without a
+Message-ID are recognised by the SHA-256 of their body.
+
+New applicants keep the form version and needs_review flag of their
+email, so applications sent to a manual check can be found later (the
+alerts filter and ?needs_review=true of the applicant list).
+"""
+import logging
+from datetime import datetime
+
+from src.mailbox_sync import advance_checkpoint
+from src.parse_cache import parse_email_bodies_cached, body_hash
+
+logger = logging.getLogger(__name__)
+
+# Applicant columns filled from a parsed email
+EMAIL_COLUMNS = [
+    'first_name', 'last_name', 'email', 'phone', 'dob', 'city', 'school',
+    'interests', 'character', 'status', 'newsletter', 'source',
+    'source_detail', 'message', 'color', 'guessed_gender', 'membership_id',
+    'application_received', 'form_version', 'needs_review'
+]
+
+# Names of the required form questions in operator messages (see parser.REQUIRED_FORM_FIELDS)
+REQUIRED_FIELD_NAMES = {'first_name': 'jméno', 'last_name': 'příjmení', 'email': 'e-mail'}
+
+# Message keys per SELECT (stays below SQLite's bound parameter limit)
+LOOKUP_BATCH_SIZE = 400
+
+
+def _message_id(raw):
+    return (getattr(raw, 'message_id', None) or '').strip() or None
+
+
+def find_ingested(conn, message_ids, body_hashes):
+    """
+    Return the Message-IDs and body hashes (of messages without a Message-ID)
+    already ingested into applicants that still exist, as one set.
+    """
+    message_ids = sorted(set(message_ids))
+    body_hashes = sorted(set(body_hashes))
+    found = set()
+    for i in range(0, max(len(message_ids), len(body_hashes)), LOOKUP_BATCH_SIZE):
+        ids = message_ids[i:i + LOOKUP_BATCH_SIZE]
+        hashes = body_hashes[i:i + LOOKUP_BATCH_SIZE]
+        rows = conn.execute(f'''
+            SELECT m.message_id, m.body_hash FROM ingested_messages m
+            JOIN applicants a ON a.id = m.applicant_id
+            WHERE m.message_id IN ({', '.join('?' for _ in ids)})
+               OR (m.message_id IS NULL AND m.body_hash IN ({', '.join('?' for _ in hashes)}))
+        ''', (*ids, *hashes)).fetchall()
+        for message_id, digest in rows:
+            found.add(message_id if message_id is not None else digest)
+    return found
+
+
+def record_ingested(conn, entries):
+    """Remember (message_id, body_hash, applicant_id) of imported messages (the caller commits)"""
+    now = datetime.now()
+    conn.executemany('''
+        INSERT INTO ingested_messages (message_id, body_hash, applicant_id, ingested_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (message_id) WHERE message_id IS NOT NULL DO UPDATE SET
+            body_hash = excluded.body_hash, applicant_id = excluded.applicant_id, ingested_at = excluded.ingested_at
+    ''', [(message_id, digest, applicant_id, now) for message_id, digest, applicant_id in entries])
+
+
+def _match_existing(conn, incoming):
+    """
+    Match parsed emails against applicants with one join over a temp table.
+
+    Args:
+        incoming: (pos, membership_id, first_name, last_name, email) rows
+
+    Returns:
+        {pos: (by_membership, by_name)}, each (id, deleted) or None
+    """
+    conn.execute('''
+        CREATE TEMP TABLE IF NOT EXISTS incoming_emails (
+            pos INTEGER PRIMARY KEY,
+            membership_id TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            email TEXT
+        )
+    ''')
+    conn.execute('DELETE FROM incoming_emails')
+    conn.executemany('INSERT INTO incoming_emails VALUES (?, ?, ?, ?, ?)', incoming)
+    rows = conn.execute('''
+        WITH by_membership AS (
+            SELECT i.pos, MIN(a.id) AS id FROM incoming_emails i
+            JOIN applicants a ON a.membership_id = i.membership_id
+            GROUP BY i.pos
+        ), by_name AS (
+            SELECT i.pos, MIN(a.id) AS id FROM incoming_emails i
+            JOIN applicants a ON a.email = i.email AND a.first_name = i.first_name AND a.last_name = i.last_name
+            GROUP BY i.pos
+        )
+        SELECT i.pos, m.id, m.deleted, n.id, n.deleted FROM incoming_emails i
+        LEFT JOIN by_membership bm ON bm.pos = i.pos
+        LEFT JOIN applicants m ON m.id = bm.id
+        LEFT JOIN by_name bn ON bn.pos = i.pos
+        LEFT JOIN applicants n ON n.id = bn.id
+    ''').fetchall()
+    conn.execute('DROP TABLE incoming_emails')
+    return {pos: ((member_id, member_deleted) if member_id is not None else None,
+                  (name_id, name_deleted) if name_id is not None else None)
+            for pos, member_id, member_deleted, name_id, name_deleted in rows}
+
+
+def _insert_applicants(conn, rows):
+    """
+    Insert applicant dicts with executemany, one statement per run of rows with
+    the same columns so that IDs follow input order. Returns {membership_id: id}.
+    """
+    runs = []
+    for row in rows:
+        keys = tuple(k for k in EMAIL_COLUMNS if k in row)
+        if not runs or runs[-1][0] != keys:
+            runs.append((keys, []))
+        runs[-1][1].append([row[k] for k in keys])
+
+    for keys, values in runs:
+        conn.executemany(f'''
+            INSERT INTO applicants ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)})
+        ''', values)
+
+    membership_ids = [row['membership_id'] for row in rows]
+    ids = {}
+    for i in range(0, len(membership_ids), LOOKUP_BATCH_SIZE):
+        chunk = membership_ids[i:i + LOOKUP_BATCH_SIZE]
+        ids.update(conn.execute(f'''
+            SELECT membership_id, MAX(id) FROM applicants
+            WHERE membership_id IN ({', '.join('?' for _ in chunk)}) GROUP BY membership_id
+        ''', chunk).fetchall())
+    return ids
+
+
+def _review_message(email_addr, parsed):
+    """Operator message for an applicant created from an email that needs a manual check"""
+    if parsed.get('form_version') is None:
+        return f"Email {email_addr}: Neznámý formát formuláře, zkontrolujte údaje přihlášky."
+    missing = ', '.join(REQUIRED_FIELD_NAMES.get(field, field) for field in parsed.get('missing_fields') or [])
+    return f"Email {email_addr}: Chybí povinné údaje ({missing}), zkontrolujte údaje přihlášky."
+
+
+def ingest_emails(conn, raw_emails, user_email, workers=1, sync_key=None):
+    """
+    Import fetched emails as applicants.
+
+    All emails are parsed first and matched against applicants in one join
+    (by membership ID, then by email and name). An ordered pass then decides
+    per email between insert, restore and duplicate, also against applicants
+    created earlier in the same batch, and the rows are written with
+    executemany.
+
+    Args:
+        conn: Database connection (sqlite3.Row factory), committed by the caller
+        raw_emails: FetchedEmail tuples (or (uid, body, date) tuples)
+        user_email: User recorded in the audit log
+        workers: Process pool size for parsing large batches
+        sync_key: Mailbox whose checkpoint moves past these emails (see src.mailbox_sync)
+
+    Returns:
+        (count, errors): applicants created or restored, and messages for the operator
+    """
+    errors = []
+    keys = [(_message_id(raw), body_hash(raw[1])) for raw in raw_emails]
+    ingested = find_ingested(conn, [message_id for message_id, _ in keys if message_id],
+                             [digest for message_id, digest in keys if not message_id])
+    pending = [(raw[1], key) for raw, key in zip(raw_emails, keys) if (key[0] or key[1]) not in ingested]
+    if len(pending) < len(raw_emails):
+        logger.info(f"Skipping {len(raw_emails) - len(pending)} already ingested emails")
+
+    parsed_emails = parse_email_bodies_cached(conn, [body for body, _ in pending], workers=workers) if pending else []
+
+    matches = _match_existing(conn, [
+        (pos, parsed.get('membership_id'), parsed.get('first_name'), parsed.get('last_name'),
+         parsed.get('email', 'Unknown'))
+        for pos, parsed in enumerate(parsed_emails) if parsed.get('membership_id')
+    ])
+
+    # Ordered pass: each decision sees the restores and inserts of the emails before it.
+    # Applicants inserted in this batch are referenced by membership ID until they have an ID.
+    now = datetime.now()
+    restored = set()
+    batch_members = {}
+    batch_names = {}
+    new_rows = []
+    restores = []
+    audits = []
+    imported = []
+
+    for pos, (parsed, (_, (message_id, digest))) in enumerate(zip(parsed_emails, pending)):
+        email_addr = parsed.get('email', 'Unknown')
+        mem_id = parsed.get('membership_id')
+
+        if not mem_id:
+            errors.append(f"Email {email_addr}: Chybí členské číslo. Nelze vytvořit přihlášku.")
+            continue
+
+        by_membership, by_name = matches.get(pos, (None, None))
+        name_key = (email_addr, parsed.get('first_name'), parsed.get('last_name'))
+        if by_membership is None and mem_id in batch_members:
+            by_membership = (batch_members[mem_id], False)
+        if by_name is None and name_key in batch_names:
+            by_name = (batch_names[name_key], False)
+        existing = by_membership or by_name
+
+        if existing:
+            applicant, deleted = existing
+            imported.append((message_id, digest, applicant))
+            if deleted and applicant not in restored:
+                restored.add(applicant)
+                restores.append((applicant,))
+                audits.append((applicant, "Obnoveno z emailu"))
+            else:
+                # Logged so the audit trail shows that an import was attempted
+                audits.append((applicant, "Pokus o import z emailu (duplicita)"))
+            continue
+
+        parsed['status'] = 'Nová'
+        parsed['application_received'] = now
+        new_rows.append(parsed)
+        new_applicant = ('new', mem_id)
+        batch_members[mem_id] = new_applicant
+        if None not in name_key:
+            batch_names[name_key] = new_applicant
+        imported.append((message_id, digest, new_applicant))
+        audits.append((new_applicant, "Vytvořeno z emailu"))
+
+        if parsed.get('needs_review'):
+            errors.append(_review_message(email_addr, parsed))
+
+    new_ids = _insert_applicants(conn, new_rows)
+
+    def resolve(applicant):
+        return new_ids[applicant[1]] if isinstance(applicant, tuple) else applicant
+
+    conn.executemany('UPDATE applicants SET deleted = 0 WHERE id = ?', restores)
+    conn.executemany('INSERT INTO audit_logs (applicant_id, action, user) VALUES (?, ?, ?)',
+                     [(resolve(applicant), action, user_email) for applicant, action in audits])
+    record_ingested(conn, [(message_id, digest, resolve(applicant)) for message_id, digest, applicant in imported])
+
+    if sync_key:
+        # Next fetch starts after the emails processed here (committed together with the applicants)
+        advance_checkpoint(conn, sync_key, raw_emails)
+    return len(new_rows) + len(restores), errors
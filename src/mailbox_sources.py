@@ -0,0 +1,302 @@
+"""
+Mailbox sources of application emails
+
+Applications arrive in more than one inbox: the main address and the
+forwarding addresses of partner schools. Each source is fetched in its
+own worker thread, so a slow or unreachable server only delays (or, past
+the timeout, drops) its own emails. The results are merged and
+de-duplicated by Message-ID, or by body hash for messages without one,
+before import; every source still gets its own checkpoint, spool and
+\\Seen flags.
+
+Sources come from the environment: EMAIL_USER / EMAIL_PASS / IMAP_SERVER
+is the main source, EMAIL_SOURCES lists the names of further sources,
+each configured by EMAIL_USER_<NAME>, EMAIL_PASS_<NAME> and
+IMAP_SERVER_<NAME>. Fetch counts, throughput and errors per source are
+kept in source_metrics (served by /fetch/sources).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from src import fetcher
+from src.ingest import ingest_emails
+from src.mailbox_sync import mailbox_key, advance_checkpoint
+from src.parse_cache import body_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IMAP_SERVER = 'imap.gmail.com'
+
+# Seconds a fetch waits for a source before reporting it as timed out
+SOURCE_TIMEOUT = 120
+
+
+class MailboxSource(namedtuple('MailboxSource', ['name', 'username', 'password', 'server'])):
+    """One IMAP account to fetch applications from"""
+    __slots__ = ()
+
+    @property
+    def key(self) -> str:
+        """Mailbox key of the source's checkpoint and spool (see src.mailbox_sync)"""
+        return mailbox_key(self.username, self.server)
+
+    def __repr__(self):
+        return f"MailboxSource({self.name!r}, {self.key!r})"
+
+
+def load_sources(environ: Optional[Mapping[str, str]] = None) -> List[MailboxSource]:
+    """Configured mailbox sources, main source first; a mailbox listed twice is fetched once"""
+    environ = os.environ if environ is None else environ
+    sources = []
+    if environ.get('EMAIL_USER') and environ.get('EMAIL_PASS'):
+        sources.append(MailboxSource('main', environ['EMAIL_USER'], environ['EMAIL_PASS'],
+                                     environ.get('IMAP_SERVER', DEFAULT_IMAP_SERVER)))
+
+    for name in filter(None, (name.strip() for name in environ.get('EMAIL_SOURCES', '').split(','))):
+        suffix = name.upper()
+        username = environ.get(f'EMAIL_USER_{suffix}')
+        password = environ.get(f'EMAIL_PASS_{suffix}')
+        if not username or not password:
+            logger.warning(f"Mailbox source {name}: EMAIL_USER_{suffix} or EMAIL_PASS_{suffix} not set, skipped")
+            continue
+        sources.append(MailboxSource(name, username, password,
+                                     environ.get(f'IMAP_SERVER_{suffix}', DEFAULT_IMAP_SERVER)))
+
+    unique = {}
+    for source in sources:
+        unique.setdefault(source.key, source)
+    return list(unique.values())
+
+
+def sources_key(sources: List[MailboxSource]) -> str:
+    """Key of a preview over these sources (the mailbox key itself for a single source)"""
+    return ' + '.join(source.key for source in sources)
+
+
+def describe_error(source: MailboxSource, error: str, sources: List[MailboxSource]) -> str:
+    """Operator message for a failed source, naming it when there are several"""
+    return error if len(sources) == 1 else f"Schránka {source.name}: {error}"
+
+
+class SourceMetrics:
+    """Fetch counters per source, shared by all requests of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+
+    def record(self, source: MailboxSource, messages: int, seconds: float, error: Optional[str] = None):
+        with self._lock:
+            metrics = self._sources.setdefault(source.key, {
+                'name': source.name, 'mailbox': source.key, 'fetches': 0, 'messages': 0, 'seconds': 0.0,
+                'errors': 0, 'last_fetch': None, 'last_rate': None, 'last_error': None,
+            })
+            metrics['fetches'] += 1
+            metrics['messages'] += messages
+            metrics['seconds'] += seconds
+            metrics['last_fetch'] = datetime.now().isoformat(timespec='seconds')
+            if error:
+                metrics['errors'] += 1
+                metrics['last_error'] = error
+            else:
+                metrics['last_rate'] = round(messages / seconds, 1) if seconds else None
+
+    def snapshot(self) -> List[dict]:
+        """Counters of every source fetched so far, with the overall messages per second"""
+        with self._lock:
+            return [dict(metrics, seconds=round(metrics['seconds'], 3),
+                         rate=round(metrics['messages'] / metrics['seconds'], 1) if metrics['seconds'] else None)
+                    for metrics in self._sources.values()]
+
+    def reset(self):
+        with self._lock:
+            self._sources.clear()
+
+
+source_metrics = SourceMetrics()
+
+
+def run_per_source(sources: List[MailboxSource], fn: Callable, timeout: float = SOURCE_TIMEOUT
+                   ) -> Tuple[Dict[str, object], Dict[str, str]]:
+    """
+    Call fn(source) for every source in its own thread.
+
+    Returns:
+        (results, errors): fn's results and error messages by source key,
+        in source order. Sources still running after the timeout are
+        reported as errors and left to finish in the background.
+    """
+    executor = ThreadPoolExecutor(max_workers=max(len(sources), 1), thread_name_prefix='mailbox-source')
+    futures = [(source, executor.submit(fn, source)) for source in sources]
+    wait([future for _, future in futures], timeout=timeout)
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results, errors = {}, {}
+    for source, future in futures:
+        if not future.done():
+            logger.error(f"Mailbox source {source.name}: no answer within {timeout} s")
+            errors[source.key] = f"Bez odpovědi do {timeout:g} s"
+            continue
+        try:
+            results[source.key] = future.result()
+        except Exception as e:
+            logger.error(f"Mailbox source {source.name}: {e}")
+            errors[source.key] = str(e)
+    return results, errors
+
+
+def fetch_sources(sources: List[MailboxSource], checkpoints: Mapping[str, object], connections: int = 1,
+                  pool=None, timeout: float = SOURCE_TIMEOUT) -> Tuple[Dict[str, list], Dict[str, str]]:
+    """
+    Fetch new emails of all sources concurrently (see fetcher.get_unread_emails).
+
+    Nothing is marked as read here: a source that times out keeps fetching
+    in the background and its emails are dropped, so \\Seen is set with
+    fetcher.mark_seen only after the import.
+
+    Returns:
+        (fetched, errors): emails and error messages by source key
+    """
+    def fetch(source):
+        start = time.perf_counter()
+        emails = fetcher.get_unread_emails(source.username, source.password, source.server,
+                                           mark_as_read=False, checkpoint=checkpoints.get(source.key),
+                                           connections=connections, pool=pool, raise_errors=True)
+        return emails, time.perf_counter() - start
+
+    results, errors = run_per_source(sources, fetch, timeout)
+    for source in sources:
+        if source.key in results:
+            emails, seconds = results[source.key]
+            source_metrics.record(source, len(emails), seconds)
+        else:
+            source_metrics.record(source, 0, 0.0, errors[source.key])
+    return {key: emails for key, (emails, _) in results.items()}, errors
+
+
+_DONE = object()
+
+# Body batches buffered per source between the fetch threads and a (slow) consumer
+SOURCE_QUEUE_BATCHES = 2
+
+
+def iter_source_batches(sources: List[MailboxSource], checkpoints: Mapping[str, object], first_batch_size=None,
+                        connections: int = 1, pool=None, timeout: float = SOURCE_TIMEOUT
+                        ) -> Iterator[Tuple[MailboxSource, Optional[list], Optional[str]]]:
+    """
+    Stream body batches of all sources as they arrive (see fetcher.iter_new_email_batches).
+
+    Yields (source, batch, None) per batch and (source, None, error) for a
+    source that failed or sent nothing for timeout seconds. At most
+    SOURCE_QUEUE_BATCHES batches per source wait for the consumer, so a
+    slow consumer slows the fetch down instead of buffering the mailboxes.
+    When the generator is closed (e.g. the client of a stream went away),
+    the fetch threads stop after their current batch.
+    """
+    arrived = queue.Queue(maxsize=SOURCE_QUEUE_BATCHES * max(len(sources), 1))
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        """Hand an item to the consumer; False once it stopped listening"""
+        while not stop.is_set():
+            try:
+                arrived.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fetch(source):
+        start = time.perf_counter()
+        count = 0
+        try:
+            for batch in fetcher.iter_new_email_batches(source.username, source.password, source.server,
+                                                        mark_as_read=False, checkpoint=checkpoints.get(source.key),
+                                                        first_batch_size=first_batch_size,
+                                                        connections=connections, pool=pool):
+                count += len(batch)
+                if not put((source, batch, None)):
+                    return
+            if not stop.is_set():
+                source_metrics.record(source, count, time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Mailbox source {source.name}: {e}")
+            if not stop.is_set():
+                source_metrics.record(source, count, time.perf_counter() - start, str(e))
+            put((source, None, str(e)))
+        finally:
+            put((source, _DONE, None))
+
+    for source in sources:
+        threading.Thread(target=fetch, args=(source,), name=f'mailbox-source-{source.name}', daemon=True).start()
+
+    running = {source.key: source for source in sources}
+    try:
+        while running:
+            try:
+                source, batch, error = arrived.get(timeout=timeout)
+            except queue.Empty:
+                stop.set()
+                for source in running.values():
+                    logger.error(f"Mailbox source {source.name}: no answer within {timeout} s")
+                    error = f"Bez odpovědi do {timeout:g} s"
+                    source_metrics.record(source, 0, 0.0, error)
+                    yield source, None, error
+                return
+            if batch is _DONE:
+                del running[source.key]
+            else:
+                yield source, batch, error
+    finally:
+        # Stop the fetch threads and free the batches nobody will read
+        stop.set()
+        while True:
+            try:
+                arrived.get_nowait()
+            except queue.Empty:
+                break
+
+
+def message_key(fetched) -> str:
+    """Identity of a fetched email across mailboxes: its Message-ID, else the body hash"""
+    message_id = (getattr(fetched, 'message_id', None) or '').strip()
+    return message_id or body_hash(fetched[1])
+
+
+def merge_fetched(fetched: Mapping[str, list]) -> list:
+    """Emails of all sources in source order, each message once"""
+    seen = set()
+    merged = []
+    for emails in fetched.values():
+        for email in emails:
+            key = message_key(email)
+            if key not in seen:
+                seen.add(key)
+                merged.append(email)
+    return merged
+
+
+def ingest_sources(conn, fetched: Mapping[str, list], user_email: str, workers: int = 1) -> Tuple[int, List[str]]:
+    """
+    Import the merged emails of all sources and advance each source's checkpoint.
+
+    Args:
+        fetched: Fetched emails by source key
+    Returns:
+        (count, errors) as ingest_emails; the caller commits
+    """
+    merged = merge_fetched(fetched)
+    if len(merged) < sum(len(emails) for emails in fetched.values()):
+        logger.info(f"Merged {sum(len(emails) for emails in fetched.values())} emails of "
+                    f"{len(fetched)} mailboxes into {len(merged)}")
+    count, errors = ingest_emails(conn, merged, user_email, workers=workers)
+    for key, emails in fetched.items():
+        advance_checkpoint(conn, key, emails)
+    return count, errors
@@ -0,0 +1,64 @@
+"""
+Persisted IMAP sync checkpoints
+
+The mailbox_sync table stores, per mailbox, the UIDVALIDITY and the
+highest UID already imported. Fetches then only ask the server for
+UIDs above that checkpoint instead of relying on the UNSEEN flag, which
+test mode never sets and anyone reading the inbox clears. A changed
+UIDVALIDITY invalidates the stored UIDs and the next fetch resyncs from
+the unread emails.
+"""
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Iterable, Optional
+
+from src.fetcher import Checkpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAILBOX = 'INBOX'
+
+
+def mailbox_key(username: str, server: str, mailbox: str = DEFAULT_MAILBOX) -> str:
+    """Identify a mailbox across accounts and servers"""
+    return f"{username}@{server}/{mailbox}"
+
+
+def load_checkpoint(conn, key: str) -> Optional[Checkpoint]:
+    """Return the stored checkpoint of a mailbox, or None before the first import"""
+    try:
+        row = conn.execute('SELECT uid_validity, last_uid FROM mailbox_sync WHERE mailbox = ?', (key,)).fetchone()
+    except sqlite3.OperationalError as e:
+        # Database not migrated yet: behave as before the first import
+        logger.warning(f"Mailbox checkpoint unavailable: {e}")
+        return None
+    return Checkpoint(row[0], row[1]) if row else None
+
+
+def advance_checkpoint(conn, key: str, emails: Iterable) -> Optional[Checkpoint]:
+    """
+    Move the checkpoint of a mailbox past the given fetched emails.
+
+    Only emails carrying a UIDVALIDITY (FetchedEmail) count. The stored
+    UID never moves backwards within the same UIDVALIDITY; a new
+    UIDVALIDITY replaces the checkpoint. The caller commits.
+    """
+    current = load_checkpoint(conn, key)
+    checkpoint = current
+    for fetched in emails:
+        uid_validity = getattr(fetched, 'uid_validity', None)
+        if uid_validity is None:
+            continue
+        uid = int(fetched.uid)
+        if checkpoint is None or checkpoint.uid_validity != uid_validity:
+            checkpoint = Checkpoint(uid_validity, uid)
+        elif uid > checkpoint.last_uid:
+            checkpoint = checkpoint._replace(last_uid=uid)
+
+    if checkpoint != current:
+        conn.execute('''
+            INSERT OR REPLACE INTO mailbox_sync (mailbox, uid_validity, last_uid, updated_at)
+            VALUES (?, ?, ?, ?)
+        ''', (key, checkpoint.uid_validity, checkpoint.last_uid, datetime.now()))
+    return checkpoint
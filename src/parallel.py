@@ -0,0 +1,30 @@
+"""
+Process pool helpers
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+
+
+def ordered_pool_map(fn, items, workers, prefetch=2):
+    """
+    Map fn over items in a process pool, yielding results in input order.
+
+    Unlike ProcessPoolExecutor.map, items are submitted lazily: at most
+    workers * prefetch tasks are in flight, so a slow consumer or a long
+    input iterable never buffers everything in memory.
+
+    Args:
+        fn: Picklable top-level function
+        items: Iterable of arguments (one per call)
+        workers: Number of worker processes
+        prefetch: Tasks queued per worker ahead of the consumer
+    """
+    window = max(workers * prefetch, 1)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,111 @@
+"""
+Parse result cache for email bodies
+
+Parsed bodies are stored in the parse_cache table keyed by the SHA-256 of
+the body and the parser version, so the same message is parsed only once
+across fetch preview, confirm and later runs. A parser upgrade changes
+PARSER_VERSION, which makes older entries unreachable; they are dropped
+by the next eviction. Beyond max_entries the least recently used entries
+are evicted.
+"""
+import hashlib
+import json
+import logging
+import time
+
+from src import parser
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of cached parse results
+PARSE_CACHE_MAX_ENTRIES = 20000
+
+# Hashes per SELECT (stays below SQLite's bound parameter limit)
+LOOKUP_BATCH_SIZE = 500
+
+
+def body_hash(body):
+    """Return the SHA-256 hex digest of an email body"""
+    return hashlib.sha256(body.encode('utf-8', errors='surrogatepass')).hexdigest()
+
+
+def _load(conn, hashes):
+    """Return {body_hash: result} for the cached hashes of the current parser version"""
+    cached = {}
+    for i in range(0, len(hashes), LOOKUP_BATCH_SIZE):
+        batch = hashes[i:i + LOOKUP_BATCH_SIZE]
+        rows = conn.execute(
+            f'''SELECT body_hash, result FROM parse_cache
+                WHERE parser_version = ? AND body_hash IN ({', '.join('?' for _ in batch)})''',
+            (parser.PARSER_VERSION, *batch)
+        ).fetchall()
+        cached.update((row[0], row[1]) for row in rows)
+    return cached
+
+
+def evict(conn, max_entries=PARSE_CACHE_MAX_ENTRIES):
+    """Drop entries of other parser versions and the least recently used ones beyond max_entries"""
+    conn.execute('DELETE FROM parse_cache WHERE parser_version != ?', (parser.PARSER_VERSION,))
+    excess = conn.execute('SELECT COUNT(*) FROM parse_cache').fetchone()[0] - max_entries
+    if excess > 0:
+        conn.execute('''
+            DELETE FROM parse_cache WHERE rowid IN (
+                SELECT rowid FROM parse_cache ORDER BY last_used LIMIT ?
+            )
+        ''', (excess,))
+
+
+def parse_email_bodies_cached(conn, bodies, workers=1, max_entries=PARSE_CACHE_MAX_ENTRIES):
+    """
+    Parse email bodies through the parse cache.
+
+    Cached results are reused; the remaining bodies are parsed with
+    parse_email_bodies (in a process pool when workers > 1) and stored.
+    Identical bodies within the batch are parsed once. The cache changes
+    are committed on conn.
+
+    Returns:
+        List of parse results in input order (each a separate dict)
+    """
+    bodies = list(bodies)
+    hashes = [body_hash(body) for body in bodies]
+    cached = _load(conn, list(set(hashes)))
+
+    missing = {}
+    for digest, body in zip(hashes, bodies):
+        if digest not in cached and digest not in missing:
+            missing[digest] = body
+
+    parsed = dict(zip(missing, parser.parse_email_bodies(missing.values(), workers=workers)))
+
+    now = time.time()
+    serialized = dict(cached)
+    for digest, data in parsed.items():
+        # The body itself is not stored; it is added back on a hit
+        try:
+            serialized[digest] = json.dumps(
+                {key: value for key, value in data.items() if key != 'full_body'}, ensure_ascii=False)
+        except TypeError:
+            logger.warning("Parse result of body %s is not serializable, not cached", digest[:12])
+    conn.executemany(
+        'INSERT OR REPLACE INTO parse_cache (body_hash, parser_version, result, last_used) VALUES (?, ?, ?, ?)',
+        [(digest, parser.PARSER_VERSION, serialized[digest], now) for digest in parsed if digest in serialized]
+    )
+    conn.executemany(
+        'UPDATE parse_cache SET last_used = ? WHERE body_hash = ? AND parser_version = ?',
+        [(now, digest, parser.PARSER_VERSION) for digest in cached]
+    )
+    evict(conn, max_entries)
+    conn.commit()
+    logger.debug("Parse cache: %d hits, %d parsed", len(cached), len(parsed))
+
+    results = []
+    for digest, body in zip(hashes, bodies):
+        data = parsed.pop(digest, None)  # first occurrence of a freshly parsed body
+        if data is None and digest in serialized:
+            data = json.loads(serialized[digest])
+            data['full_body'] = body
+        elif data is None:
+            data = dict(results[hashes.index(digest)])
+        results.append(data)
+    return results
@@ -1,8 +1,32 @@
 import re
-from typing import Dict, Optional
+import os
+import hashlib
+import logging
+from functools import lru_cache
+from itertools import chain, islice
+from operator import itemgetter
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 from src.gender_utils import guess_gender
+from src.parallel import ordered_pool_map
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Email bodies sent to a pool worker per task by parse_email_bodies
+EMAIL_PARSE_CHUNK_SIZE = 200
+
+def _source_digest(*paths):
+    """Short SHA-256 digest of source files"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+# Identifies the parser code; any change to it (or to gender guessing)
+# invalidates cached parse results (see src/parse_cache.py)
+PARSER_VERSION = _source_digest(__file__, os.path.join(os.path.dirname(__file__), 'gender_utils.py'))
+
 def datetime_cz(value):
     """Format datetime string to Czech format"""
     if not value:
@@ -93,77 +117,221 @@ def calculate_age(dob_str):
     except (ValueError, TypeError):
         return None
 
+# Registry of form versions (oldest first), each listing its question labels
+# in output order. A field's value is the rest of the line after the colon
+# following its label (for the e-mail question, after the last colon on the
+# line). A tuple lists wordings that occur in real submissions of the same
+# version (the form adapts "narodil/a" and the like); add a version only when
+# the form itself changes, instead of editing the labels of an existing one.
+FORM_SCHEMAS = {
+    '2024': {
+        'first_name': 'Jak se jmenuješ?',
+        'last_name': 'Jaké je tvé příjmení?',
+        'email': 'Kam ti můžeme poslat e-mail?',
+        'phone': 'Na jaké číslo ti můžeme zavolat?',
+        'dob': ('Kdy ses narodil?', 'Kdy ses narodil/a?'),
+        'city': 'Odkud pocházíš?',
+        'school': 'Kam chodíš do školy?',
+        'interests': 'Co tě nejvíc zajímá?',
+        'character': 'Jsi ...',
+        'frequency': 'Jak často během roku chceš navštěvovat doprovodný program Mladého diváka?',
+        'source': ('Odkud ses o nás dozvěděl?', 'Odkud ses o nás dozvěděl/a?'),
+        'source_detail': ('Odkud?', 'Jinde?'),
+        'message': 'Chceš nám něco říct?',
+        'color': 'Zelená nebo růžová?',
+        'newsletter': 'Nesouhlas se zasíláním novinek',
+    },
+}
+
+# Questions every application has; a body without one of them needs a manual check
+REQUIRED_FORM_FIELDS = ('first_name', 'last_name', 'email')
+
+def _normalize_label(label: str) -> str:
+    """Normalize a question label for fingerprinting (case and whitespace insensitive)"""
+    return ''.join(label.split()).casefold()
+
+def _compile_email_labels(labels: Dict[str, List[str]]):
+    """
+    Compile question labels into one alternation (the extractor of a form version).
+
+    Each alternative consumes only its label; the value is captured in a
+    lookahead (one group per field), so a scan with finditer finds every
+    label in a single pass even when one appears inside another answer.
+    A leading lookahead on the labels' first letters lets the scan skip
+    other positions without trying every alternative.
+    """
+    value = r'(?=\s*:[ \t]*([^\n]*))'
+    email_value = r'(?=[^\n]*:[ \t]*([^\n]*))'
+    alternatives = []
+    for field, options in labels.items():
+        # Whitespace before punctuation is optional, as in "Jsi ..." / "Jsi..."
+        label = '|'.join(re.sub(r'\\ (?=\W)', r'\\s*', re.escape(option)) for option in options)
+        alternatives.append(f'(?:{label})' + (email_value if field == 'email' else value))
+    first_letters = {option[0].lower() for options in labels.values() for option in options}
+    assert all(letter.isalpha() for letter in first_letters), "labels must start with a letter"
+    prefix = '(?=[' + ''.join(sorted(first_letters)) + '])'
+    return re.compile(prefix + '(?:' + '|'.join(alternatives) + ')', re.IGNORECASE), list(labels)
+
+def _label_options(labels) -> List[str]:
+    """Wordings of a field's label (a single label or a tuple of variants)"""
+    return [labels] if isinstance(labels, str) else list(labels)
+
+# Precompiled extractor per form version, plus one matching every known
+# wording for bodies whose layout is not recognised
+_FORM_EXTRACTORS = {
+    version: _compile_email_labels({field: _label_options(labels) for field, labels in schema.items()})
+    for version, schema in FORM_SCHEMAS.items()
+}
+_ANY_FORM_EXTRACTOR = _compile_email_labels({
+    field: list(dict.fromkeys(option for schema in FORM_SCHEMAS.values() if field in schema
+                              for option in _label_options(schema[field])))
+    for field in dict.fromkeys(field for schema in FORM_SCHEMAS.values() for field in schema)
+})
+_FORM_LABEL_SETS = {
+    version: frozenset(_normalize_label(option) for labels in schema.values() for option in _label_options(labels))
+    for version, schema in FORM_SCHEMAS.items()
+}
+_KNOWN_LABELS = frozenset().union(*_FORM_LABEL_SETS.values())
+
+# Text before the first colon of each line ("Question: answer")
+_LINE_LABEL_RE = re.compile(r'^([^:\n]*):', re.MULTILINE)
+
+@lru_cache(maxsize=4096)
+def _line_label(head: str) -> Optional[str]:
+    """
+    Normalized question label of a line head, or None if it is not one.
+
+    Known labels always count; other heads only when they look like a
+    question (end with '?'), so answers containing a colon do not change
+    the fingerprint. A trailing parenthesised hint is not part of the label.
+    """
+    head = head.strip()
+    if head.endswith(')') and '(' in head:
+        head = head[:head.rfind('(')]
+    label = _normalize_label(head)
+    if label in _KNOWN_LABELS or label.endswith('?'):
+        return label
+    return None
+
+def form_fingerprint(body: str) -> frozenset:
+    """Return the set of normalized question labels found at line starts"""
+    return frozenset(filter(None, map(_line_label, _LINE_LABEL_RE.findall(body))))
+
+@lru_cache(maxsize=256)
+def detect_form_version(fingerprint: frozenset) -> Optional[str]:
+    """
+    Return the newest form version whose labels cover the fingerprint.
+
+    Bodies may omit questions and use any wording variant of their
+    version, so any subset of a version's labels matches it. None means
+    an unknown layout: no known question was found, or there are labels
+    no single version has.
+    """
+    if not fingerprint:
+        return None
+    for version in reversed(FORM_SCHEMAS):
+        if fingerprint <= _FORM_LABEL_SETS[version]:
+            return version
+    return None
+
 def parse_email_body(body: str) -> Dict[str, str]:
     """
     Parses the email body to extract application details.
     
+    The body is fingerprinted from its question labels and parsed with
+    the extractor of the matching form version. Bodies with an unknown
+    layout are parsed with every known wording; they and bodies missing
+    one of REQUIRED_FORM_FIELDS are flagged with 'needs_review'.
+    
     Args:
         body: The raw text content of the email.
         
     Returns:
-        A dictionary containing specific fields (first_name, last_name, etc.)
-        and a 'full_text' field with the original Q&A.
+        A dictionary containing specific fields (first_name, last_name, etc.),
+        'form_version', 'needs_review', 'missing_fields' (required questions
+        not found) and a 'full_body' field with the original Q&A.
     """
     data = {}
     
-    # Normalize line endings
-    lines = body.strip().splitlines()
-    
     # Extract Membership ID (usually the last non-empty line)
     membership_id = None
-    for line in reversed(lines):
+    for line in reversed(body.strip().splitlines()):
         if line.strip().isdigit():
             membership_id = line.strip()
             break
     data['membership_id'] = membership_id
 
-    # Regex patterns for specific fields
-    # Using [ \t]* after colon to match spaces/tabs but NOT newlines
-    # Using [^\n]* to match until end of line (including empty values)
-    patterns = {
-        'first_name': r'Jak se jmenuješ\?\s*:[ \t]*([^\n]*)',
-        'last_name': r'Jaké je tvé příjmení\?\s*:[ \t]*([^\n]*)',
-        'email': r'Kam ti můžeme poslat e-mail\?[^\n]*:[ \t]*([^\n]*)',
-        'phone': r'Na jaké číslo ti můžeme zavolat\?\s*:[ \t]*([^\n]*)',
-        'dob': r'Kdy ses narodil(?:/a)?\?\s*:[ \t]*([^\n]*)',
-        'city': r'Odkud pocházíš\?\s*:[ \t]*([^\n]*)',
-        'school': r'Kam chodíš do školy\?\s*:[ \t]*([^\n]*)',
-        'interests': r'Co tě nejvíc zajímá\?\s*:[ \t]*([^\n]*)',
-        'character': r'Jsi\s*\.\.\.\s*:[ \t]*([^\n]*)',
-        'frequency': r'Jak často během roku chceš navštěvovat doprovodný program Mladého diváka\?\s*:[ \t]*([^\n]*)',
-        'source': r'Odkud ses o nás dozvěděl(?:/a)?\?\s*:[ \t]*([^\n]*)',
-        'source_detail': r'(?:Odkud\?|Jinde\?)\s*:[ \t]*([^\n]*)',
-        'message': r'Chceš nám něco říct\?\s*:[ \t]*([^\n]*)',
-        'color': r'Zelená nebo růžová\?\s*:[ \t]*([^\n]*)',
-        'newsletter': r'Nesouhlas se zasíláním novinek\s*:[ \t]*([^\n]*)',
-    }
+    version = detect_form_version(form_fingerprint(body))
+    labels_re, fields = _FORM_EXTRACTORS[version] if version else _ANY_FORM_EXTRACTOR
 
-    for key, pattern in patterns.items():
-        match = re.search(pattern, body, re.IGNORECASE)
-        if match:
-            data[key] = match.group(1).strip()
-        else:
-            data[key] = ""
+    # One scan over the body; the first occurrence of each label wins
+    found = {}
+    for match in labels_re.finditer(body):
+        field = fields[match.lastindex - 1]
+        if field not in found:
+            found[field] = match.group(match.lastindex).strip()
+    for field in fields:
+        data[field] = found.get(field, "")
 
     # Convert newsletter to Boolean
     # If "Nesouhlas se zasíláním novinek:" is empty, newsletter is TRUE
     # If it contains text, newsletter is FALSE
-    newsletter_text = data.get('newsletter', '').strip()
-    data['newsletter'] = 1 if not newsletter_text else 0
+    data['newsletter'] = 1 if not data['newsletter'] else 0
 
     # Guess Gender
-    data['guessed_gender'] = guess_gender(data.get('first_name', ''), data.get('last_name', ''))
+    data['guessed_gender'] = guess_gender(data['first_name'], data['last_name'])
+    
+    data['form_version'] = version
+    missing = [field for field in REQUIRED_FORM_FIELDS if field not in found]
+    data['missing_fields'] = missing
+    data['needs_review'] = version is None or bool(missing)
+    if version is None:
+        logger.warning("Unknown application form layout (membership id %s)", membership_id)
+    elif missing:
+        logger.warning("Application form without %s (membership id %s)", ', '.join(missing), membership_id)
     
     # Store the full body for the document
     data['full_body'] = body
     
-    # Debug logging
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"Parsed email: Name='{data.get('first_name')}' '{data.get('last_name')}', Gender='{data.get('guessed_gender')}'")
+    logger.debug("Parsed email: Name=%r %r, Gender=%r, Form=%s",
+                 data['first_name'], data['last_name'], data['guessed_gender'], version)
     
     return data
 
+def _parse_email_chunk(bodies: List[str]) -> List[Dict[str, str]]:
+    """Worker: parse a chunk of email bodies (runs in a pool process)"""
+    return [parse_email_body(body) for body in bodies]
+
+def parse_email_bodies(bodies: Iterable[str], workers: int = 1,
+                       chunk_size: int = EMAIL_PARSE_CHUNK_SIZE) -> Iterator[Dict[str, str]]:
+    """
+    Parse many email bodies, yielding results in input order.
+    
+    With workers > 1 the bodies are sent to a process pool in chunks of
+    chunk_size; at most a few chunks are in flight, so the input can be
+    a lazy iterable and the results can be streamed to the caller.
+    Batches smaller than one chunk are parsed in-process, where starting
+    a pool would cost more than it saves.
+    
+    Args:
+        bodies: Iterable of raw email bodies.
+        workers: Number of worker processes (1 = parse serially).
+        chunk_size: Bodies sent to a worker per task.
+        
+    Returns:
+        A generator of parse_email_body results.
+    """
+    bodies = iter(bodies)
+    first_chunk = list(islice(bodies, chunk_size))
+    if workers <= 1 or len(first_chunk) < chunk_size:
+        for body in chain(first_chunk, bodies):
+            yield parse_email_body(body)
+        return
+    
+    chunks = chain([first_chunk], iter(lambda: list(islice(bodies, chunk_size)), []))
+    for results in ordered_pool_map(_parse_email_chunk, chunks, workers):
+        yield from results
+
 def parse_csv_row(row: Dict[str, str]) -> Dict[str, str]:
     """
     Parses a CSV row dictionary into the application data format.
@@ -178,18 +346,13 @@ def parse_csv_row(row: Dict[str, str]) -> Dict[str, str]:
     # If field is empty, newsletter is TRUE (1)
     # If it contains text (disagreement), newsletter is FALSE (0)
     # Check multiple possible header names
-    newsletter_text = (
+    newsletter_value = _newsletter_value(
         row.get('marketingovy_nesouhlas') or 
         row.get('marketingový nesouhlas') or 
         row.get('Marketingový nesouhlas') or 
         row.get('souhlas') or 
         ''
-    ).strip()
-    
-    if newsletter_text.lower() == 'ano':
-        newsletter_value = 1
-    else:
-        newsletter_value = 1 if not newsletter_text else 0
+    )
     
     return {
         'first_name': row.get('jmeno', '').strip(),
@@ -222,6 +385,101 @@ def parse_csv_row(row: Dict[str, str]) -> Dict[str, str]:
         'full_body': ''  # CSV imports don't have email body
     }
 
+# Canonical CSV fields and the header spellings that map to them.
+# When several spellings are present, the first non-empty value wins.
+CSV_HEADER_ALIASES = {
+    'first_name': ['jmeno'],
+    'last_name': ['prijmeni'],
+    'email': ['email'],
+    'phone': ['telefon'],
+    'dob': ['datum_narozeni'],
+    'membership_id': [
+        'id', 'ID', 'cislo_karty', 'číslo_karty', 'cislo karty', 'číslo karty',
+        'membership_id', 'card_number'
+    ],
+    'city': ['bydliste'],
+    'school': ['skola'],
+    'interests': ['oblast_kultury'],
+    'character': ['povaha'],
+    'frequency': ['intenzita_vyuzivani'],
+    'source': ['zdroje'],
+    'source_detail': ['kde'],
+    'message': ['volne_sdeleni'],
+    'color': ['barvy'],
+    'newsletter': ['marketingovy_nesouhlas', 'marketingový nesouhlas', 'Marketingový nesouhlas', 'souhlas'],
+}
+
+def _newsletter_value(text: str) -> int:
+    """
+    Convert the newsletter disagreement column to a Boolean.
+    If field is empty (or 'ano'), newsletter is TRUE (1);
+    if it contains text (disagreement), newsletter is FALSE (0).
+    """
+    text = text.strip()
+    if text.lower() == 'ano':
+        return 1
+    return 1 if not text else 0
+
+# Conversion of a field's first non-empty value in compiled CSV rows; other fields are stripped
+_CSV_FIELD_CONVERTERS = {'newsletter': _newsletter_value}
+
+def compile_csv_header(fieldnames: List[str], aliases: Optional[Dict[str, List[str]]] = None) -> Callable:
+    """
+    Resolve a CSV header once and return a per-row extractor.
+
+    Every canonical field is mapped to the column indexes of its header
+    spellings. Fields read from a single column are taken with one
+    itemgetter and stripped; fields with several spellings take their
+    first non-empty value, and fields without a column keep a constant
+    default. Rows from csv.reader are thus converted without per-row
+    header lookups or fallback chains. The extractor returns the same
+    dictionary as parse_csv_row would for the equivalent DictReader row.
+    
+    Args:
+        fieldnames: The CSV header row.
+        aliases: Extra header spellings per canonical field, tried after
+            the defaults in CSV_HEADER_ALIASES.
+        
+    Returns:
+        A function taking a sequence of row values and returning the
+        mapped fields.
+    """
+    # As with DictReader, a repeated header name refers to its last column
+    columns = {name: index for index, name in enumerate(fieldnames)}
+    
+    template = {}  # output key order, with the values of fields that have no column
+    single_fields, single_indexes = [], []
+    fallbacks = []  # (field, itemgetter of its columns, converter)
+    width = 0
+    for field, names in CSV_HEADER_ALIASES.items():
+        names = names + (aliases or {}).get(field, [])
+        indexes = [columns[name] for name in names if name in columns]
+        width = max([width, *(index + 1 for index in indexes)])
+        convert = _CSV_FIELD_CONVERTERS.get(field, str.strip)
+        template[field] = convert('')
+        if len(indexes) == 1 and convert is str.strip:
+            single_fields.append(field)
+            single_indexes.append(indexes[0])
+        elif indexes:
+            fallbacks.append((field, itemgetter(*indexes, indexes[0]), convert))  # always a tuple
+    template['guessed_gender'] = None
+    template['full_body'] = ''  # CSV imports don't have email body
+    get_single = itemgetter(*single_indexes, 0) if single_indexes else None  # 0 keeps it a tuple; zip drops it
+    strip = str.strip
+    
+    def extract(values):
+        if len(values) < width:
+            values = list(values) + [''] * (width - len(values))  # DictReader restval
+        data = template.copy()
+        if get_single:
+            data.update(zip(single_fields, map(strip, get_single(values))))
+        for field, get, convert in fallbacks:
+            data[field] = convert(next(filter(None, get(values)), ''))
+        data['guessed_gender'] = guess_gender(data['first_name'], data['last_name'])
+        return data
+    
+    return extract
+
 if __name__ == "__main__":
     # Test with the sample provided
     sample_body = """
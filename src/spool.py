@@ -0,0 +1,133 @@
+"""
+Local spool of fetched application emails
+
+fetch_preview downloads the messages once and writes them here; fetch
+confirm imports from the spool instead of downloading the mailbox again
+and only tells the server to set \\Seen. Bodies are stored zlib
+compressed in spool_blobs, addressed by the SHA-256 of the body, and
+message_spool maps each (mailbox, UID) to its blob together with the
+UIDVALIDITY, Message-ID and date. Entries are released after confirm;
+spooled previews that are never confirmed expire after
+SPOOL_MAX_AGE_HOURS.
+
+Which UIDs a preview showed is stored in fetch_previews under a random
+token; only the token travels in the session cookie (or the streamed
+preview's 'done' event), so cookies stay small for any preview size.
+"""
+import json
+import secrets
+import zlib
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Union
+
+from src.fetcher import FetchedEmail
+from src.parse_cache import body_hash
+
+# Spooled previews older than this are purged
+SPOOL_MAX_AGE_HOURS = 24
+
+# UIDs per SELECT (stays below SQLite's bound parameter limit)
+LOOKUP_BATCH_SIZE = 500
+
+
+def purge_expired(conn, max_age_hours=SPOOL_MAX_AGE_HOURS):
+    """Drop spool entries and previews older than max_age_hours and blobs nothing refers to"""
+    cutoff = datetime.now() - timedelta(hours=max_age_hours)
+    conn.execute('DELETE FROM message_spool WHERE spooled_at < ?', (cutoff,))
+    conn.execute('DELETE FROM fetch_previews WHERE created_at < ?', (cutoff,))
+    conn.execute('DELETE FROM spool_blobs WHERE body_hash NOT IN (SELECT body_hash FROM message_spool)')
+
+
+def spool_emails(conn, key: str, emails: Iterable) -> List[str]:
+    """
+    Store fetched emails of a mailbox and return their UIDs in order.
+
+    Accepts FetchedEmail or (uid, body, date) tuples; re-spooling a UID
+    replaces its entry. Commits.
+    """
+    purge_expired(conn)
+    now = datetime.now()
+    uids = []
+    for fetched in emails:
+        uid, body, date = fetched[:3]
+        digest = body_hash(body)
+        conn.execute('INSERT OR IGNORE INTO spool_blobs (body_hash, body) VALUES (?, ?)',
+                     (digest, zlib.compress(body.encode('utf-8', errors='surrogatepass'))))
+        conn.execute('''
+            INSERT OR REPLACE INTO message_spool (mailbox, uid, uid_validity, message_id, date, body_hash, spooled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (key, str(uid), getattr(fetched, 'uid_validity', None), getattr(fetched, 'message_id', None),
+              date, digest, now))
+        uids.append(str(uid))
+    conn.commit()
+    return uids
+
+
+def load_spooled(conn, key: str, uids: List[str]) -> Optional[List[FetchedEmail]]:
+    """
+    Return the spooled emails for the UIDs in the given order.
+
+    Returns None if any of them is missing (expired or never spooled), so
+    the caller can fall back to fetching from the server.
+    """
+    found = {}
+    for i in range(0, len(uids), LOOKUP_BATCH_SIZE):
+        batch = uids[i:i + LOOKUP_BATCH_SIZE]
+        rows = conn.execute(f'''
+            SELECT s.uid, b.body, s.date, s.message_id, s.uid_validity
+            FROM message_spool s JOIN spool_blobs b ON b.body_hash = s.body_hash
+            WHERE s.mailbox = ? AND s.uid IN ({', '.join('?' for _ in batch)})
+        ''', (key, *batch)).fetchall()
+        for uid, body, date, message_id, uid_validity in rows:
+            found[uid] = FetchedEmail(uid, zlib.decompress(body).decode('utf-8', errors='surrogatepass'),
+                                      date, message_id, uid_validity)
+    if len(found) != len(set(uids)):
+        return None
+    return [found[str(uid)] for uid in uids]
+
+
+def release(conn, key: str, uids: List[str]):
+    """Remove imported emails from the spool (the caller commits)"""
+    for i in range(0, len(uids), LOOKUP_BATCH_SIZE):
+        batch = uids[i:i + LOOKUP_BATCH_SIZE]
+        conn.execute(f"DELETE FROM message_spool WHERE mailbox = ? AND uid IN ({', '.join('?' for _ in batch)})",
+                     (key, *batch))
+    conn.execute('DELETE FROM spool_blobs WHERE body_hash NOT IN (SELECT body_hash FROM message_spool)')
+
+
+def create_preview(conn, key: str, uids: Union[List[str], Dict[str, List[str]]]) -> str:
+    """
+    Record the UIDs shown by a preview and return its token. Commits.
+
+    uids is a list for a single mailbox, or UIDs by mailbox key for a
+    preview over several mailbox sources (key then names the sources).
+    """
+    if isinstance(uids, dict):
+        uids = {mailbox: [str(uid) for uid in mailbox_uids] for mailbox, mailbox_uids in uids.items()}
+    else:
+        uids = [str(uid) for uid in uids]
+    token = secrets.token_urlsafe(16)
+    conn.execute('INSERT INTO fetch_previews (token, mailbox, uids, created_at) VALUES (?, ?, ?, ?)',
+                 (token, key, json.dumps(uids), datetime.now()))
+    conn.commit()
+    return token
+
+
+def load_preview(conn, token: str) -> Optional[Dict[str, List[str]]]:
+    """
+    Return the UIDs recorded by create_preview by mailbox key, None for an unknown or expired token.
+
+    The token alone identifies the preview, so confirm finds it whatever
+    sources are configured by then.
+    """
+    row = conn.execute('SELECT mailbox, uids FROM fetch_previews WHERE token = ?', (token,)).fetchone()
+    if not row:
+        return None
+    uids = json.loads(row[1])
+    # A single-mailbox preview is stored under its mailbox key
+    return uids if isinstance(uids, dict) else {row[0]: uids}
+
+
+def drop_preview(conn, token: str):
+    """Forget a confirmed preview (the caller commits)"""
+    conn.execute('DELETE FROM fetch_previews WHERE token = ?', (token,))
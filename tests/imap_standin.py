@@ -0,0 +1,428 @@
+"""
+IMAP stand-ins for the fetcher tests and benchmarks.
+
+FakeIMAP replaces imaplib.IMAP4_SSL in-process: it holds a mailbox of
+RFC 822 messages keyed by UID, answers the UID commands src.fetcher
+sends (including BODYSTRUCTURE and BODY[<section>]) and records every
+command so tests can count round trips.
+
+IMAPStandinServer serves the same mailbox over a local TCP socket to
+real imaplib clients (any number of concurrent connections), optionally
+over TLS, with an optional delay per command and per fetched message to
+model a remote provider.
+
+application_messages seeds either with synthetic "Nová Přihláška"
+emails in the layout parse_email_body expects.
+"""
+import email
+import html
+import imaplib
+import os
+import re
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from email.header import decode_header, make_header
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+APPLICATION_SUBJECT = "Nová Přihláška - Mladý divák"
+FIRST_NAMES = ['Barbora', 'Jan', 'Tereza', 'Petr', 'Eliška', 'Tomáš']
+LAST_NAMES = ['Smékalová', 'Novák', 'Dvořáková', 'Svoboda', 'Černá', 'Procházka']
+SCHOOLS = ['OSU', 'VŠB-TUO', 'JAMU', 'Gymnázium Olomouc']
+
+# Tests patch imaplib.IMAP4_SSL with IMAPStandinServer.client, which needs the real class
+_IMAP4_SSL = imaplib.IMAP4_SSL
+
+
+def make_message(subject, body, message_id=None, date='Mon, 01 Sep 2025 10:00:00 +0200'):
+    """Build raw message bytes with a UTF-8 subject and plain text body"""
+    msg = MIMEText(body, 'plain', 'utf-8')
+    msg['Subject'] = subject
+    msg['Date'] = date
+    if message_id:
+        msg['Message-ID'] = message_id
+    return msg.as_bytes()
+
+
+def application_body(i):
+    """Body of the i-th synthetic application (2025 form layout), membership id 100000 + i"""
+    first, last = FIRST_NAMES[i % 6], LAST_NAMES[i // 6 % 6]
+    return (
+        f"Jak se jmenuješ?: {first}\n"
+        f"Jaké je tvé příjmení?: {last}\n"
+        f"Kam ti můžeme poslat e-mail? (lepší osobní než studentský): {first.lower()}.{i}@example.com\n"
+        f"Na jaké číslo ti můžeme zavolat?: +420777{i % 1000000:06d}\n"
+        f"Kdy ses narodil/a?: {1 + i % 28:02d}/{1 + i % 12:02d}/{1995 + i % 10}\n"
+        "Odkud pocházíš?: Ostrava\n"
+        f"Kam chodíš do školy?: {SCHOOLS[i % 4]}\n"
+        "Co tě nejvíc zajímá?: Divadlo, Hudba\n"
+        "Jsi ...: Něco mezi\n"
+        "Jak často během roku chceš navštěvovat doprovodný program Mladého diváka?: 3\n"
+        "Odkud ses o nás dozvěděl/a?: Instagram\n"
+        "Jinde?: \n"
+        "Chceš nám něco říct?: Těším se!\n"
+        "Zelená nebo růžová?: Zelená\n"
+        "Nesouhlas se zasíláním novinek: \n"
+        f"\n{100000 + i}\n"
+    )
+
+
+def application_messages(count, start=0):
+    """Raw application emails as the web form sends them: plain text with an HTML alternative"""
+    for i in range(start, start + count):
+        body = application_body(i)
+        msg = MIMEMultipart('alternative')
+        msg.attach(MIMEText(body, 'plain', 'utf-8'))
+        rows = ''.join(f'<tr><td style="padding:4px;border:1px solid #ddd">{html.escape(line)}</td></tr>'
+                       for line in body.splitlines())
+        msg.attach(MIMEText(f'<html><body><table>{rows}</table></body></html>', 'html', 'utf-8'))
+        msg['Subject'] = APPLICATION_SUBJECT
+        msg['Date'] = 'Mon, 01 Sep 2025 10:00:00 +0200'
+        msg['Message-ID'] = f'<application-{i}@standin.test>'
+        yield msg.as_bytes()
+
+
+def self_signed_context():
+    """Server SSLContext with a throwaway self-signed certificate for localhost (needs the openssl CLI)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = os.path.join(tmp, 'cert.pem'), os.path.join(tmp, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                        '-subj', '/CN=localhost', '-keyout', key, '-out', cert],
+                       check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+    return context
+
+
+def _quote(value):
+    return 'NIL' if value is None else '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _encoded_payload(part):
+    """Body of a non-multipart part as stored, i.e. still transfer-encoded"""
+    return part.get_payload(decode=False).encode('utf-8', errors='surrogateescape')
+
+
+def bodystructure(part):
+    """RFC 3501 BODYSTRUCTURE of a message (no message/rfc822 support)"""
+    if part.is_multipart():
+        children = ''.join(bodystructure(child) for child in part.get_payload())
+        return f'({children} {_quote(part.get_content_subtype().upper())})'
+    maintype, subtype = part.get_content_type().upper().split('/')
+    params = part.get_params()[1:] if part.get_params() else []
+    params = '(' + ' '.join(f'{_quote(name.upper())} {_quote(value)}' for name, value in params) + ')' if params else 'NIL'
+    payload = _encoded_payload(part)
+    fields = [_quote(maintype), _quote(subtype), params, 'NIL', 'NIL',
+              _quote(part.get('Content-Transfer-Encoding', '7BIT').upper()), str(len(payload))]
+    if maintype == 'TEXT':
+        fields.append(str(payload.count(b'\n')))
+    disposition = part.get_content_disposition()
+    if disposition:
+        filename = part.get_filename()
+        disposition = f'({_quote(disposition.upper())} ' + (f'("FILENAME" {_quote(filename)}))' if filename else 'NIL)')
+    fields += ['NIL', disposition or 'NIL', 'NIL']
+    return '(' + ' '.join(fields) + ')'
+
+
+def section_payload(msg, section):
+    """Contents of BODY[<section>], e.g. '1' or '2.1'"""
+    part = msg
+    for number in section.split('.'):
+        if part.is_multipart():
+            part = part.get_payload()[int(number) - 1]
+        elif number != '1':
+            raise imaplib.IMAP4.error(f'no section {section}')
+    return _encoded_payload(part)
+
+
+class FakeIMAP:
+    """A single selected mailbox answering UID SEARCH and UID FETCH"""
+
+    def __init__(self, messages=None, capabilities=('IMAP4REV1',), utf8_search=True, uid_validity=1):
+        # uid -> {'raw': bytes, 'seen': bool}
+        self.mailbox = {}
+        self.uid_validity = uid_validity
+        self.capabilities = tuple(capabilities)
+        self.utf8_search = utf8_search
+        self.literal = None
+        self.commands = []
+        self.bytes_sent = 0  # message data returned by FETCH
+        self.connects = 0
+        self.logged_out = False
+        for raw in messages or []:
+            self.append(raw)
+
+    def __call__(self, host, *args, **kwargs):
+        # Stands in for the IMAP4_SSL class: returns itself as the connection
+        self.host = host
+        self.connects += 1
+        self.logged_out = False
+        return self
+
+    def append(self, raw, seen=False):
+        uid = max(self.mailbox, default=0) + 1
+        self.mailbox[uid] = {'raw': raw, 'seen': seen}
+        return uid
+
+    def login(self, user, password):
+        return 'OK', [b'Logged in']
+
+    def select(self, mailbox='INBOX'):
+        return 'OK', [str(len(self.mailbox)).encode()]
+
+    def response(self, code):
+        if code == 'UIDVALIDITY':
+            return code, [str(self.uid_validity).encode()]
+        return code, [None]
+
+    def close(self):
+        return 'OK', [b'Closed']
+
+    def noop(self):
+        self.commands.append(('NOOP', (), None))
+        return 'OK', [b'NOOP completed']
+
+    def logout(self):
+        self.logged_out = True
+        return 'BYE', [b'Logging out']
+
+    def _parsed(self, uid):
+        message = self.mailbox[uid]
+        if 'msg' not in message:
+            message['msg'] = email.message_from_bytes(message['raw'])  # parsed once
+        return message['msg']
+
+    def _subject(self, uid):
+        message = self.mailbox[uid]
+        if 'subject' not in message:
+            message['subject'] = str(make_header(decode_header(self._parsed(uid)['Subject'] or '')))
+        return message['subject']
+
+    def _resolve(self, sequence_set):
+        uids = set()
+        for part in sequence_set.split(','):
+            start, _, end = part.partition(':')
+            uids.update(range(int(start), int(end or start) + 1))
+        return [uid for uid in sorted(uids) if uid in self.mailbox]
+
+    def uid(self, command, *args):
+        literal, self.literal = self.literal, None
+        self.commands.append((command.upper(), args, literal))
+        if command.upper() == 'SEARCH':
+            return self._search(args, literal)
+        if command.upper() == 'FETCH':
+            return self._fetch(*args)
+        if command.upper() == 'STORE':
+            return self._store(*args)
+        raise imaplib.IMAP4.error(f'{command} not supported by the stand-in')
+
+    def _search(self, args, literal):
+        criteria = [arg for arg in args if arg is not None]
+        if criteria[:2] == ['CHARSET', 'UTF-8']:
+            if not self.utf8_search:
+                return 'NO', [b'[BADCHARSET] UTF-8 not supported']
+            criteria = criteria[2:]
+        if criteria[-1:] == ['X-GM-RAW']:
+            if 'X-GM-EXT-1' not in self.capabilities:
+                raise imaplib.IMAP4.error('SEARCH command error: BAD')
+            literal = re.search(r'subject:"([^"]*)"', literal.decode('utf-8')).group(1).encode('utf-8')
+            criteria[-1] = 'SUBJECT'
+        uids = sorted(self.mailbox)
+        if 'UID' in criteria:
+            start = int(criteria[criteria.index('UID') + 1].split(':')[0])
+            # Like real servers, "n:*" includes the highest UID even when it is below n
+            uids = [uid for uid in uids if uid >= start or uid == max(uids)]
+        if 'UNSEEN' in criteria:
+            uids = [uid for uid in uids if not self.mailbox[uid]['seen']]
+        if 'SUBJECT' in criteria:
+            needle = literal.decode('utf-8').casefold()
+            uids = [uid for uid in uids if needle in self._subject(uid).casefold()]
+        return 'OK', [' '.join(str(uid) for uid in uids).encode()]
+
+    def _fetch(self, sequence_set, items):
+        data = []
+        for seq, uid in enumerate(self._resolve(sequence_set), start=1):
+            message = self.mailbox[uid]
+            msg = self._parsed(uid)
+            prefix = f'{seq} (UID {uid}'
+            if 'BODYSTRUCTURE' in items:
+                if 'bodystructure' not in message:
+                    message['bodystructure'] = bodystructure(msg)
+                prefix += f' BODYSTRUCTURE {message["bodystructure"]}'
+            if 'HEADER.FIELDS' in items:
+                fields = re.search(r'HEADER\.FIELDS \(([^)]*)\)', items).group(1).split()
+                payload = ''.join(f'{name}: {msg[name]}\r\n' for name in fields if msg[name]) + '\r\n'
+                payload = payload.encode('utf-8')
+                item = f'BODY[HEADER.FIELDS ({" ".join(fields)})]'
+            else:
+                section = re.search(r'BODY(?:\.PEEK)?\[([\d.]*)\]', items).group(1)
+                payload = section_payload(msg, section) if section else message['raw']
+                item = f'BODY[{section}]'
+                if 'PEEK' not in items:
+                    message['seen'] = True
+            self.bytes_sent += len(payload)
+            data.append((f'{prefix} {item} {{{len(payload)}}}'.encode(), payload))
+            data.append(b')')
+        return 'OK', data
+
+    def _store(self, sequence_set, command, flags):
+        if flags != '(\\Seen)' or not command.upper().startswith('+FLAGS'):
+            raise imaplib.IMAP4.error(f'STORE {command} {flags} not supported by the stand-in')
+        for uid in self._resolve(sequence_set):
+            self.mailbox[uid]['seen'] = True
+        return 'OK', [None]
+
+    def warm(self):
+        """Parse every message up front, so the first fetch does not pay for the stand-in's own work"""
+        for uid, message in self.mailbox.items():
+            self._subject(uid)
+            message['bodystructure'] = bodystructure(self._parsed(uid))
+
+    def fetch_count(self):
+        return sum(1 for command, _, _ in self.commands if command == 'FETCH')
+
+
+class _IMAPHandler(socketserver.StreamRequestHandler):
+    """One client connection speaking the subset of IMAP4rev1 src.fetcher uses"""
+
+    # Responses are written line by line; Nagle's algorithm would stall them on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def send(self, line):
+        self.wfile.write(line if isinstance(line, bytes) else line.encode('utf-8'))
+
+    def read_command(self):
+        """Read a command line, resolving synchronizing literals; returns (line, literal)"""
+        line = self.rfile.readline()
+        literal = None
+        match = re.search(rb'\{(\d+)\}\r\n$', line)
+        if match:
+            self.send(b'+ Ready for literal data\r\n')
+            literal = self.rfile.read(int(match.group(1)))
+            line = line[:match.start()].rstrip(b' ') + self.rfile.readline()
+        return line, literal
+
+    def handle(self):
+        server = self.server
+        backend = server.backend
+        with server.lock:
+            server.connections += 1
+        self.send(b'* OK IMAP stand-in ready\r\n')
+        while True:
+            line, literal = self.read_command()
+            if not line:
+                return
+            tag, _, rest = line.decode('utf-8').rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            if server.latency:
+                time.sleep(server.latency)
+
+            if command == 'CAPABILITY':
+                self.send(f'* CAPABILITY {" ".join(backend.capabilities)}\r\n')
+            elif command == 'SELECT':
+                with server.lock:
+                    self.send(f'* {len(backend.mailbox)} EXISTS\r\n'
+                              f'* OK [UIDVALIDITY {backend.uid_validity}] UIDs valid\r\n')
+                self.send(f'{tag} OK [READ-WRITE] SELECT completed\r\n')
+                continue
+            elif command == 'LOGOUT':
+                self.send(f'* BYE logging out\r\n{tag} OK LOGOUT completed\r\n')
+                return
+            elif command == 'IDLE':
+                self.send(b'+ idling\r\n')
+                self.rfile.readline()  # DONE
+            elif command == 'UID':
+                self.uid(tag, args, literal)
+                continue
+            elif command not in ('LOGIN', 'NOOP', 'CLOSE'):
+                self.send(f'{tag} BAD {command} not supported by the stand-in\r\n')
+                continue
+            self.send(f'{tag} OK {command} completed\r\n')
+
+    def uid(self, tag, args, literal):
+        server = self.server
+        subcommand, _, rest = args.partition(' ')
+        subcommand = subcommand.upper()
+        if subcommand == 'SEARCH':
+            params = rest.split()
+        elif subcommand == 'FETCH':
+            params = rest.split(' ', 1)
+        else:
+            params = rest.split(' ', 2)
+        try:
+            with server.lock:
+                server.backend.literal = literal
+                status, data = server.backend.uid(subcommand, *params)
+        except imaplib.IMAP4.error as e:
+            self.send(f'{tag} BAD {e}\r\n')
+            return
+
+        if status != 'OK':
+            self.send(f'{tag} {status} {data[0].decode()}\r\n')
+            return
+        if subcommand == 'SEARCH':
+            self.send(f'* SEARCH {data[0].decode()}'.rstrip() + '\r\n')
+        elif subcommand == 'FETCH':
+            messages = [part for part in data if isinstance(part, tuple)]
+            if server.message_delay and 'HEADER' not in params[1]:
+                time.sleep(server.message_delay * len(messages))
+            for header, payload in messages:
+                # imaplib hands back "1 (UID ..." without the FETCH keyword of the wire format
+                seq, _, items = header.partition(b' ')
+                self.send(b'* ' + seq + b' FETCH ' + items + b'\r\n' + payload + b')\r\n')
+        self.send(f'{tag} OK UID {subcommand} completed\r\n')
+
+
+class IMAPStandinServer(socketserver.ThreadingTCPServer):
+    """
+    Local IMAP server backed by a FakeIMAP mailbox.
+
+    Usage:
+        with IMAPStandinServer(FakeIMAP(messages), latency=0.02) as server:
+            imaplib.IMAP4('127.0.0.1', server.port)
+
+    latency delays every command, message_delay every message body
+    returned by a FETCH (seconds). With an ssl_context (for example
+    self_signed_context()) connections are TLS, as with a real provider.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, backend, latency=0.0, message_delay=0.0, host='127.0.0.1', port=0, ssl_context=None):
+        super().__init__((host, port), _IMAPHandler)
+        self.backend = backend
+        self.latency = latency
+        self.message_delay = message_delay
+        self.ssl_context = ssl_context
+        self.lock = threading.Lock()
+        self.connections = 0  # accepted so far
+        self.host, self.port = self.server_address[:2]
+
+    def get_request(self):
+        sock, address = super().get_request()
+        if self.ssl_context is not None:
+            # The handshake runs on the first read, in the handler thread
+            sock = self.ssl_context.wrap_socket(sock, server_side=True, do_handshake_on_connect=False)
+        return sock, address
+
+    def client(self, *args, **kwargs):
+        """imaplib.IMAP4_SSL replacement connecting to this server (certificate not verified)"""
+        if self.ssl_context is None:
+            return imaplib.IMAP4(self.host, self.port)
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+        return _IMAP4_SSL(self.host, self.port, ssl_context=context)
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,72 @@
+import unittest
+import sys
+import os
+import mailbox
+import shutil
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.backfill import backfill, iter_archive, read_headers, extract_bodies, BACKFILL_USER
+from src.database import init_db
+from tests.imap_standin import application_messages, make_message
+
+class TestBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.dir, 'applications.db')
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+
+        # An mbox export with a newsletter among the applications, plus a folder of .eml files
+        self.mbox_path = os.path.join(self.dir, 'export.mbox')
+        box = mailbox.mbox(self.mbox_path)
+        for raw in application_messages(3):
+            box.add(raw)
+        box.add(make_message('Newsletter', 'Nic k importu', '<newsletter@x>'))
+        box.close()
+        self.eml_dir = os.path.join(self.dir, 'eml', '2024')
+        os.makedirs(self.eml_dir)
+        for i, raw in enumerate(application_messages(2, start=3)):
+            with open(os.path.join(self.eml_dir, f'{i}.eml'), 'wb') as f:
+                f.write(raw)
+
+    def tearDown(self):
+        self.conn.close()
+        shutil.rmtree(self.dir)
+
+    def test_reads_mbox_and_eml_folders(self):
+        raws = list(iter_archive([self.mbox_path, os.path.join(self.dir, 'eml')]))
+        self.assertEqual(len(raws), 6)
+        headers = [read_headers(raw) for raw in raws]
+        self.assertIsNone(headers[3])
+        self.assertEqual([message_id for message_id, _ in filter(None, headers)],
+                         [f'<application-{i}@standin.test>' for i in range(5)])
+
+        bodies = list(extract_bodies(raws))
+        self.assertIn('Jak se jmenuješ?', bodies[0])
+        self.assertNotIn('<html>', bodies[0])  # the plain text part, not the HTML alternative
+        self.assertEqual(list(extract_bodies(raws, workers=2, chunk_size=2)), bodies)
+
+    def test_rerun_is_idempotent(self):
+        progress = []
+        stats = backfill(self.conn, [self.mbox_path, self.eml_dir], batch_size=2, progress=progress.append)
+        self.assertEqual((stats['messages'], stats['applications'], stats['imported']), (6, 5, 5))
+        self.assertEqual(len(progress), 3)
+
+        audits = self.conn.execute('SELECT COUNT(*) FROM audit_logs').fetchone()[0]
+        stats = backfill(self.conn, [self.mbox_path, self.eml_dir])
+        self.assertEqual((stats['applications'], stats['skipped'], stats['imported']), (5, 5, 0))
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM audit_logs').fetchone()[0], audits)
+
+        members = [row[0] for row in self.conn.execute('SELECT membership_id FROM applicants ORDER BY id')]
+        self.assertEqual(members, [str(100000 + i) for i in range(5)])
+        users = {row[0] for row in self.conn.execute('SELECT user FROM audit_logs')}
+        self.assertEqual(users, {BACKFILL_USER})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,9 @@ import os
 import sqlite3
 import csv
 import io
+import tempfile
+from datetime import datetime
+import openpyxl
 from flask import session
 
 # Add root directory
@@ -141,6 +144,159 @@ class TestCSVImport(unittest.TestCase):
         self.assertEqual(row['message'], 'Poznámka')
         self.assertEqual(row['color'], 'Modrá')
 
+    def test_preview_counts_duplicates(self):
+        """Preview flags rows whose email already exists"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO applicants (first_name, last_name, email) VALUES ('Old', 'User', 'dup@test.com')")
+        conn.commit()
+        conn.close()
+        
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=['jmeno', 'prijmeni', 'email'])
+        writer.writeheader()
+        writer.writerow({'jmeno': 'Jan', 'prijmeni': 'Dup', 'email': 'dup@test.com'})
+        writer.writerow({'jmeno': 'Jan', 'prijmeni': 'New', 'email': 'new@test.com'})
+        
+        data = {'csv_file': (io.BytesIO(output.getvalue().encode('utf-8')), 'test.csv')}
+        resp = self.client.post('/import/preview', data=data, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {'total': 2, 'new': 1, 'duplicates': 1, 'errors': 0})
+        
+        # Staged rows are available page by page
+        resp = self.client.get('/import/preview/rows?page=1')
+        self.assertEqual(resp.status_code, 200)
+        rows = resp.get_json()['rows']
+        self.assertEqual([(r['email'], r['action']) for r in rows], [('dup@test.com', 'duplicate'), ('new@test.com', 'new')])
+
+    def test_xlsx_import(self):
+        """XLSX workbooks go through the same preview and confirm flow"""
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.append(['jmeno', 'prijmeni', 'email', 'telefon', 'datum_narozeni', 'id', None])
+        ws.append(['Tereza', 'Dvořáková', 'tereza@test.com', 777666555, datetime(2000, 5, 14), 1954.0, None])
+        ws.append([None, None, None])  # empty rows are skipped
+        ws.append([' Petr ', 'Svoboda', 'petr@test.com', '+420777000000', '01.01.2001', 'A77'])
+        output = io.BytesIO()
+        wb.save(output)
+        
+        data = {'csv_file': (io.BytesIO(output.getvalue()), 'partneri.xlsx')}
+        resp = self.client.post('/import/preview', data=data, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json(), {'total': 2, 'new': 2, 'duplicates': 0, 'errors': 0})
+        
+        resp = self.client.post('/import/confirm')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['count'], 2)
+        
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        rows = conn.execute('SELECT * FROM applicants ORDER BY id').fetchall()
+        conn.close()
+        self.assertEqual([(r['first_name'], r['phone'], r['dob'], r['membership_id']) for r in rows], [
+            ('Tereza', '777666555', '14.05.2000', '1954'),
+            ('Petr', '+420777000000', '01.01.2001', 'A77'),
+        ])
+
+    def test_preview_rejects_oversized_upload(self):
+        """Preview enforces MAX_IMPORT_SIZE while copying the upload"""
+        original_limit = self.app.config['MAX_IMPORT_SIZE']
+        self.app.config['MAX_IMPORT_SIZE'] = 1024
+        try:
+            content = 'jmeno,prijmeni,email\n' + 'Jan,Novak,jan@test.com\n' * 100
+            data = {'csv_file': (io.BytesIO(content.encode('utf-8')), 'big.csv')}
+            resp = self.client.post('/import/preview', data=data, content_type='multipart/form-data')
+            self.assertEqual(resp.status_code, 413)
+        finally:
+            self.app.config['MAX_IMPORT_SIZE'] = original_limit
+
+    def test_bulk_import_audit_semantics(self):
+        """New, restored and duplicate rows get the same audit entries as a row-by-row import"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('DELETE FROM audit_logs')
+        active_id = conn.execute("INSERT INTO applicants (first_name, last_name, email) VALUES ('A', 'Active', 'active@test.com')").lastrowid
+        deleted_id = conn.execute("INSERT INTO applicants (first_name, last_name, email, deleted) VALUES ('D', 'Deleted', 'deleted@test.com', 1)").lastrowid
+        conn.commit()
+        conn.close()
+        
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=['jmeno', 'prijmeni', 'email'])
+        writer.writeheader()
+        writer.writerow({'jmeno': 'N', 'prijmeni': 'New', 'email': 'new@test.com'})
+        writer.writerow({'jmeno': 'A', 'prijmeni': 'Active', 'email': 'active@test.com'})
+        writer.writerow({'jmeno': 'D', 'prijmeni': 'Deleted', 'email': 'deleted@test.com'})
+        writer.writerow({'jmeno': 'N', 'prijmeni': 'Again', 'email': 'new@test.com'})
+        writer.writerow({'jmeno': 'D', 'prijmeni': 'Again', 'email': 'deleted@test.com'})
+        
+        data = {'csv_file': (io.BytesIO(output.getvalue().encode('utf-8')), 'test.csv')}
+        resp = self.client.post('/import/preview', data=data, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 200)
+        
+        resp = self.client.post('/import/confirm')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['count'], 2)
+        
+        conn = sqlite3.connect(self.db_path)
+        new_rows = conn.execute("SELECT id, first_name, last_name, status FROM applicants WHERE email = 'new@test.com'").fetchall()
+        self.assertEqual(len(new_rows), 1)
+        new_id = new_rows[0][0]
+        self.assertEqual(new_rows[0][1:], ('N', 'New', 'Nová'))
+        self.assertEqual(conn.execute('SELECT deleted FROM applicants WHERE id = ?', (deleted_id,)).fetchone()[0], 0)
+        
+        logs = conn.execute('SELECT applicant_id, action, user FROM audit_logs ORDER BY id').fetchall()
+        conn.close()
+        self.assertEqual(logs, [
+            (new_id, 'Vytvořeno importem', 'admin@example.com'),
+            (active_id, 'Pokus o import (duplicita)', 'admin@example.com'),
+            (deleted_id, 'Obnoveno importem', 'admin@example.com'),
+            (new_id, 'Pokus o import (duplicita)', 'admin@example.com'),
+            (deleted_id, 'Pokus o import (duplicita)', 'admin@example.com'),
+        ])
+
+    def test_confirm_restages_the_kept_upload(self):
+        """The upload is kept until confirm, which stages it again when the staged preview is gone"""
+        data = {'csv_file': (io.BytesIO(b'jmeno,prijmeni,email\nJan,Kept,kept@test.com\n'), 'test.csv')}
+        resp = self.client.post('/import/preview', data=data, content_type='multipart/form-data')
+        self.assertEqual(resp.status_code, 200)
+        with self.client.session_transaction() as sess:
+            path = sess['import_file_path']
+            job_id = sess['import_job_id']
+        self.assertTrue(os.path.exists(path))
+        
+        # The preview was discarded as stale before the user confirmed it
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("UPDATE import_jobs SET status = 'discarded' WHERE id = ?", (job_id,))
+        conn.commit()
+        conn.close()
+        
+        resp = self.client.post('/import/confirm')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()['count'], 1)
+        self.assertNotEqual(resp.get_json()['job_id'], job_id)
+        self.assertFalse(os.path.exists(path))
+
+    def test_report_is_only_served_to_its_user(self):
+        fd, report_path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write('radek,chyba\n5,broken row\n')
+        conn = sqlite3.connect(self.db_path)
+        job_id = conn.execute(
+            "INSERT INTO import_jobs (file_hash, user, status, error_count, report_path) "
+            "VALUES ('x', 'other@example.com', 'done', 1, ?)", (report_path,)
+        ).lastrowid
+        conn.commit()
+        conn.close()
+
+        try:
+            self.assertEqual(self.client.get(f'/import/report/{job_id}').status_code, 404)
+            with self.client.session_transaction() as sess:
+                sess['user'] = {'email': 'other@example.com'}
+            resp = self.client.get(f'/import/report/{job_id}')
+            self.assertEqual(resp.status_code, 200)
+            self.assertIn('broken row', resp.get_data(as_text=True))
+            resp.close()
+        finally:
+            os.remove(report_path)
+
     def perform_import(self, csv_content, expected_id):
         # 1. Preview
         data = {'csv_file': (io.BytesIO(csv_content.encode('utf-8')), 'test.csv')}
@@ -17,6 +17,9 @@ class TestEmailImportLogging(unittest.TestCase):
         self.app.secret_key = 'test_secret'
         self.app.config['TESTING'] = True
         self.client = self.app.test_client()
+        # Confirm without a preview re-fetches, which needs configured credentials
+        self.env = patch.dict(os.environ, {'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass'})
+        self.env.start()
         
         # Setup DB
         with self.app.app_context():
@@ -29,6 +32,7 @@ class TestEmailImportLogging(unittest.TestCase):
             init_db(self.db_path)
             
     def tearDown(self):
+        self.env.stop()
         if os.path.exists(self.db_path):
             os.remove(self.db_path)
             
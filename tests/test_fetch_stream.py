@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import json
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.fetcher import iter_new_email_batches, session_pool
+from tests.imap_standin import FakeIMAP, make_message
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+def parse_events(text):
+    """Split a text/event-stream body into (event, data) pairs"""
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = dict(line.split(': ', 1) for line in block.splitlines())
+        events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+class TestEmailBatchGenerator(unittest.TestCase):
+
+    def test_batches_ramp_up_and_are_fetched_lazily(self):
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(i)) for i in range(7)])
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            batches = iter_new_email_batches('user', 'pass', 'imap.test', first_batch_size=1)
+            first = next(batches)
+            self.assertEqual([e.uid for e in first], ['1'])
+            self.assertEqual(imap.fetch_count(), 2)  # headers, then only the first body
+
+            sizes = [len(first)] + [len(batch) for batch in batches]
+        self.assertEqual(sizes, [1, 2, 4])
+
+class TestFetchStream(unittest.TestCase):
+
+    def setUp(self):
+        from web_app import app
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.env = patch.dict(os.environ, {'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass', 'IMAP_SERVER': 'imap.test'})
+        self.env.start()
+        self.db = patch('routes.applicants.get_db_connection', side_effect=self.connect)
+        self.db.start()
+        with self.client.session_transaction() as sess:
+            sess['user'] = {'email': 'admin@example.com'}
+            sess['mode'] = 'test'
+
+    def tearDown(self):
+        session_pool.close_all()
+        self.db.stop()
+        self.env.stop()
+        os.remove(self.db_path)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_stream_then_confirm_token(self):
+        conn = self.connect()
+        conn.execute("INSERT INTO applicants (first_name, last_name, email, membership_id) VALUES ('A', 'B', 'a@b.cz', '1001')")
+        conn.commit()
+        conn.close()
+
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1000 + i)) for i in range(3)])
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            response = self.client.get('/fetch/stream')
+            self.assertEqual(response.mimetype, 'text/event-stream')
+            events = parse_events(response.get_data(as_text=True))
+
+            self.assertEqual([name for name, _ in events], ['email', 'email', 'email', 'done'])
+            self.assertEqual([(data['new'], data['duplicates']) for _, data in events[:3]], [(1, 0), (1, 1), (2, 1)])
+            self.assertTrue(events[1][1]['email']['is_duplicate'])
+            token = events[3][1].pop('token')
+            self.assertEqual(events[3][1], {'total': 3, 'new': 2, 'duplicates': 1, 'needs_review': 0})
+
+            stream_commands = len(imap.commands)
+            result = self.client.post('/fetch/confirm', json={'token': token}).get_json()
+
+        self.assertEqual(result['count'], 2)
+        self.assertEqual(len(imap.commands), stream_commands)  # imported from the spool
+
+    def test_stream_reports_errors(self):
+        with patch('src.fetcher.imaplib.IMAP4_SSL', side_effect=OSError('connection refused')):
+            events = parse_events(self.client.get('/fetch/stream').get_data(as_text=True))
+        self.assertEqual(events, [('error', {'error': 'connection refused'})])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,242 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import email
+import imaplib
+import shutil
+import time
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.fetcher import (get_unread_emails, iter_new_email_batches, extract_body, uid_set, Checkpoint,
+                         IMAPSessionPool, FETCH_BATCH_SIZE, FETCH_CONNECTIONS_MAX, FETCH_PREFETCH_BATCHES)
+from src.parser import parse_email_body
+from tests.imap_standin import (FakeIMAP, IMAPStandinServer, make_message, application_messages,
+                                self_signed_context)
+
+SUBJECT = "Nová Přihláška - Mladý divák"
+
+def make_multipart(text, html, charset='utf-8', attachment=None):
+    """Application email as sent by the web form: text and HTML alternative, optional attachment"""
+    alternative = MIMEMultipart('alternative')
+    if text is not None:
+        alternative.attach(MIMEText(text, 'plain', charset))
+    alternative.attach(MIMEText(html, 'html', 'utf-8'))
+    if attachment is None:
+        msg = alternative
+    else:
+        msg = MIMEMultipart('mixed')
+        msg.attach(alternative)
+        part = MIMEApplication(attachment)
+        part.add_header('Content-Disposition', 'attachment', filename='prihlaska.pdf')
+        msg.attach(part)
+    msg['Subject'] = SUBJECT
+    msg['Message-ID'] = '<multi@test>'
+    return msg.as_bytes()
+
+class TestFetcher(unittest.TestCase):
+
+    def fetch(self, imap, mark_as_read=False, checkpoint=None):
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            return get_unread_emails('user', 'pass', 'imap.test', mark_as_read=mark_as_read, checkpoint=checkpoint)
+
+    def test_uid_set(self):
+        self.assertEqual(uid_set([7, 1, 2, 3, 9, 10]), '1:3,7,9:10')
+        self.assertEqual(uid_set([5]), '5')
+
+    def test_round_trips_do_not_grow_per_message(self):
+        """One search, one header fetch and one body fetch per batch"""
+        count = FETCH_BATCH_SIZE * 2 + 1
+        imap = FakeIMAP([make_message(SUBJECT, f"Jak se jmenuješ?: Jana\n\n{i}", f"<{i}@test>")
+                         for i in range(count)])
+        emails = self.fetch(imap)
+
+        self.assertEqual(len(emails), count)
+        self.assertEqual([command for command, _, _ in imap.commands], ['SEARCH'] + ['FETCH'] * 4)
+        self.assertEqual(emails[0].message_id, '<0@test>')
+        self.assertIn('Jana', emails[-1].body)
+        self.assertEqual([int(e.uid) for e in emails], sorted(int(e.uid) for e in emails))
+
+    def test_subject_filtered_on_server(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1"), make_message("Newsletter", "2"),
+                         make_message(SUBJECT, "3")])
+        imap.mailbox[3]['seen'] = True
+        emails = self.fetch(imap)
+
+        self.assertEqual([e.uid for e in emails], ['1'])
+        _, args, literal = imap.commands[0]
+        self.assertEqual(args, ('CHARSET', 'UTF-8', 'UNSEEN', 'SUBJECT'))
+        self.assertEqual(literal, "Nová Přihláška".encode('utf-8'))
+
+    def test_gmail_uses_raw_search(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1"), make_message("Newsletter", "2")],
+                        capabilities=('IMAP4REV1', 'X-GM-EXT-1'))
+        emails = self.fetch(imap)
+
+        self.assertEqual([e.uid for e in emails], ['1'])
+        self.assertEqual(imap.commands[0][1], ('CHARSET', 'UTF-8', 'UNSEEN', 'X-GM-RAW'))
+
+    def test_fallback_without_utf8_search(self):
+        """Servers rejecting CHARSET UTF-8 still get the subject checked locally"""
+        imap = FakeIMAP([make_message(SUBJECT, "1"), make_message("Newsletter", "2")], utf8_search=False)
+        emails = self.fetch(imap)
+
+        self.assertEqual([e.uid for e in emails], ['1'])
+        self.assertEqual(imap.commands[1][1], (None, 'UNSEEN'))
+        # Subjects are checked on the headers, only the application body is downloaded
+        self.assertIn('HEADER.FIELDS', imap.commands[2][1][1])
+        self.assertEqual(imap.commands[3][1], ('1', '(BODY.PEEK[1])'))
+
+    def test_mark_as_read(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1")])
+        self.fetch(imap)
+        self.assertFalse(imap.mailbox[1]['seen'])
+        self.fetch(imap, mark_as_read=True)
+        self.assertTrue(imap.mailbox[1]['seen'])
+
+    def test_checkpoint_fetches_only_newer_uids(self):
+        """Read or not, only UIDs above the checkpoint are fetched"""
+        imap = FakeIMAP([make_message(SUBJECT, str(i)) for i in range(5)], uid_validity=7)
+        imap.mailbox[5]['seen'] = True
+        emails = self.fetch(imap, checkpoint=Checkpoint(7, 3))
+
+        self.assertEqual([e.uid for e in emails], ['4', '5'])
+        self.assertEqual(emails[0].uid_validity, 7)
+        self.assertEqual(imap.commands[0][1], ('CHARSET', 'UTF-8', 'UID', '4:*', 'SUBJECT'))
+
+        # Nothing new: "4:*" still matches UID 5 on the server, but it is dropped
+        self.assertEqual(self.fetch(imap, checkpoint=Checkpoint(7, 5)), [])
+
+    def test_uid_validity_change_resyncs_from_unread(self):
+        imap = FakeIMAP([make_message(SUBJECT, str(i)) for i in range(3)], uid_validity=8)
+        imap.mailbox[1]['seen'] = True
+        emails = self.fetch(imap, checkpoint=Checkpoint(7, 3))
+
+        self.assertEqual([e.uid for e in emails], ['2', '3'])
+        self.assertEqual(imap.commands[0][1], ('CHARSET', 'UTF-8', 'UNSEEN', 'SUBJECT'))
+
+    def test_only_text_part_is_downloaded(self):
+        html = '<table><tr><td>Jana</td></tr></table>' * 500
+        raw = make_multipart("Jak se jmenuješ?: Jana\nJaké je tvé příjmení?: Nováková", html,
+                             charset='iso-8859-2', attachment=b'%PDF' * 1000)
+        imap = FakeIMAP([raw])
+        emails = self.fetch(imap)
+
+        self.assertEqual(emails[0].body, extract_body(email.message_from_bytes(raw)))
+        self.assertIn('Nováková', emails[0].body)
+        self.assertEqual(emails[0].message_id, '<multi@test>')
+        self.assertIn('BODYSTRUCTURE', imap.commands[1][1][1])
+        self.assertEqual(imap.commands[2][1], ('1', '(BODY.PEEK[1.1])'))
+        self.assertLess(imap.bytes_sent, len(raw) / 10)
+
+    def test_html_part_without_plain_text(self):
+        raw = make_multipart(None, '<p>Jak se jmenuješ?: Jana</p>')
+        imap = FakeIMAP([raw, make_message(SUBJECT, "plain")])
+        emails = self.fetch(imap)
+
+        self.assertEqual([e.body for e in emails], [extract_body(email.message_from_bytes(raw)), 'plain'])
+        self.assertEqual(emails[0].body, '<p>Jak se jmenuješ?: Jana</p>')
+        # Same part number, so one body fetch despite the different types
+        self.assertEqual([args for _, args, _ in imap.commands[2:]], [('1:2', '(BODY.PEEK[1])')])
+
+    def test_parallel_connections_match_serial_fetch(self):
+        """Bodies fetched over several connections come back complete and in UID order"""
+        messages = [make_message(SUBJECT if i % 4 else "Newsletter", f"Jak se jmenuješ?: Jana\n\n{i}", f"<{i}@test>")
+                    for i in range(FETCH_BATCH_SIZE * 5)]
+        with IMAPStandinServer(FakeIMAP(messages), latency=0.005) as server:
+            with patch('src.fetcher.imaplib.IMAP4_SSL', server.client):
+                serial = get_unread_emails('user', 'pass', 'imap.test')
+                serial_connections = server.connections
+                parallel = get_unread_emails('user', 'pass', 'imap.test', connections=10)
+
+        self.assertEqual(len(serial), FETCH_BATCH_SIZE * 5 * 3 // 4)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(serial_connections, 1)
+        self.assertLessEqual(server.connections - serial_connections, FETCH_CONNECTIONS_MAX)  # main one included
+        self.assertFalse(any(message['seen'] for message in server.backend.mailbox.values()))
+
+    def test_parallel_fetch_stays_ahead_by_a_bounded_window(self):
+        """A slow consumer holds back the parallel fetch instead of buffering the whole mailbox"""
+        messages = [make_message(SUBJECT, f"Jak se jmenuješ?: Jana\n\n{i}") for i in range(FETCH_BATCH_SIZE * 20)]
+        with IMAPStandinServer(FakeIMAP(messages)) as server:
+            with patch('src.fetcher.imaplib.IMAP4_SSL', server.client):
+                batches = iter_new_email_batches('user', 'pass', 'imap.test', connections=2)
+                next(batches)
+                time.sleep(0.3)
+                body_fetches = sum(1 for command, args, _ in server.backend.commands
+                                   if command == 'FETCH' and 'BODYSTRUCTURE' not in str(args))
+                self.assertLessEqual(body_fetches, 2 * FETCH_PREFETCH_BATCHES + 2)
+                self.assertEqual(sum(len(batch) for batch in batches), FETCH_BATCH_SIZE * 19)
+
+    @unittest.skipUnless(shutil.which('openssl'), 'needs the openssl CLI for a test certificate')
+    def test_synthetic_applications_over_tls(self):
+        backend = FakeIMAP(application_messages(12))
+        with IMAPStandinServer(backend, ssl_context=self_signed_context()) as server:
+            with patch('src.fetcher.imaplib.IMAP4_SSL', server.client):
+                emails = get_unread_emails('user', 'pass', 'imap.test')
+
+        parsed = [parse_email_body(e.body) for e in emails]
+        self.assertEqual([p['membership_id'] for p in parsed], [str(100000 + i) for i in range(12)])
+        self.assertFalse(any(p['needs_review'] for p in parsed))
+        self.assertEqual(emails[3].message_id, '<application-3@standin.test>')
+
+class TestSessionPool(unittest.TestCase):
+
+    def fetch(self, imap, pool):
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            return get_unread_emails('user', 'pass', 'imap.test', pool=pool)
+
+    def test_session_reused_across_fetches(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1")])
+        pool = IMAPSessionPool()
+        self.assertEqual(len(self.fetch(imap, pool)), 1)
+        imap.append(make_message(SUBJECT, "2"))
+        self.assertEqual(len(self.fetch(imap, pool)), 2)  # re-SELECT sees the new message
+
+        self.assertEqual(imap.connects, 1)
+        self.assertFalse(imap.logged_out)
+        pool.close_all()
+        self.assertTrue(imap.logged_out)
+
+    def test_dead_session_is_replaced_on_checkout(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1")])
+        pool = IMAPSessionPool()
+        self.fetch(imap, pool)
+        with patch.object(imap, 'select', side_effect=[imaplib.IMAP4.abort('socket error: EOF'), ('OK', [b'1'])]):
+            self.assertEqual(len(self.fetch(imap, pool)), 1)
+        self.assertEqual(imap.connects, 2)
+        pool.close_all()
+
+    def test_failed_fetch_does_not_return_session(self):
+        imap = FakeIMAP([make_message(SUBJECT, "1")])
+        pool = IMAPSessionPool()
+        with patch.object(imap, 'uid', side_effect=imaplib.IMAP4.abort('socket error: EOF')):
+            self.assertEqual(self.fetch(imap, pool), [])
+        self.assertTrue(imap.logged_out)
+        self.fetch(imap, pool)
+        self.assertEqual(imap.connects, 2)
+        pool.close_all()
+
+    def test_keepalive_and_idle_eviction(self):
+        imap = FakeIMAP()
+        pool = IMAPSessionPool(idle_timeout=0.3, keepalive_interval=0.05)
+        pool.checkin(imap('imap.test'), 'user', 'pass', 'imap.test')
+        time.sleep(0.1)
+        pool.keepalive()
+        self.assertIn(('NOOP', (), None), imap.commands)
+        self.assertFalse(imap.logged_out)
+
+        time.sleep(0.35)
+        pool.keepalive()
+        self.assertTrue(imap.logged_out)
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            pool.checkout('user', 'pass', 'imap.test')
+        self.assertEqual(imap.connects, 2)
+
+if __name__ == '__main__':
+    unittest.main()
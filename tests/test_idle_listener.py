@@ -0,0 +1,185 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.idle_listener import IdleListener, idle_wait, read_status, LISTENER_USER
+from tests.imap_standin import FakeIMAP, make_message
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+class SocketIMAP:
+    """The parts of imaplib.IMAP4 idle_wait uses, over one end of a socket pair"""
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.file = sock.makefile('rb')
+
+    def _new_tag(self):
+        return b'A001'
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def readline(self):
+        return self.file.readline()
+
+class TestIdleWait(unittest.TestCase):
+
+    def setUp(self):
+        self.client, self.server = socket.socketpair()
+        self.server_file = self.server.makefile('rb')
+
+    def tearDown(self):
+        self.server_file.close()
+        self.client.close()
+        self.server.close()
+
+    def serve(self, *lines, continuation=b'+ idling\r\n'):
+        """Answer IDLE with the given untagged lines, then complete it after DONE"""
+        def run():
+            self.assertEqual(self.server_file.readline(), b'A001 IDLE\r\n')
+            self.server.sendall(continuation)
+            for line in lines:
+                self.server.sendall(line)
+            self.assertEqual(self.server_file.readline(), b'DONE\r\n')
+            self.server.sendall(b'A001 OK IDLE terminated\r\n')
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_wakes_on_exists(self):
+        thread = self.serve(b'* 4 EXISTS\r\n')
+        self.assertTrue(idle_wait(SocketIMAP(self.client), timeout=5))
+        thread.join()
+
+    def test_wakes_on_exists_buffered_with_continuation(self):
+        """A notification read into the buffer together with '+ idling' is not missed"""
+        thread = self.serve(continuation=b'+ idling\r\n* 4 EXISTS\r\n')
+        self.assertTrue(idle_wait(SocketIMAP(self.client), timeout=5))
+        thread.join()
+
+    def test_times_out_without_new_mail(self):
+        thread = self.serve(b'* 3 EXPUNGE\r\n')
+        self.assertFalse(idle_wait(SocketIMAP(self.client), timeout=0.2))
+        thread.join()
+
+class TestIdleListener(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        self.listener = IdleListener('user', 'pass', 'imap.test', backoff_initial=1, backoff_max=4)
+        self.listener.db_path = self.db_path
+
+    def tearDown(self):
+        os.remove(self.db_path)
+
+    def status(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        status = read_status(conn)
+        conn.close()
+        return status
+
+    def test_ingests_on_startup_and_new_mail(self):
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1001))], capabilities=('IMAP4REV1', 'IDLE'))
+
+        def new_mail(mail, timeout):
+            if len(imap.mailbox) == 1:
+                imap.append(make_message("Nová Přihláška", BODY.format(1002)))
+                return True
+            self.listener.stop()
+            return False
+
+        with patch('src.idle_listener.imaplib.IMAP4_SSL', imap), \
+             patch('src.fetcher.imaplib.IMAP4_SSL', imap), \
+             patch('src.idle_listener.idle_wait', side_effect=new_mail):
+            self.listener.run()
+
+        conn = sqlite3.connect(self.db_path)
+        members = [row[0] for row in conn.execute('SELECT membership_id FROM applicants ORDER BY id')]
+        users = {row[0] for row in conn.execute('SELECT user FROM audit_logs')}
+        conn.close()
+        self.assertEqual(members, ['1001', '1002'])
+        self.assertEqual(users, {LISTENER_USER})
+
+        status = self.status()
+        self.assertEqual(status['state'], 'stopped')
+        self.assertEqual(status['ingested_total'], 2)
+
+    def test_production_marks_emails_read_after_the_import(self):
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1001))], capabilities=('IMAP4REV1', 'IDLE'))
+        self.listener.mark_as_read = True
+
+        def mark_seen(username, password, server, uids, uid_validity=None):
+            conn = sqlite3.connect(self.db_path)
+            imported = conn.execute('SELECT COUNT(*) FROM applicants').fetchone()[0]
+            conn.close()
+            self.assertEqual(imported, 1)  # committed before anything is flagged
+            return real_mark_seen(username, password, server, uids, uid_validity)
+
+        from src.fetcher import mark_seen as real_mark_seen
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap), \
+             patch('src.idle_listener.mark_seen', side_effect=mark_seen) as marked:
+            self.assertEqual(self.listener.ingest(), 1)
+
+        self.assertEqual(marked.call_args[0][3], [1])
+        fetches = [args for command, args, _ in imap.commands if command == 'FETCH']
+        self.assertTrue(all('.PEEK' in ' '.join(map(str, args)) for args in fetches))
+        self.assertTrue(all(message['seen'] for message in imap.mailbox.values()))
+
+    def test_fetch_errors_trigger_backoff(self):
+        """A failing fetch is not reported as a healthy listener"""
+        imap = FakeIMAP([], capabilities=('IMAP4REV1', 'IDLE'))
+        delays = []
+
+        def wait(delay):
+            delays.append(delay)
+            self.listener.stop()
+            return True
+
+        with patch('src.idle_listener.imaplib.IMAP4_SSL', imap), \
+             patch('src.fetcher.iter_new_email_batches', side_effect=OSError('authentication failed')), \
+             patch('src.idle_listener.idle_wait', side_effect=lambda mail, timeout: self.listener.stop()), \
+             patch.object(self.listener._stop_event, 'wait', side_effect=wait):
+            self.listener.run()
+
+        self.assertEqual(delays, [1])
+        self.assertEqual(self.status()['failures'], 1)
+
+    def test_reconnects_with_exponential_backoff(self):
+        delays = []
+
+        def wait(delay):
+            delays.append(delay)
+            if len(delays) == 4:
+                self.listener.stop()
+            return self.listener._stop_event.is_set()
+
+        with patch('src.idle_listener.imaplib.IMAP4_SSL', side_effect=OSError('connection refused')), \
+             patch.object(self.listener._stop_event, 'wait', side_effect=wait):
+            self.listener.run()
+
+        self.assertEqual(delays, [1, 2, 4, 4])
+        status = self.status()
+        self.assertEqual(status['failures'], 4)
+        self.assertEqual(status['state'], 'stopped')
+
+if __name__ == '__main__':
+    unittest.main()
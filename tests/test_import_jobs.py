@@ -0,0 +1,174 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import csv
+import io
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src import importer
+from src.importer import (stage_import, run_import_job, find_unfinished_job, get_staged_counts,
+                          get_job_progress, iter_parsed_rows, split_csv_ranges)
+from src.parser import compile_csv_header
+
+class TestImportJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.tmp_dir, 'jobs.db')
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+
+        self.csv_path = os.path.join(self.tmp_dir, 'import.csv')
+        with open(self.csv_path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['jmeno', 'prijmeni', 'email'])
+            for i in range(5):
+                writer.writerow([f'Jan{i}', 'Novák', f'jan{i}@example.com'])
+
+    def tearDown(self):
+        self.conn.close()
+        for name in os.listdir(self.tmp_dir):
+            os.remove(os.path.join(self.tmp_dir, name))
+        os.rmdir(self.tmp_dir)
+
+    def test_interrupted_import_resumes(self):
+        """A crash after the first chunk resumes from the checkpoint"""
+        original_chunk = importer._import_chunk
+        calls = []
+
+        def failing_chunk(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("simulated crash")
+            return original_chunk(*args, **kwargs)
+
+        job = stage_import(self.conn, self.csv_path, 'admin@example.com')
+        with patch('src.importer._import_chunk', side_effect=failing_chunk):
+            with self.assertRaises(RuntimeError):
+                run_import_job(self.conn, job['id'], 'admin@example.com', chunk_size=2)
+        self.conn.rollback()
+
+        # Another user uploading the same file starts their own job
+        self.assertIsNone(find_unfinished_job(self.conn, self.csv_path, 'other@example.com'))
+
+        job = find_unfinished_job(self.conn, self.csv_path, 'admin@example.com')
+        self.assertEqual(job['status'], 'running')
+        self.assertEqual(job['last_row'], 1)
+        self.assertEqual(job['total_rows'], 5)
+
+        job = run_import_job(self.conn, job['id'], 'admin@example.com', chunk_size=2)
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['imported_count'], 5)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM import_jobs').fetchone()[0], 1)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM applicants').fetchone()[0], 5)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM import_staged_rows').fetchone()[0], 0)
+
+        # Resumed rows are not re-imported, so there are no duplicate attempts
+        actions = [row[0] for row in self.conn.execute('SELECT action FROM audit_logs')]
+        self.assertEqual(actions, ['Vytvořeno importem'] * 5)
+
+    def test_row_errors_are_reported(self):
+        """A failing row is written to the report instead of aborting the import"""
+        def flaky_compile(fieldnames, aliases=None):
+            extract = compile_csv_header(fieldnames, aliases)
+            def flaky_extract(values):
+                if values[0] == 'Jan3':
+                    raise ValueError("broken row")
+                return extract(values)
+            return flaky_extract
+
+        with patch('src.importer.compile_csv_header', side_effect=flaky_compile):
+            job = stage_import(self.conn, self.csv_path, 'admin@example.com')
+        self.assertEqual(get_staged_counts(self.conn, job['id']), {'total': 5, 'new': 4, 'duplicates': 0, 'errors': 1})
+
+        job = run_import_job(self.conn, job['id'], 'admin@example.com', chunk_size=2)
+
+        self.assertEqual(job['status'], 'done')
+        self.assertEqual(job['imported_count'], 4)
+        self.assertEqual(job['error_count'], 1)
+
+        with open(job['report_path'], encoding='utf-8') as f:
+            report = list(csv.reader(f))
+        self.assertEqual(report, [['radek', 'chyba'], ['5', 'broken row']])
+
+    def test_confirm_respects_changes_after_preview(self):
+        """Staged rows are re-classified when promoted"""
+        job = stage_import(self.conn, self.csv_path, 'admin@example.com')
+        self.assertEqual(get_staged_counts(self.conn, job['id'])['new'], 5)
+
+        # Someone adds one of the applicants between preview and confirm
+        existing_id = self.conn.execute(
+            "INSERT INTO applicants (first_name, last_name, email) VALUES ('Jan0', 'Novák', 'jan0@example.com')"
+        ).lastrowid
+        self.conn.commit()
+
+        job = run_import_job(self.conn, job['id'], 'admin@example.com')
+        self.assertEqual(job['imported_count'], 4)
+        log = self.conn.execute('SELECT action FROM audit_logs WHERE applicant_id = ?', (existing_id,)).fetchone()
+        self.assertEqual(log[0], 'Pokus o import (duplicita)')
+
+    def test_new_preview_discards_previous_staging(self):
+        """An unconfirmed preview is dropped when the same user stages another file"""
+        first = stage_import(self.conn, self.csv_path, 'admin@example.com')
+        stage_import(self.conn, self.csv_path, 'admin@example.com')
+
+        status = self.conn.execute('SELECT status FROM import_jobs WHERE id = ?', (first['id'],)).fetchone()[0]
+        self.assertEqual(status, 'discarded')
+        staged = self.conn.execute('SELECT COUNT(*) FROM import_staged_rows WHERE job_id = ?', (first['id'],)).fetchone()[0]
+        self.assertEqual(staged, 0)
+
+    def test_split_ranges_respect_quoted_newlines(self):
+        """Byte ranges never split a record containing quoted newlines"""
+        path = os.path.join(self.tmp_dir, 'quoted.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['jmeno', 'prijmeni', 'email', 'volne_sdeleni'])
+            for i in range(50):
+                writer.writerow([f'Jana{i}', 'Nováková', f'jana{i}@example.com', f'Řádek 1\n"Řádek" 2, {i}'])
+
+        header_end, ranges = split_csv_ranges(path, 7)
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[:header_end], b'jmeno,prijmeni,email,volne_sdeleni\r\n')
+        for start, end in ranges:
+            rows = list(csv.reader(io.StringIO(data[start:end].decode('utf-8'), newline='')))
+            self.assertTrue(all(len(row) == 4 for row in rows))
+
+    def test_parallel_parse_matches_serial(self):
+        """The process pool path yields the same rows in the same order"""
+        path = os.path.join(self.tmp_dir, 'parallel.csv')
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['jmeno', 'prijmeni', 'email', 'volne_sdeleni', 'id'])
+            for i in range(200):
+                writer.writerow([f'Jana{i}', 'Nováková', f'jana{i}@example.com', f'Ahoj,\n"svět" {i}', str(i)])
+            writer.writerow(['Krátký', 'Řádek'])
+
+        serial = list(iter_parsed_rows(path, workers=1))
+        with patch('src.importer.PARALLEL_MIN_SIZE', 0), patch('src.importer.PARALLEL_RANGE_SIZE', 1024):
+            parallel = list(iter_parsed_rows(path, workers=2))
+
+        self.assertEqual(len(serial), 201)
+        self.assertEqual(parallel, serial)
+
+    def test_progress(self):
+        """Progress reports rows per second and ETA of the current run"""
+        job = {
+            'id': 1, 'status': 'running', 'total_rows': 1000, 'last_row': 499,
+            'imported_count': 500, 'error_count': 0,
+            'run_started_at': 100.0, 'run_start_row': 99
+        }
+        progress = get_job_progress(job, now=110.0)
+        self.assertEqual(progress['processed'], 500)
+        self.assertEqual(progress['rows_per_second'], 40.0)
+        self.assertEqual(progress['eta_seconds'], 12.5)
+
+if __name__ == '__main__':
+    unittest.main()
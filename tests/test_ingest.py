@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src import parser
+from src.database import init_db
+from src.fetcher import FetchedEmail
+from src.ingest import ingest_emails
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+class TestIngestedMessages(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.row_factory = sqlite3.Row
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def ingest(self, emails):
+        count, errors = ingest_emails(self.conn, emails, 'admin@example.com')
+        self.conn.commit()
+        return count
+
+    def audit_count(self):
+        return self.conn.execute('SELECT COUNT(*) FROM audit_logs').fetchone()[0]
+
+    def test_second_ingest_skips_before_parsing(self):
+        emails = [FetchedEmail(str(i), BODY.format(1000 + i), None, f'<{i}@x>', 1) for i in range(3)]
+        emails.append(('9', BODY.format(1009), None))  # no Message-ID, known by its body
+        self.assertEqual(self.ingest(emails), 4)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM ingested_messages').fetchone()[0], 4)
+        audits = self.audit_count()
+
+        with patch('src.parser.parse_email_bodies') as parse:
+            self.assertEqual(self.ingest(emails), 0)
+        parse.assert_not_called()
+        self.assertEqual(self.audit_count(), audits)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM applicants').fetchone()[0], 4)
+
+    def test_duplicate_is_recorded_once(self):
+        self.ingest([FetchedEmail('1', BODY.format(1001), None, '<1@x>', 1)])
+        # Same applicant in another message: checked and logged as a duplicate the first time only
+        resent = [FetchedEmail('2', BODY.format(1001) + '\n', None, '<2@x>', 1)]
+        self.assertEqual(self.ingest(resent), 0)
+        audits = self.audit_count()
+        self.ingest(resent)
+        self.assertEqual(self.audit_count(), audits)
+
+        rows = self.conn.execute('SELECT message_id, applicant_id FROM ingested_messages ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [('<1@x>', 1), ('<2@x>', 1)])
+
+    def test_hard_deleted_applicant_is_imported_again(self):
+        emails = [FetchedEmail('1', BODY.format(1001), None, '<1@x>', 1)]
+        self.ingest(emails)
+        self.conn.execute('DELETE FROM applicants')
+        self.assertEqual(self.ingest(emails), 1)
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM ingested_messages').fetchone()[0], 1)
+
+    def test_batch_resolves_against_itself_in_order(self):
+        self.conn.execute("INSERT INTO applicants (first_name, last_name, email, membership_id, deleted) "
+                          "VALUES ('Jana', 'Nováková', 'jana1002@example.com', '1002', 1)")
+        emails = [('1', BODY.format(1001), None),
+                  ('2', BODY.format(1001) + '\n', None),  # same applicant again
+                  ('3', BODY.format(1002), None),  # soft-deleted: restored once
+                  ('4', BODY.format(1002) + '\n', None),
+                  ('5', BODY.format(1003), None)]
+        with patch('src.parser.parse_email_bodies', wraps=parser.parse_email_bodies) as parse:
+            self.assertEqual(self.ingest(emails), 3)
+        self.assertEqual(parse.call_count, 1)
+
+        rows = self.conn.execute('SELECT id, membership_id, deleted FROM applicants ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, '1002', 0), (2, '1001', 0), (3, '1003', 0)])
+        audits = self.conn.execute('SELECT applicant_id, action FROM audit_logs ORDER BY id').fetchall()
+        self.assertEqual([tuple(row) for row in audits], [
+            (2, "Vytvořeno z emailu"),
+            (2, "Pokus o import z emailu (duplicita)"),
+            (1, "Obnoveno z emailu"),
+            (1, "Pokus o import z emailu (duplicita)"),
+            (3, "Vytvořeno z emailu"),
+        ])
+
+    def test_applicants_needing_review_are_stored_and_reported(self):
+        emails = [('1', BODY.format(1001), None),
+                  ('2', BODY.format(1002).replace('Jaké je tvé příjmení?: Nováková\n', ''), None),
+                  ('3', "Ahoj\nJméno: Jana\n\n1003", None)]
+        count, errors = ingest_emails(self.conn, emails, 'admin@example.com')
+        self.assertEqual(count, 3)
+        self.assertEqual(errors, [
+            "Email jana1002@example.com: Chybí povinné údaje (příjmení), zkontrolujte údaje přihlášky.",
+            "Email : Neznámý formát formuláře, zkontrolujte údaje přihlášky.",
+        ])
+
+        rows = self.conn.execute('SELECT membership_id, form_version, needs_review FROM applicants ORDER BY id')
+        self.assertEqual([tuple(row) for row in rows], [('1001', '2024', 0), ('1002', '2024', 1), ('1003', None, 1)])
+
+if __name__ == '__main__':
+    unittest.main()
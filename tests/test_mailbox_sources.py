@@ -0,0 +1,190 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.fetcher import session_pool
+from src.mailbox_sources import (MailboxSource, load_sources, run_per_source, iter_source_batches, source_metrics,
+                                 SOURCE_QUEUE_BATCHES)
+from src.mailbox_sync import load_checkpoint
+from tests.imap_standin import FakeIMAP, make_message
+from tests.test_fetch_stream import parse_events
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+def application(member, message_id):
+    return make_message("Nová Přihláška", BODY.format(member), message_id)
+
+class TestLoadSources(unittest.TestCase):
+
+    def test_main_and_named_sources(self):
+        sources = load_sources({
+            'EMAIL_USER': 'main@x.cz', 'EMAIL_PASS': 'p', 'IMAP_SERVER': 'imap.x.cz',
+            'EMAIL_SOURCES': 'skola, gymnazium,chybi,dvakrat',
+            'EMAIL_USER_SKOLA': 'prihlasky@skola.cz', 'EMAIL_PASS_SKOLA': 's', 'IMAP_SERVER_SKOLA': 'imap.skola.cz',
+            'EMAIL_USER_GYMNAZIUM': 'gym@gmail.com', 'EMAIL_PASS_GYMNAZIUM': 'g',
+            'EMAIL_USER_CHYBI': 'no-password@x.cz',
+            'EMAIL_USER_DVAKRAT': 'main@x.cz', 'EMAIL_PASS_DVAKRAT': 'p', 'IMAP_SERVER_DVAKRAT': 'imap.x.cz',
+        })
+        self.assertEqual([(source.name, source.key) for source in sources], [
+            ('main', 'main@x.cz@imap.x.cz/INBOX'),
+            ('skola', 'prihlasky@skola.cz@imap.skola.cz/INBOX'),
+            ('gymnazium', 'gym@gmail.com@imap.gmail.com/INBOX'),
+        ])
+        self.assertNotIn('s', repr(sources[1]).split("'"))  # no password in logs
+
+    def test_slow_source_does_not_hold_up_the_others(self):
+        release = threading.Event()
+
+        def fetch(source):
+            if source.name == 'slow':
+                release.wait(5)
+            return source.name
+
+        sources = [MailboxSource('slow', 'a', 'p', 'imap.a'), MailboxSource('fast', 'b', 'p', 'imap.b')]
+        start = time.perf_counter()
+        results, errors = run_per_source(sources, fetch, timeout=0.2)
+        release.set()
+        self.assertLess(time.perf_counter() - start, 2)
+        self.assertEqual(results, {'b@imap.b/INBOX': 'fast'})
+        self.assertEqual(list(errors), ['a@imap.a/INBOX'])
+
+    def test_closed_stream_stops_fetching(self):
+        """Batches wait in a bounded queue and the fetch stops when the consumer goes away"""
+        fetched = []
+        stopped = threading.Event()
+
+        def batches(*args, **kwargs):
+            try:
+                for i in range(1000):
+                    fetched.append(i)
+                    yield [i]
+            finally:
+                stopped.set()
+
+        sources = [MailboxSource('main', 'a', 'p', 'imap.a')]
+        with patch('src.fetcher.iter_new_email_batches', side_effect=batches):
+            stream = iter_source_batches(sources, {}, timeout=5)
+            self.assertEqual(next(stream)[1], [0])
+            time.sleep(0.2)
+            self.assertLessEqual(len(fetched), SOURCE_QUEUE_BATCHES + 3)  # blocked, not buffering the mailbox
+            stream.close()
+            self.assertTrue(stopped.wait(2))
+        self.assertLess(len(fetched), 1000)
+
+class TestFetchFromSources(unittest.TestCase):
+
+    def setUp(self):
+        from web_app import app
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.env = patch.dict(os.environ, {
+            'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass', 'IMAP_SERVER': 'imap.main',
+            'EMAIL_SOURCES': 'skola', 'EMAIL_USER_SKOLA': 'skola', 'EMAIL_PASS_SKOLA': 'pass',
+            'IMAP_SERVER_SKOLA': 'imap.skola',
+        })
+        self.env.start()
+        self.db = patch('routes.applicants.get_db_connection', side_effect=self.connect)
+        self.db.start()
+        with self.client.session_transaction() as sess:
+            sess['user'] = {'email': 'admin@example.com'}
+            sess['mode'] = 'production'
+        source_metrics.reset()
+        # The school forwards one application that also reached the main address
+        self.mailboxes = {
+            'imap.main': FakeIMAP([application(1001, '<1@x>'), application(1002, '<2@x>')]),
+            'imap.skola': FakeIMAP([application(1002, '<2@x>'), application(1003, '<3@x>')], uid_validity=7),
+        }
+
+    def tearDown(self):
+        session_pool.close_all()
+        source_metrics.reset()
+        self.db.stop()
+        self.env.stop()
+        os.remove(self.db_path)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def imap(self, host, *args, **kwargs):
+        if isinstance(self.mailboxes[host], Exception):
+            raise self.mailboxes[host]
+        return self.mailboxes[host](host)
+
+    def test_sources_are_merged_and_deduplicated(self):
+        with patch('src.fetcher.imaplib.IMAP4_SSL', side_effect=self.imap):
+            preview = self.client.post('/fetch/preview').get_json()
+            self.assertEqual(preview['total'], 3)
+            self.assertNotIn('errors', preview)
+            result = self.client.post('/fetch/confirm').get_json()
+            status = self.client.get('/fetch/sources').get_json()
+
+        self.assertEqual((result['count'], result['errors']), (3, []))
+        conn = self.connect()
+        members = [row[0] for row in conn.execute('SELECT membership_id FROM applicants ORDER BY id')]
+        self.assertEqual(members, ['1001', '1002', '1003'])
+        self.assertEqual(tuple(load_checkpoint(conn, 'skola@imap.skola/INBOX')), (7, 2))
+        self.assertEqual(tuple(load_checkpoint(conn, 'user@imap.main/INBOX')), (1, 2))
+        conn.close()
+        for imap in self.mailboxes.values():
+            self.assertTrue(all(message['seen'] for message in imap.mailbox.values()))
+
+        self.assertEqual([(s['name'], s['fetches'], s['messages'], s['errors']) for s in status['sources']],
+                         [('main', 1, 2, 0), ('skola', 1, 2, 0)])
+
+    def test_failed_source_is_reported_next_to_the_others(self):
+        self.mailboxes['imap.skola'] = OSError('connection refused')
+        with patch('src.fetcher.imaplib.IMAP4_SSL', side_effect=self.imap):
+            preview = self.client.post('/fetch/preview').get_json()
+            self.assertEqual(preview['total'], 2)
+            self.assertEqual(preview['errors'], ['Schránka skola: connection refused'])
+            self.assertEqual(self.client.post('/fetch/confirm').get_json()['count'], 2)
+            status = self.client.get('/fetch/sources').get_json()
+
+        skola = status['sources'][1]
+        self.assertEqual((skola['errors'], skola['last_error']), (1, 'connection refused'))
+
+    def test_refetch_marks_only_imported_emails_as_read(self):
+        self.mailboxes['imap.skola'] = OSError('connection refused')
+        with patch('src.fetcher.imaplib.IMAP4_SSL', side_effect=self.imap):
+            result = self.client.post('/fetch/confirm').get_json()
+        self.assertEqual((result['count'], result['errors']), (2, ['Schránka skola: connection refused']))
+
+        main = self.mailboxes['imap.main']
+        fetches = [args for command, args, _ in main.commands if command == 'FETCH']
+        self.assertTrue(fetches)
+        self.assertTrue(all('.PEEK' in ' '.join(map(str, args)) for args in fetches))  # fetched without \Seen
+        self.assertTrue(all(message['seen'] for message in main.mailbox.values()))  # flagged after the import
+
+    def test_stream_shows_each_application_once(self):
+        with self.client.session_transaction() as sess:
+            sess['mode'] = 'test'
+        with patch('src.fetcher.imaplib.IMAP4_SSL', side_effect=self.imap):
+            events = parse_events(self.client.get('/fetch/stream').get_data(as_text=True))
+            self.assertEqual([name for name, _ in events], ['email', 'email', 'email', 'done'])
+            self.assertEqual(sorted(data['email']['membership_id'] for _, data in events[:3]),
+                             ['1001', '1002', '1003'])
+            result = self.client.post('/fetch/confirm', json={'token': events[3][1]['token']}).get_json()
+        self.assertEqual(result['count'], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.fetcher import FetchedEmail, Checkpoint, session_pool
+from src.mailbox_sync import mailbox_key, load_checkpoint, advance_checkpoint
+from tests.imap_standin import FakeIMAP, make_message
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+def fetched(uid, uid_validity=1):
+    return FetchedEmail(str(uid), '', None, None, uid_validity)
+
+class TestMailboxSync(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+        self.key = mailbox_key('user', 'imap.test')
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def test_checkpoint_only_moves_forward(self):
+        self.assertIsNone(load_checkpoint(self.conn, self.key))
+        advance_checkpoint(self.conn, self.key, [fetched(3), fetched(5)])
+        self.assertEqual(load_checkpoint(self.conn, self.key), Checkpoint(1, 5))
+
+        advance_checkpoint(self.conn, self.key, [fetched(4)])
+        self.assertEqual(load_checkpoint(self.conn, self.key), Checkpoint(1, 5))
+
+        # Plain tuples carry no UIDVALIDITY and are ignored
+        advance_checkpoint(self.conn, self.key, [('9', '', None)])
+        self.assertEqual(load_checkpoint(self.conn, self.key), Checkpoint(1, 5))
+
+    def test_new_uid_validity_replaces_checkpoint(self):
+        advance_checkpoint(self.conn, self.key, [fetched(50)])
+        advance_checkpoint(self.conn, self.key, [fetched(2, uid_validity=2)])
+        self.assertEqual(load_checkpoint(self.conn, self.key), Checkpoint(2, 2))
+
+class TestFetchConfirmCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        from web_app import app
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.env = patch.dict(os.environ, {'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass', 'IMAP_SERVER': 'imap.test'})
+        self.env.start()
+        self.db = patch('routes.applicants.get_db_connection', side_effect=self.connect)
+        self.db.start()
+        with self.client.session_transaction() as sess:
+            sess['user'] = {'email': 'admin@example.com'}
+            sess['mode'] = 'test'
+
+    def tearDown(self):
+        session_pool.close_all()
+        self.db.stop()
+        self.env.stop()
+        os.remove(self.db_path)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_confirm_advances_checkpoint_in_test_mode(self):
+        """Test mode never marks emails read, the checkpoint keeps them out of the next preview"""
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1001)),
+                         make_message("Nová Přihláška", BODY.format(1002))])
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            self.assertEqual(self.client.post('/fetch/preview').get_json()['total'], 2)
+            self.assertEqual(self.client.post('/fetch/confirm').get_json()['count'], 2)
+            self.assertEqual(self.client.post('/fetch/preview').get_json()['total'], 0)
+
+            imap.append(make_message("Nová Přihláška", BODY.format(1003)))
+            preview = self.client.post('/fetch/preview').get_json()
+
+        self.assertEqual([e['membership_id'] for e in preview['emails']], ['1003'])
+        self.assertFalse(any(message['seen'] for message in imap.mailbox.values()))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,13 +2,16 @@ import unittest
 from unittest.mock import patch, MagicMock
 import sys
 import os
+import sqlite3
+import tempfile
 
 # Add root directory to path to allow importing src and app
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from web_app import app, session
-from src.database import get_db_path, DB_PATH_TEST, DB_PATH_PROD
+from src.database import get_db_path, init_db, DB_PATH_TEST, DB_PATH_PROD
 from src.email_sender import get_recipient_email
+from src.fetcher import FetchedEmail
 
 class TestModeBehaviors(unittest.TestCase):
     
@@ -52,12 +55,21 @@ class TestModeBehaviors(unittest.TestCase):
         self.assertEqual(recipient, real_email, "Should use real email in production mode")
 
     # --- 3. Importing Emails (Fetch) ---
+    @patch.dict(os.environ, {'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass'})
+    @patch('src.fetcher.mark_seen', return_value=True)
     @patch('src.fetcher.get_unread_emails')
-    def test_import_mark_as_read_logic(self, mock_get_emails):
-        """Test that mark_as_read flag is correctly set based on mode"""
+    def test_import_mark_as_read_logic(self, mock_get_emails, mock_mark_seen):
+        """Test that emails are marked as read after the import, in production mode only"""
         
         # Mock connection and other calls to avoid side effects
-        mock_get_emails.return_value = [] # Return empty list to stop execution early
+        mock_get_emails.return_value = [FetchedEmail('5', 'Dummy Body', '2025-01-01', '<5@x>', 1)]
+        fd, db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(db_path)
+        self.addCleanup(os.remove, db_path)
+        db = patch('routes.applicants.get_db_connection', side_effect=lambda: sqlite3.connect(db_path))
+        db.start()
+        self.addCleanup(db.stop)
         
         # Authenticate
         with self.client.session_transaction() as sess:
@@ -72,9 +84,10 @@ class TestModeBehaviors(unittest.TestCase):
         
         # Verify call args
         # call_args is (args, kwargs)
-        # We expect mark_as_read=False
+        # The fetch itself never marks as read
         _, kwargs = mock_get_emails.call_args
-        self.assertFalse(kwargs.get('mark_as_read'), "In TEST mode, mark_as_read should be False")
+        self.assertFalse(kwargs.get('mark_as_read'), "The fetch should not mark emails as read")
+        mock_mark_seen.assert_not_called()
 
         # Case B: Production Mode
         with self.client.session_transaction() as sess:
@@ -82,9 +95,11 @@ class TestModeBehaviors(unittest.TestCase):
             
         self.client.post('/fetch/confirm')
         
-        # Verify call args
+        # Verify call args: fetched without flags, then the imported UIDs are marked in one call
         _, kwargs = mock_get_emails.call_args
-        self.assertTrue(kwargs.get('mark_as_read'), "In PROD mode, mark_as_read should be True")
+        self.assertFalse(kwargs.get('mark_as_read'), "The fetch should not mark emails as read")
+        args, kwargs = mock_mark_seen.call_args
+        self.assertEqual((args[3], args[4]), ([5], 1), "In PROD mode, imported emails should be marked as read")
 
     # --- 4. Database Management ---
     @patch('routes.settings.get_db_connection')
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import sqlite3
+import tempfile
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.parser import parse_email_body
+from src.parse_cache import parse_email_bodies_cached
+
+BODY = "Jak se jmenuješ?: Jana\nJaké je tvé příjmení?: Nováková\n\n{}"
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def test_cached_bodies_are_not_parsed_again(self):
+        """A second run returns the same results without calling the parser"""
+        bodies = [BODY.format(1), BODY.format(2), BODY.format(1)]
+        with patch('src.parser.parse_email_body', side_effect=parse_email_body) as parse:
+            first = parse_email_bodies_cached(self.conn, bodies)
+            self.assertEqual(parse.call_count, 2)  # the repeated body is parsed once
+            second = parse_email_bodies_cached(self.conn, bodies)
+            self.assertEqual(parse.call_count, 2)
+
+        expected = [parse_email_body(body) for body in bodies]
+        self.assertEqual(first, expected)
+        self.assertEqual(second, expected)
+
+    def test_parser_version_change_invalidates(self):
+        """Entries of an older parser version are ignored and evicted"""
+        parse_email_bodies_cached(self.conn, [BODY.format(1)])
+        with patch('src.parser.PARSER_VERSION', 'upgraded'), \
+             patch('src.parser.parse_email_body', side_effect=parse_email_body) as parse:
+            parse_email_bodies_cached(self.conn, [BODY.format(1)])
+            self.assertEqual(parse.call_count, 1)
+
+        versions = [row[0] for row in self.conn.execute('SELECT parser_version FROM parse_cache')]
+        self.assertEqual(versions, ['upgraded'])
+
+    def test_least_recently_used_entries_are_evicted(self):
+        """Beyond max_entries the entries used longest ago are dropped"""
+        with patch('src.parse_cache.time.time', side_effect=range(100)):
+            parse_email_bodies_cached(self.conn, [BODY.format(1)], max_entries=2)
+            parse_email_bodies_cached(self.conn, [BODY.format(2)], max_entries=2)
+            parse_email_bodies_cached(self.conn, [BODY.format(1)], max_entries=2)  # touch 1
+            parse_email_bodies_cached(self.conn, [BODY.format(3)], max_entries=2)
+
+        with patch('src.parser.parse_email_body', side_effect=parse_email_body) as parse:
+            parse_email_bodies_cached(self.conn, [BODY.format(1), BODY.format(3)], max_entries=2)
+            self.assertEqual(parse.call_count, 0)
+            parse_email_bodies_cached(self.conn, [BODY.format(2)], max_entries=2)
+            self.assertEqual(parse.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ import os
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.parser import parse_email_body, parse_csv_row
+from src.parser import (parse_email_body, parse_csv_row, compile_csv_header, form_fingerprint, detect_form_version,
+                        parse_email_bodies)
 
 class TestParser(unittest.TestCase):
     
@@ -46,6 +47,69 @@ Nesouhlas se zasíláním novinek: Nesouhlasím se zasíláním novinek formou n
         self.assertEqual(data['membership_id'], '1954')
         self.assertEqual(data['newsletter'], 0)
 
+    def test_parse_email_body_label_variants(self):
+        """Labels match case-insensitively, across CRLF and inside other answers"""
+        body = ("JAK SE JMENUJEŠ? :\tJana\r\n"
+                "Jaké je tvé příjmení?:Nováková\r\n"
+                "Kam ti můžeme poslat e-mail? (osobní): x: jana@example.com\r\n"
+                "Chceš nám něco říct?: Zelená nebo růžová?: Růžová\r\n"
+                "Nesouhlas se zasíláním novinek:\r\n"
+                "\r\n"
+                "42\r\n")
+        data = parse_email_body(body)
+        
+        self.assertEqual(data['first_name'], 'Jana')
+        self.assertEqual(data['last_name'], 'Nováková')
+        self.assertEqual(data['email'], 'jana@example.com')  # after the last colon
+        self.assertEqual(data['message'], 'Zelená nebo růžová?: Růžová')
+        self.assertEqual(data['color'], 'Růžová')
+        self.assertEqual(data['city'], '')
+        self.assertEqual(data['newsletter'], 1)
+        self.assertEqual(data['membership_id'], '42')
+        self.assertEqual(data['guessed_gender'], 'female')
+
+    def test_form_versions(self):
+        """Wording variants of one form version are parsed alike and may be mixed"""
+        head = "Jak se jmenuješ?: Jan\nJaké je tvé příjmení?: Novák\nKam ti můžeme poslat e-mail?: jan@example.com\n"
+        old = head + "Kdy ses narodil?: 01.01.2000\nOdkud?: Plakát\n"
+        new = head + "Kdy ses narodil/a?: 01.01.2000\nJinde?: Plakát\n"
+        mixed = head + "Kdy ses narodil/a?: 01.01.2000\nOdkud?: Plakát\n"
+        
+        for body in (old, new, mixed):
+            data = parse_email_body(body)
+            self.assertEqual(data['form_version'], '2024')
+            self.assertFalse(data['needs_review'])
+            self.assertEqual(data['dob'], '01.01.2000')
+            self.assertEqual(data['source_detail'], 'Plakát')
+        
+        self.assertEqual(detect_form_version(form_fingerprint("Jak se jmenuješ?: Jan\n")), '2024')
+
+    def test_unknown_form_layout_is_flagged(self):
+        """Unknown layouts and bodies without a required question are flagged instead of silently parsed"""
+        renamed = "Jak se jmenuješ?: Jan\nKdy jsi se narodil/a?: 01.01.2000\n"
+        for body in (renamed, "Dobrý den, posílám přihlášku."):
+            data = parse_email_body(body)
+            self.assertIsNone(data['form_version'])
+            self.assertTrue(data['needs_review'])
+        
+        # Known wordings are still extracted from an unknown layout
+        self.assertEqual(parse_email_body(renamed)['first_name'], 'Jan')
+        
+        incomplete = parse_email_body("Jak se jmenuješ?: Jan\nKdy ses narodil/a?: 01.01.2000\n")
+        self.assertEqual(incomplete['form_version'], '2024')
+        self.assertTrue(incomplete['needs_review'])
+        self.assertEqual(incomplete['missing_fields'], ['last_name', 'email'])
+
+    def test_parse_email_bodies_keeps_order(self):
+        """The process pool path yields the same results in input order"""
+        bodies = [f"Jak se jmenuješ?: Jana{i}\nJaké je tvé příjmení?: Nováková\n\n{1000 + i}" for i in range(25)]
+        
+        serial = list(parse_email_bodies(bodies))
+        pooled = list(parse_email_bodies(iter(bodies), workers=2, chunk_size=4))
+        
+        self.assertEqual(pooled, serial)
+        self.assertEqual([data['membership_id'] for data in pooled], [str(1000 + i) for i in range(25)])
+
     def test_parse_csv_row(self):
         row = {
             'jmeno': 'Jan',
@@ -86,5 +150,28 @@ Nesouhlas se zasíláním novinek: Nesouhlasím se zasíláním novinek formou n
         self.assertEqual(data['newsletter'], 1)
         self.assertEqual(data['full_body'], '')
 
+    def test_compiled_header_matches_parse_csv_row(self):
+        """The compiled extractor gives the same result as parse_csv_row"""
+        headers = ['jmeno', 'prijmeni', 'email', 'ID', 'cislo_karty', 'marketingový nesouhlas', 'souhlas', 'kde']
+        rows = [
+            [' Tereza ', 'Dvořáková', 'tereza@example.com ', '', '1234', '', 'Ano', 'Instagram'],
+            ['Petr', 'Svoboda', 'petr@example.com', '55', '66', 'Nesouhlasím', '', ''],
+            ['Eliška', 'Černá'],  # short row
+        ]
+        extract = compile_csv_header(headers)
+        for values in rows:
+            row = dict(zip(headers, values + [''] * (len(headers) - len(values))))
+            self.assertEqual(extract(values), parse_csv_row(row))
+
+    def test_compiled_header_extra_aliases(self):
+        """Configured aliases map extra header spellings to canonical fields"""
+        extract = compile_csv_header(['Jméno', 'email', 'cislo_prukazu'],
+                                     {'first_name': ['Jméno'], 'membership_id': ['cislo_prukazu']})
+        data = extract(['Jana', 'jana@example.com', '777'])
+        self.assertEqual(data['first_name'], 'Jana')
+        self.assertEqual(data['membership_id'], '777')
+        self.assertEqual(data['guessed_gender'], 'female')
+        self.assertEqual(data['city'], '')
+
 if __name__ == '__main__':
     unittest.main()
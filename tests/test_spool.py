@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import patch
+import sys
+import os
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+# Add root directory
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from src.database import init_db
+from src.fetcher import FetchedEmail, session_pool
+from src.spool import (spool_emails, load_spooled, release, purge_expired, create_preview, load_preview,
+                       drop_preview)
+from tests.imap_standin import FakeIMAP, make_message
+
+BODY = """
+Jak se jmenuješ?: Jana
+Jaké je tvé příjmení?: Nováková
+Kam ti můžeme poslat e-mail?: jana{0}@example.com
+
+{0}
+"""
+
+class TestSpool(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        self.conn = sqlite3.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.remove(self.db_path)
+
+    def test_round_trip_and_content_addressing(self):
+        emails = [FetchedEmail('7', 'same body', 'Mon', '<a@x>', 3),
+                  FetchedEmail('9', 'same body', 'Tue', '<b@x>', 3),
+                  ('msg', 'other body', 'Wed')]
+        self.assertEqual(spool_emails(self.conn, 'box', emails), ['7', '9', 'msg'])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM spool_blobs').fetchone()[0], 2)
+
+        loaded = load_spooled(self.conn, 'box', ['msg', '7'])
+        self.assertEqual(loaded, [FetchedEmail('msg', 'other body', 'Wed', None, None), emails[0]])
+        self.assertIsNone(load_spooled(self.conn, 'box', ['7', '8']))
+        self.assertIsNone(load_spooled(self.conn, 'other box', ['7']))
+
+        release(self.conn, 'box', ['7', 'msg'])
+        self.assertEqual(load_spooled(self.conn, 'box', ['9']), [emails[1]])
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM spool_blobs').fetchone()[0], 1)
+
+    def test_expired_entries_are_purged(self):
+        token = create_preview(self.conn, 'box', spool_emails(self.conn, 'box', [('1', 'body', None)]))
+        self.conn.execute('UPDATE message_spool SET spooled_at = ?', (datetime.now() - timedelta(days=2),))
+        self.conn.execute('UPDATE fetch_previews SET created_at = ?', (datetime.now() - timedelta(days=2),))
+        purge_expired(self.conn)
+        self.assertIsNone(load_spooled(self.conn, 'box', ['1']))
+        self.assertIsNone(load_preview(self.conn, token))
+        self.assertEqual(self.conn.execute('SELECT COUNT(*) FROM spool_blobs').fetchone()[0], 0)
+
+    def test_preview_tokens(self):
+        token = create_preview(self.conn, 'box', ['3', '5'])
+        self.assertEqual(load_preview(self.conn, token), {'box': ['3', '5']})
+        self.assertIsNone(load_preview(self.conn, 'unknown token'))
+        self.assertNotEqual(create_preview(self.conn, 'box', ['3']), token)
+        drop_preview(self.conn, token)
+        self.assertIsNone(load_preview(self.conn, token))
+
+class TestFetchConfirmFromSpool(unittest.TestCase):
+
+    def setUp(self):
+        from web_app import app
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        init_db(self.db_path)
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        self.env = patch.dict(os.environ, {'EMAIL_USER': 'user', 'EMAIL_PASS': 'pass', 'IMAP_SERVER': 'imap.test'})
+        self.env.start()
+        self.db = patch('routes.applicants.get_db_connection', side_effect=self.connect)
+        self.db.start()
+        with self.client.session_transaction() as sess:
+            sess['user'] = {'email': 'admin@example.com'}
+            sess['mode'] = 'production'
+
+    def tearDown(self):
+        session_pool.close_all()
+        self.db.stop()
+        self.env.stop()
+        os.remove(self.db_path)
+
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def test_confirm_stores_seen_without_downloading_again(self):
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1000 + i)) for i in range(3)])
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            self.assertEqual(self.client.post('/fetch/preview').get_json()['total'], 3)
+            with self.client.session_transaction() as sess:
+                token = sess['fetch_preview']
+            self.assertLess(len(token), 32)  # the cookie carries the token, not the emails
+            self.assertEqual(load_preview(self.connect(), token),
+                             {'user@imap.test/INBOX': ['1', '2', '3']})
+            preview_commands = len(imap.commands)
+
+            self.assertEqual(self.client.post('/fetch/confirm').get_json()['count'], 3)
+
+        confirm_commands = [(command, args) for command, args, _ in imap.commands[preview_commands:]]
+        self.assertEqual(confirm_commands, [('STORE', ('1:3', '+FLAGS.SILENT', '(\\Seen)'))])
+        self.assertTrue(all(message['seen'] for message in imap.mailbox.values()))
+        self.assertEqual(imap.connects, 1)  # confirm reused the logged-in session of the preview
+
+        conn = self.connect()
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM applicants').fetchone()[0], 3)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM message_spool').fetchone()[0], 0)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM fetch_previews').fetchone()[0], 0)
+        conn.close()
+
+    def test_confirm_imports_the_preview_without_configured_sources(self):
+        """The token finds the spooled preview even when no mailbox is configured any more"""
+        imap = FakeIMAP([make_message("Nová Přihláška", BODY.format(1000 + i)) for i in range(3)])
+        with patch('src.fetcher.imaplib.IMAP4_SSL', imap):
+            self.assertEqual(self.client.post('/fetch/preview').get_json()['total'], 3)
+            preview_commands = len(imap.commands)
+            with patch.dict(os.environ, {}, clear=True):
+                result = self.client.post('/fetch/confirm').get_json()
+
+        self.assertEqual(result['count'], 3)
+        self.assertEqual(result['errors'], ["Emaily se nepodařilo označit jako přečtené."])
+        self.assertEqual(len(imap.commands), preview_commands)  # nothing downloaded again
+
+if __name__ == '__main__':
+    unittest.main()
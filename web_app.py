@@ -6,6 +6,7 @@ Displays applicant data from the database
 
 from flask import Flask, render_template, request, session, redirect, url_for, send_from_directory
 import os
+import json
 from dotenv import load_dotenv
 import logging
 from src.extensions import oauth
@@ -42,6 +43,29 @@ def create_app():
         SESSION_COOKIE_SAMESITE='Lax',
     )
     
+    # Upload limits (CSV import); werkzeug rejects larger request bodies while streaming
+    max_import_size = int(os.environ.get('MAX_IMPORT_SIZE', 256 * 1024 * 1024))
+    app.config.update(
+        MAX_IMPORT_SIZE=max_import_size,
+        MAX_CONTENT_LENGTH=max_import_size + 1024 * 1024,  # multipart overhead
+        IMPORT_CHUNK_SIZE=int(os.environ.get('IMPORT_CHUNK_SIZE', 1000)),
+        IMPORT_WORKERS=int(os.environ.get('IMPORT_WORKERS', 1)),  # >1 parses large files in a process pool
+        # Extra CSV header spellings per field, e.g. {"membership_id": ["cislo_prukazu"]}
+        IMPORT_HEADER_ALIASES=json.loads(os.environ.get('IMPORT_HEADER_ALIASES') or '{}'),
+        # >1 parses large mailbox fetches (200+ emails) in a process pool
+        EMAIL_PARSE_WORKERS=int(os.environ.get('EMAIL_PARSE_WORKERS', 1)),
+        # >1 downloads large mailbox fetches over parallel IMAP connections (capped at 4)
+        EMAIL_FETCH_CONNECTIONS=int(os.environ.get('EMAIL_FETCH_CONNECTIONS', 1)),
+        # Seconds a fetch waits for each mailbox source (EMAIL_SOURCES) before reporting it as failed
+        EMAIL_SOURCE_TIMEOUT=int(os.environ.get('EMAIL_SOURCE_TIMEOUT', 120)),
+        # Logged-in IMAP sessions are reused between fetches for this many seconds (0 = new connection each time)
+        IMAP_SESSION_IDLE_TIMEOUT=int(os.environ.get('IMAP_SESSION_IDLE_TIMEOUT', 5 * 60)),
+        # IMAP IDLE listener: 'thread' runs it inside the web process (not on PythonAnywhere)
+        IMAP_IDLE=os.environ.get('IMAP_IDLE', 'off'),
+        IMAP_IDLE_MODE=os.environ.get('IMAP_IDLE_MODE', 'test'),
+        IMAP_IDLE_TIMEOUT=int(os.environ.get('IMAP_IDLE_TIMEOUT', 9 * 60)),
+    )
+    
     # Initialize Extensions
     oauth.init_app(app)
     # Register Google OAuth here or in auth blueprint? Authlib registers on the oauth object.
@@ -65,6 +89,16 @@ def create_app():
     app.register_blueprint(applicants_bp) # Register at root for index
     app.register_blueprint(settings_bp)
 
+    from src.fetcher import session_pool
+    session_pool.idle_timeout = app.config['IMAP_SESSION_IDLE_TIMEOUT']
+
+    # Background ingestion of new application emails (opt-in)
+    if app.config['IMAP_IDLE'] == 'thread' and os.environ.get('EMAIL_USER') and os.environ.get('EMAIL_PASS'):
+        from src.idle_listener import start_listener
+        start_listener(os.environ['EMAIL_USER'], os.environ['EMAIL_PASS'],
+                       os.environ.get('IMAP_SERVER', 'imap.gmail.com'),
+                       mode=app.config['IMAP_IDLE_MODE'], idle_timeout=app.config['IMAP_IDLE_TIMEOUT'])
+
     # Context Processors & Shared Filters
     @app.context_processor
     def inject_mode():